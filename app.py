@@ -8,22 +8,50 @@
 # - OCR (Tesseract ell+eng default)
 # - OCR preview before DOCX export
 # - OCR progress bar (per-page %)
-# - One DOCX per PDF (Simple mode) with page dividers: --- PAGE N ---
+# - One DOCX per PDF (Simple mode): one paragraph per text block, a real page break per PDF page
 # - Save DOCX in output folder with same base filename (overwrite if exists)
 # - Settings (tesseract path, input/output folders, ocr_lang) saved to %LOCALAPPDATA%/PDFEditorUltimate/config.json
+# - Thumbnail cache (content hash + page + dpi): in-memory LRU + disk tier in AppData, survives reruns
+# - OCR renders only the selected pages and streams them one image at a time
+# - Parallel OCR (configurable workers / threads per worker), per-page errors
+# - Persistent OCR cache (SQLite in AppData) keyed by content hash, page, dpi, lang, tesseract version
+# - Process all: pipelined rasterize -> OCR -> DOCX batch over every file, with progress and cancel
+# - Processing core in pdf_core.py (no Streamlit); headless batch CLI in cli.py
+# - Paginated thumbnail grid: only visible pages are rasterized/sent; long documents start collapsed
+# - Input folder is listed lazily (name/size/mtime); PDFs are read from disk only when opened or processed
+# - Parsed readers and extracted page text cached per document, shared by snippets and exports
+# - Hybrid export: text layer where usable, OCR only for scanned pages; engine recorded per page
+# - Search across all: persistent, incremental FTS5 index (embedded + cached OCR text), Greek accent/case folding
+# - Processing manifest (AppData): Process all skips files whose DOCX is current; cli.py --watch for scanner folders
+# - DOCX export streamed page by page straight to the output file (no in-memory document)
+# - Lossless page assembly engine (streamed to disk, shared fonts/images stored once); Merge all -> one PDF
+# - OCR preprocessing (grayscale, DPI normalization, border crop, deskew, adaptive binarization), timed per stage
+# - Adaptive OCR: per-page DPI from the thumbnails' text size; blank pages and separator sheets skipped, decisions in the DOCX
+# - Performance panel (sidebar): per-rerun time by stage, cache hit rates, memory; optional trace dumps to AppData
+# - bench.py: stage benchmarks (rasterize, OCR, extract, PDF/DOCX export) on synthetic corpora, JSON reports
+# - Background jobs (jobs.py, SQLite in AppData): exports and batches run in a worker thread, survive reruns; progress, cancel, retry, downloads
+# - Files are prepared concurrently at load (page count, visible thumbnails/snippets, text-layer check); each section shows when its file is ready
+# - Word-level OCR (one TSV tesseract call per page, boxes cached compactly); searchable PDF export (invisible text layer) from the same OCR pass as the DOCX
+# - Duplicates (dedup.py): page fingerprints + thumbnail dHash; identical pages OCR'd once per batch, duplicates reported and optionally dropped; same-named files kept apart
+# - Page selection and order stored as page ranges (pagesel.PageSet, set operations); quick selection and the order box take ranges
+# - Oversized pages (A0 drawings, long receipts) rendered and OCR'd in overlapping tiles within a pixel budget (tiles.py)
 
 import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter
-from pdf2image import convert_from_bytes
-from PIL import Image
-import io, re, base64, zipfile, hashlib, os, json, datetime, math, time
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-
-# OCR + docx
-import pytesseract
-from docx import Document
-from docx.shared import Pt
+import base64, os, datetime, math, time
+
+from pdf_core import (
+    CONFIG_PATH, OCR_DPI, OCR_TILE_MEGAPIXELS, TRACE_DIR, load_config, write_config, OcrSettings,
+    pdf_content_hash, get_page_thumbnails, ocr_selected_pages, ocr_pages_preview, sanitize_filename,
+    get_thumbnail_cache, submit_prepare, plan_ocr_pages, plan_summary, FolderPdf, list_folder_pdfs, read_pdf_bytes, get_document_cache,
+    unique_names, find_duplicates, doc_key,
+)
+from pagesel import PageSet, page_runs, expand_runs, parse_page_ranges, apply_page_ranges
+from search_index import get_search_index
+from perf import Tracer, tracer, use_tracer, format_summary
+from jobs import get_job_queue
+from preprocess import (
+    PREPROCESS_STAGES, DEFAULT_PREPROCESS, TARGET_DPI, NUMPY_AVAILABLE, parse_stages, stage_timings, format_timings,
+)
 
 # optional sortable UI
 try:
@@ -33,50 +61,21 @@ except Exception:
     SORTABLES_AVAILABLE = False
 
 # ---------------------------
-# AppData config
+# AppData config (paths and load/write live in pdf_core, shared with cli.py)
 # ---------------------------
-APP_NAME = "PDFEditorUltimate"
-LOCALAPPDATA = os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
-APPDATA_DIR = os.path.join(LOCALAPPDATA, APP_NAME)
-CONFIG_PATH = os.path.join(APPDATA_DIR, "config.json")
-
-DEFAULT_CONFIG = {
-    "input_folder": "",
-    "output_folder": "",
-    "tesseract_path": r"C:\Users\{user}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe".format(user=os.getenv("USERNAME") or ""),
-    "ocr_lang": "ell+eng"
-}
-
-os.makedirs(APPDATA_DIR, exist_ok=True)
-
-def load_config():
-    if os.path.exists(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                cfg = json.load(f)
-            # ensure keys
-            for k, v in DEFAULT_CONFIG.items():
-                if k not in cfg:
-                    cfg[k] = v
-            return cfg
-        except Exception:
-            return DEFAULT_CONFIG.copy()
-    else:
-        cfg = DEFAULT_CONFIG.copy()
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(cfg, f, indent=2, ensure_ascii=False)
-        return cfg
-
 def save_config(cfg):
     try:
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(cfg, f, indent=2, ensure_ascii=False)
+        write_config(cfg)
         return True
     except Exception as e:
         st.error(f"Αποτυχία αποθήκευσης ρυθμίσεων: {e}")
         return False
 
 config = load_config()
+# one trace per script run, kept per session (concurrent sessions would otherwise reset each other's);
+# pdf_core's spans and cache counters, and the threads it starts for this run, land in it
+use_tracer(st.session_state.setdefault("_perf_tracer", Tracer()))
+tracer.begin("rerun")
 
 # ---------------------------
 # Streamlit page config
@@ -135,6 +134,29 @@ st.sidebar.markdown("**Tesseract exe (leave blank if in PATH)**")
 tess_path_input = st.sidebar.text_input("Path to tesseract.exe", value=config.get("tesseract_path",""))
 st.sidebar.markdown("**OCR language (Tesseract)**")
 ocr_lang = st.sidebar.text_input("OCR languages, e.g. 'ell+eng'", value=config.get("ocr_lang","ell+eng"))
+st.sidebar.markdown("**OCR parallelism** — workers × threads ≈ CPU cores")
+ocr_workers = st.sidebar.number_input("OCR workers (0 = auto)", min_value=0, max_value=64, value=int(config.get("ocr_workers", 0) or 0))
+ocr_threads = st.sidebar.number_input("Threads per worker", min_value=1, max_value=16, value=int(config.get("ocr_threads_per_worker", 1) or 1))
+st.sidebar.markdown("**OCR preprocessing** — smaller, cleaner images for Tesseract")
+try:
+    preprocess_default = list(parse_stages(config.get("ocr_preprocess", DEFAULT_PREPROCESS)))
+except ValueError:
+    preprocess_default = list(parse_stages(DEFAULT_PREPROCESS))
+ocr_preprocess = st.sidebar.multiselect("Stages (empty = send the raw render)", PREPROCESS_STAGES, default=preprocess_default)
+ocr_target_dpi = st.sidebar.number_input("Downscale renders above (DPI)", min_value=150, max_value=600, step=50,
+                                         value=int(config.get("ocr_target_dpi", TARGET_DPI) or TARGET_DPI))
+ocr_tile_mp = st.sidebar.number_input("OCR larger pages in tiles of at most (megapixels; bounds memory on A0 drawings, long receipts)",
+                                      min_value=4, max_value=400, step=4,
+                                      value=int(config.get("ocr_tile_megapixels", OCR_TILE_MEGAPIXELS) or OCR_TILE_MEGAPIXELS))
+ocr_adaptive = st.sidebar.checkbox("Adaptive OCR (DPI per page from text size; skip blank and separator pages)",
+                                   value=bool(config.get("ocr_adaptive", False)))
+ocr_searchable = st.sidebar.checkbox("OCR exports also write a searchable PDF (<name>_ocr.pdf, invisible text over the original pages)",
+                                     value=bool(config.get("ocr_searchable", False)))
+if "deskew" in ocr_preprocess and not NUMPY_AVAILABLE:
+    st.sidebar.caption("NumPy not installed: deskew is skipped and binarize uses a global threshold.")
+st.sidebar.markdown("**Performance**")
+perf_panel = st.sidebar.checkbox("Show performance panel (time by stage, cache hits, memory)", key="perf_panel")
+perf_dump = st.sidebar.checkbox("Write a trace file per rerun (AppData traces, chrome://tracing format)", key="perf_dump")
 
 if st.sidebar.button("Save settings to AppData"):
     cfg_new = config.copy()
@@ -142,106 +164,157 @@ if st.sidebar.button("Save settings to AppData"):
     cfg_new["output_folder"] = output_folder.strip()
     cfg_new["tesseract_path"] = tess_path_input.strip()
     cfg_new["ocr_lang"] = ocr_lang.strip() or "ell+eng"
+    cfg_new["ocr_workers"] = int(ocr_workers)
+    cfg_new["ocr_threads_per_worker"] = int(ocr_threads)
+    cfg_new["ocr_preprocess"] = ",".join(ocr_preprocess) or "none"
+    cfg_new["ocr_target_dpi"] = int(ocr_target_dpi)
+    cfg_new["ocr_tile_megapixels"] = int(ocr_tile_mp)
+    cfg_new["ocr_adaptive"] = bool(ocr_adaptive)
+    cfg_new["ocr_searchable"] = bool(ocr_searchable)
     if save_config(cfg_new):
         config.update(cfg_new)
         st.sidebar.success("Ρυθμίσεις αποθηκεύτηκαν.")
 
-# apply tesseract path from config or sidebar
+# this session's OCR settings (tesseract path from config or sidebar): passed to every OCR call and
+# stored with every queued job, never set process-wide, so other sessions and running jobs keep theirs
 tesseract_path_effective = tess_path_input.strip() or config.get("tesseract_path") or ""
-if tesseract_path_effective:
-    try:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_path_effective
-    except Exception:
-        pass
+ocr_settings = OcrSettings(ocr_preprocess, ocr_target_dpi, ocr_tile_mp, tesseract_path_effective)
 
 # ---------------------------
-# Helpers
+# Helpers (UI only; the processing helpers are in pdf_core)
 # ---------------------------
-def sanitize_filename(name: str):
-    return re.sub(r'[^A-Za-z0-9_\-\.Α-Ωα-ωίόάέύήϊϋΰΪΫ ]', '_', name)
-
-def convert_pdf_to_images(pdf_bytes: bytes, dpi=200):
-    try:
-        images = convert_from_bytes(pdf_bytes, dpi=dpi)
-        return images
-    except Exception as e:
-        st.error(f"convert_from_bytes failed: {e}")
-        return []
-
-def ocr_image_to_text(img: Image.Image, lang="ell+eng"):
+GRID_PAGE_SIZES = [12, 24, 48, 96]
+GRID_COLLAPSE_PAGES = 24   # documents longer than this start with the page grid hidden
+REORDER_THUMBS_MAX = 40    # longer selections get text labels in the reorder strip
+REORDER_DRAG_MAX = 200     # longer selections are reordered with the order box (ranges) only
+
+def show_ocr_errors(ocr_results):
+    errors = [(page_idx, err) for page_idx, _, err in ocr_results if err]
+    if errors:
+        with st.expander(f"OCR failed on {len(errors)} page(s)", expanded=True):
+            for page_idx, err in errors:
+                st.error(f"Page {page_idx+1}: {err}")
+
+def show_stage_timings():
+    # OCR time per stage of the run that just finished, summed over workers (reset before each run)
+    timings = stage_timings.snapshot()
+    if timings:
+        st.caption(f"OCR time by stage: {format_timings(timings)}")
+
+JOBS_SHOWN = 20          # newest jobs listed in the Jobs panel
+JOBS_POLL_SECONDS = 2    # Jobs panel refresh while a job is queued or running
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "❌", "cancelled": "⏹️"}
+OUTPUT_MIME = {".pdf": "application/pdf",
+               ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+
+DUPLICATE_MODES = {"keep": "keep them", "same": "drop identical copies",
+                   "similar": "drop identical copies and look-alike pages"}
+
+def toggle_page(key_sel, cb_key, page_idx):
+    # checkbox callback: the PageSet in session state is the selection, the checkboxes only show it
+    page = PageSet([(page_idx, page_idx)])
+    sel = st.session_state[key_sel]
+    st.session_state[key_sel] = sel | page if st.session_state[cb_key] else sel - page
+
+def job_file(name, pdf_src, order):
+    # [name, path, pages] as a job stores it; uploads are copied to AppData so the job outlives the session
+    return [name, get_job_queue().stage_source(pdf_src), list(order)]
+
+def ocr_job_params(mode, files, out_folder, skip_current=False, duplicates=None):
+    return {"mode": mode, "files": files, "out_folder": out_folder, "dpi": OCR_DPI, "lang": ocr_lang,
+            "workers": int(ocr_workers), "threads": int(ocr_threads), "adaptive": bool(ocr_adaptive),
+            "searchable": bool(ocr_searchable), "ocr": ocr_settings.params(),
+            "skip_current": skip_current, "duplicates": duplicates}
+
+def queue_job(kind, title, params):
+    # a job records its own trace; with "trace" set it is written to TRACE_DIR like a rerun's
+    params = {**params, "trace": bool(perf_dump)}
     try:
-        return pytesseract.image_to_string(img, lang=lang)
+        job_id = get_job_queue().submit(kind, title, params)
+        st.success(f"Queued job #{job_id}: {title} — progress and downloads under Jobs below.")
     except Exception as e:
-        return ""
-
-def extract_embedded_text(pdf_bytes: bytes):
-    text = ""
-    try:
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        for p in reader.pages:
-            try:
-                t = p.extract_text() or ""
-            except Exception:
-                t = ""
-            text += "\n--- PAGE ---\n" + t + "\n"
-    except Exception:
-        return ""
-    return text
-
-def write_selected_pages_pdf(pdf_bytes: bytes, selected_indices, out_path):
-    try:
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        for i in selected_indices:
-            if i < len(reader.pages):
-                writer.add_page(reader.pages[i])
-        # write to disk overwriting if exists
-        with open(out_path, "wb") as f:
-            writer.write(f)
-        return True
-    except Exception as e:
-        st.error(f"Saving PDF failed: {e}")
-        return False
-
-def text_to_docx_simple(text: str, title: str = None):
-    """Simple docx export (one file per PDF) with page dividers --- PAGE N ---"""
-    doc = Document()
-    if title:
-        p = doc.add_paragraph()
-        r = p.add_run(title)
-        r.bold = True
-        r.font.size = Pt(14)
-        doc.add_paragraph()
-    # write text as-is preserving blank lines
-    for line in text.splitlines():
-        # keep as paragraph per line
-        p = doc.add_paragraph()
-        p.add_run(line)
-    buf = io.BytesIO()
-    doc.save(buf)
-    buf.seek(0)
-    return buf
-
-def search_in_text(text: str, terms):
-    results = {}
-    lower = text.lower()
-    for term in terms:
-        if not term: continue
-        t = term.lower()
-        count = lower.count(t)
-        contexts = []
-        if count > 0:
-            start = 0
-            for _ in range(min(count, 5)):
-                idx = lower.find(t, start)
-                if idx == -1:
-                    break
-                s = max(0, idx-30)
-                e = min(len(text), idx + len(t) + 30)
-                contexts.append(text[s:e].replace("\n"," "))
-                start = idx + len(t)
-        results[term] = {"count": count, "contexts": contexts}
-    return results
+        st.error(f"Could not queue {title}: {e}")
+
+def _read_output(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _jobs_panel(polling):
+    # button actions run as callbacks, before the panel re-reads the table
+    jobs = get_job_queue()
+    if polling is not None and polling != bool(jobs.active()):
+        st.rerun()  # a job finished or was retried: a full rerun starts/stops the polling
+    listed = jobs.recent(JOBS_SHOWN)
+    if not listed:
+        st.info("Δεν δημιουργήθηκαν αρχεία ακόμα.")
+        return
+    for job in listed:
+        status, job_id = job["status"], job["id"]
+        st.markdown(f"{JOB_STATUS_ICONS.get(status, '')} **#{job_id} {job['title']}** — {status}"
+                    + (f" (attempt {job['attempts']})" if job["attempts"] > 1 else ""))
+        if status == "running" and job["total"]:
+            st.progress(min(job["done"] / job["total"], 1.0), text=f"{job['done']}/{job['total']} pages"
+                        + (f" · {job['message']}" if job["message"] else ""))
+        elif job["message"]:
+            st.caption(job["message"])
+        result = job["result"] or {}
+        cols = st.columns([1, 1, 4])
+        if status in ("queued", "running"):
+            cols[0].button("Cancel", key=f"job_cancel_{job_id}", on_click=jobs.cancel, args=(job_id,))
+        if status in ("failed", "cancelled"):
+            cols[1].button("Retry", key=f"job_retry_{job_id}", on_click=jobs.retry, args=(job_id,))
+        for out_name, out_path in result.get("outputs", []):
+            if os.path.exists(out_path):
+                # data is read only when the button is clicked, not on every poll
+                cols[2].download_button(f"Download: {out_name}", data=lambda p=out_path: _read_output(p), file_name=out_name,
+                                        mime=OUTPUT_MIME.get(os.path.splitext(out_name)[1].lower()),
+                                        key=f"job_dl_{job_id}_{out_name}")
+        page_errs = result.get("errors", [])
+        if page_errs:
+            with st.expander(f"{len(page_errs)} error(s)"):
+                for fname, page_idx, err in page_errs:
+                    st.error(f"{fname}, page {page_idx+1}: {err}" if page_idx is not None else f"{fname}: {err}")
+        if result.get("traceback"):
+            with st.expander("Details"):
+                st.code(result["traceback"])
+        if perf_panel and result.get("perf"):
+            with st.expander("Performance"):
+                st.text("\n".join(result["perf"]))
+    if any(job["status"] not in ("queued", "running") for job in listed):
+        st.button("Clear finished jobs", key="jobs_clear", on_click=jobs.clear_finished)
+
+def show_jobs_panel():
+    # jobs run in the worker thread of jobs.py; the panel only reads their rows. While one is queued or
+    # running the panel re-runs itself as a fragment every few seconds, without rerunning the page.
+    polling = bool(get_job_queue().active())
+    if hasattr(st, "fragment"):
+        st.fragment(_jobs_panel, run_every=JOBS_POLL_SECONDS if polling else None)(polling)
+    else:
+        _jobs_panel(None)
+        if polling:
+            st.caption("Jobs are running — rerun the page to refresh their progress.")
+
+def show_perf_panel():
+    # called last: everything this rerun did (UI stages, export handlers, pdf_core spans and caches)
+    if not (perf_panel or perf_dump):
+        return
+    summary = tracer.summary()
+    history = st.session_state.setdefault("_perf_history", [])
+    history.append(summary["seconds"])
+    del history[:-10]
+    if perf_panel:
+        with st.sidebar.expander("Performance — this rerun", expanded=True):
+            st.text("\n".join(format_summary(summary)))
+            thumbs, docs = get_thumbnail_cache().stats(), get_document_cache().stats()
+            st.caption(f"Thumbnail memory tier: {thumbs['entries']} PNG(s), {thumbs['bytes'] / 2**20:.1f} MB · "
+                       f"text cache: {docs['documents']} document(s), {docs['chars']:,} chars · "
+                       f"{docs['readers']} open reader(s)")
+            st.caption("Recent reruns: " + ", ".join(f"{s:.2f}s" for s in history))
+    if perf_dump:
+        try:
+            st.sidebar.caption(f"Trace written to {tracer.dump(TRACE_DIR)}")
+        except OSError as e:
+            st.sidebar.warning(f"Trace not written: {e}")
 
 # ---------------------------
 # File collection
@@ -262,34 +335,24 @@ else:
     input_folder_effective = input_folder.strip() or config.get("input_folder","")
     if input_folder_effective:
         try:
-            pdf_list = [f for f in os.listdir(input_folder_effective) if f.lower().endswith(".pdf")]
+            # listing only (name, size, mtime); contents are read when a file is opened or processed
+            pdf_list = list_folder_pdfs(input_folder_effective)
             if pdf_list:
-                for name in pdf_list:
-                    path = os.path.join(input_folder_effective, name)
-                    with open(path, "rb") as fh:
-                        data = fh.read()
-                    # create simple object with .name and .read
-                    class SimpleFile:
-                        def __init__(self, name, data):
-                            self.name = name
-                            self._data = data
-                        def read(self):
-                            return self._data
-                        def seek(self, pos):
-                            pass
-                    files_to_process.append(SimpleFile(name, data))
+                files_to_process.extend(pdf_list)
             else:
                 st.info("Δεν βρέθηκαν PDF στον input folder.")
         except Exception as e:
             st.error(f"Σφάλμα ανάγνωσης input folder: {e}")
 
 if not files_to_process:
+    show_jobs_panel()
+    show_perf_panel()
     st.stop()
 
 # Global actions
 st.markdown("---")
 st.markdown("### Global actions")
-col1, col2, col3 = st.columns([1,1,1])
+col1, col2, col3, col4, col5 = st.columns([1,1,1,1,1])
 with col1:
     if st.button("Process all (OCR → DOCX)"):
         st.session_state["_process_all"] = True
@@ -299,325 +362,452 @@ with col2:
 with col3:
     if st.button("Search across all (terms)"):
         st.session_state["_search_all"] = True
+with col4:
+    if st.button("Merge all (selected pages → one PDF)"):
+        st.session_state["_merge_all"] = True
+with col5:
+    if st.button("Find duplicates (pages and files)"):
+        st.session_state["_find_duplicates"] = True
+
+process_all_hybrid = st.checkbox("Process all: hybrid (skip OCR on pages that already have a text layer)", key="process_all_hybrid")
+process_all_skip_current = st.checkbox("Process all: skip files whose DOCX is up to date (same pages and settings, unchanged since)",
+                                       value=True, key="process_all_skip_current")
+
+merge_name = st.text_input("Merged PDF file name", value="merged.pdf", key="merge_name")
+batch_duplicates = st.selectbox("Process all / Merge all: duplicate pages across the files", list(DUPLICATE_MODES),
+                                format_func=DUPLICATE_MODES.get, key="batch_duplicates")
+duplicates_compare_images = st.checkbox("Find duplicates: also compare page images (finds re-scans; renders every selected page's thumbnail)",
+                                        key="duplicates_compare_images")
 
 search_input = st.text_input("Αναζήτηση (λέξεις/φράσεις, κόμμα)", value="")
 search_terms = [s.strip() for s in search_input.split(",") if s.strip()]
 
-# processed outputs list for downloads
-processed_outputs = []
-
-# iterate files
-for file_obj in files_to_process:
-    name = getattr(file_obj, "name", "uploaded.pdf")
-    st.markdown("---")
-    st.subheader(name)
-
-    # read bytes
+# (name, pdf_src, page order as (first, last) runs) per file, consumed by the global actions
+batch_jobs = []
+
+# Load-time preparation (page count, thumbnails, snippets and text-layer check of the grid page about
+# to be shown) runs for all files at once in pdf_core's bounded pool; each section below waits only
+# for its own file, so the first file is usable while the rest are still being prepared.
+def grid_state(name):
+    # the widgets' state deciding which pages the grid shows (read here: worker threads cannot)
+    return (st.session_state.get(f"showgrid_{name}"), st.session_state.get(f"gridsize_{name}", GRID_PAGE_SIZES[0]),
+            st.session_state.get(f"gridpage_{name}", 1))
+
+def grid_view(state):
+    # the pages the grid will show for a grid_state()
+    shown, page_size, grid_page = state
+
+    def view(total_pages):
+        if not (shown if shown is not None else total_pages <= GRID_COLLAPSE_PAGES):
+            return range(0)
+        grid_page_ = min(grid_page, max(1, math.ceil(total_pages / page_size)))
+        return range((grid_page_-1) * page_size, min(total_pages, grid_page_ * page_size))
+    return view
+
+sources = []  # (file_obj, name, pdf_src or None, read error)
+# two uploads can share a name; the later ones become "name (2).pdf", ... for widget state and outputs
+for file_obj, name in zip(files_to_process, unique_names([getattr(f, "name", "uploaded.pdf") for f in files_to_process])):
+    # folder files stay on disk and are passed around as paths; uploads are already in memory
+    if isinstance(file_obj, FolderPdf):
+        sources.append((file_obj, name, file_obj.path, None))
+        continue
     try:
-        pdf_bytes = file_obj.read()
+        with tracer.span("read_upload", file=name):
+            sources.append((file_obj, name, file_obj.read(), None))
     except Exception:
         try:
-            pdf_bytes = file_obj.getbuffer().tobytes()
+            sources.append((file_obj, name, file_obj.getbuffer().tobytes(), None))
         except Exception as e:
-            st.error(f"Cannot read {name}: {e}")
-            continue
-
-    # build reader
+            sources.append((file_obj, name, None, e))
+# futures are kept by document (doc_key: content hash, or stat key for folder files) with the grid
+# state they prepared: a rerun while files are still being prepared (a click, a ticked box) waits on the
+# running ones instead of cancelling and resubmitting every file; a finished one is reused while the
+# grid would show the same pages
+previous_futures = st.session_state.get("_prepare_futures", {})
+prepare_futures = {}  # doc_key -> (grid state, future)
+prepared = []
+for _, name, pdf_src, _ in sources:
+    if pdf_src is None:
+        prepared.append(None)
+        continue
+    state = grid_state(name)
     try:
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
-    except Exception:
-        reader = None
-        total_pages = 0
+        key = doc_key(pdf_src)
+    except OSError:
+        key = None  # folder file gone: prepare reports it
+    prev_state, future = prepare_futures.get(key) or previous_futures.get(key) or (None, None)
+    if future is None or future.cancelled() or (future.done() and (
+            future.exception() is not None
+            or grid_view(prev_state)(future.result()["pages"]) != grid_view(state)(future.result()["pages"]))):
+        future = submit_prepare(pdf_src, grid_view(state), name)
+        prev_state = state
+    if key is not None:
+        prepare_futures[key] = (prev_state, future)
+    prepared.append(future)
+for key, (_, future) in previous_futures.items():
+    if key not in prepare_futures:
+        future.cancel()  # a file no longer listed, if not started yet
+st.session_state["_prepare_futures"] = prepare_futures
 
-    # thumbnails generation (low-res) - try/except
-    images = []
+# iterate files
+for (file_obj, name, pdf_src, read_error), future in zip(sources, prepared):
+    st.markdown("---")
+    st.subheader(name)
+    if isinstance(file_obj, FolderPdf):
+        st.caption(f"{file_obj.size / (1024*1024):.1f} MB · modified {datetime.datetime.fromtimestamp(file_obj.mtime):%Y-%m-%d %H:%M}")
+    if read_error is not None:
+        st.error(f"Cannot read {name}: {read_error}")
+        continue
+
+    # parsed reader and page text come from the document cache (shared with the export handlers);
+    # for paths only the xref and page tree are read here
+    docs = get_document_cache()
     try:
-        images = convert_pdf_to_images(pdf_bytes, dpi=100)
+        with tracer.span("wait_prepare", file=name):
+            prep = future.result()
+        total_pages = prep["pages"]
     except Exception:
-        images = [None] * total_pages
+        prep, total_pages = {"engines": {}}, 0
+
+    # thumbnails (low-res) come from the content-hash cache, only for pages actually shown;
+    # each is encoded to base64 once per rerun and shared by the grid and the reorder strip
+    thumbs_b64 = {}
+
+    def load_thumbs(indices):
+        wanted = [i for i in indices if i not in thumbs_b64]
+        if not wanted:
+            return
+        try:
+            with tracer.span("thumbnails", file=name, pages=len(wanted)):
+                thumbs = get_page_thumbnails(pdf_src, pdf_content_hash(pdf_src), wanted)
+            with tracer.span("encode_base64", file=name, pages=len(thumbs)):
+                thumbs_b64.update({i: base64.b64encode(png).decode() for i, png in thumbs.items()})
+        except Exception:
+            pass
 
-    # initialize selection state for this file
+    # selection state for this file: a PageSet (runs of pages), so its size does not grow with the page count
     key_sel = f"sel_{name}"
     if key_sel not in st.session_state:
-        st.session_state[key_sel] = [True] * total_pages if total_pages>0 else []
+        st.session_state[key_sel] = PageSet.all(total_pages)
 
     # quick selection input and buttons
     sel_col1, sel_col2, sel_col3 = st.columns([1,1,2])
     with sel_col1:
         if st.button(f"Select All [{name}]", key=f"selectall_{name}"):
-            st.session_state[key_sel] = [True]*total_pages
+            st.session_state[key_sel] = PageSet.all(total_pages)
     with sel_col2:
         if st.button(f"Deselect All [{name}]", key=f"deselectall_{name}"):
-            st.session_state[key_sel] = [False]*total_pages
+            st.session_state[key_sel] = PageSet()
     with sel_col3:
         quick_input = st.text_input(f"Quick selection (e.g. 2,5,8 or 3-6 or -3 to unselect) for {name}", key=f"quick_{name}")
 
         if st.button("Apply quick", key=f"applyquick_{name}"):
             txt = quick_input.strip()
-            def parse_parts(txt):
-                nums = []
-                for part in txt.split(","):
-                    p = part.strip()
-                    if not p: continue
-                    neg = False
-                    if p.startswith("-"):
-                        neg = True; p = p[1:]
-                    if "-" in p:
-                        a,b = p.split("-",1)
-                        a=int(a); b=int(b)
-                        for n in range(a,b+1):
-                            nums.append((n,neg))
-                    else:
-                        nums.append((int(p),neg))
-                return nums
             try:
-                changes = parse_parts(txt)
-                for n,neg in changes:
-                    if 1 <= n <= total_pages:
-                        st.session_state[key_sel][n-1] = (not neg)
+                st.session_state[key_sel] = apply_page_ranges(st.session_state[key_sel], parse_page_ranges(txt), total_pages)
                 st.success("Applied")
             except Exception:
                 st.error("Invalid input for quick selection")
 
-    # show thumbnails and checkboxes
+    # show thumbnails and checkboxes, one grid page at a time (only visible pages are rendered)
     st.markdown("**Thumbnails & selection**")
+    grid_shown = False
     if total_pages == 0:
         st.info("No pages detected or PDF corrupted.")
+    elif not st.checkbox(f"Show pages ({total_pages})", value=total_pages <= GRID_COLLAPSE_PAGES, key=f"showgrid_{name}"):
+        st.caption("Page grid hidden (large documents start collapsed). Select/Deselect All and Quick selection still apply.")
     else:
-        cols = st.columns(3)
-        for i in range(total_pages):
-            c = cols[i%3]
-            with c:
-                if i < len(images) and images[i] is not None:
-                    buf = io.BytesIO()
-                    try:
-                        images[i].save(buf, format="PNG")
-                        img_b64 = base64.b64encode(buf.getvalue()).decode()
-                        st.markdown(f'<img src="data:image/png;base64,{img_b64}" width="220"/>', unsafe_allow_html=True)
-                    except Exception:
+        grid_shown = True
+        g1, g2 = st.columns([1,1])
+        with g1:
+            page_size = st.selectbox("Thumbnails per page", GRID_PAGE_SIZES, key=f"gridsize_{name}")
+        n_grid_pages = math.ceil(total_pages / page_size)
+        grid_key = f"gridpage_{name}"
+        if st.session_state.get(grid_key, 1) > n_grid_pages:
+            st.session_state[grid_key] = n_grid_pages  # page size grew; keep the page number in range
+        with g2:
+            grid_page = st.number_input(f"Grid page (of {n_grid_pages})", min_value=1, max_value=n_grid_pages, step=1, key=grid_key)
+        view = range((grid_page-1) * page_size, min(total_pages, grid_page * page_size))
+        load_thumbs(view)
+        try:
+            with tracer.span("snippets", file=name, pages=len(view)):
+                snippets = dict(docs.page_texts(pdf_src, view))
+        except Exception:
+            snippets = {}
+        with tracer.span("grid_widgets", file=name, pages=len(view)):
+            cols = st.columns(3)
+            for n, i in enumerate(view):
+                c = cols[n%3]
+                with c:
+                    if i in thumbs_b64:
+                        st.markdown(f'<img src="data:image/png;base64,{thumbs_b64[i]}" width="220"/>', unsafe_allow_html=True)
+                    else:
                         st.text(f"Page {i+1}")
-                else:
-                    st.text(f"Page {i+1}")
-                # extract small snippet if possible
-                snippet = ""
-                try:
-                    snippet = reader.pages[i].extract_text() or ""
-                except Exception:
-                    snippet = ""
-                snippet = snippet.replace("\n", " ")
-                snippet = (snippet[:180] + "...") if len(snippet) > 180 else snippet
-                st.markdown(f"<div class='small'>{snippet}</div>", unsafe_allow_html=True)
-                sel = st.checkbox(f"Page {i+1}", value=st.session_state[key_sel][i], key=f"{name}_cb_{i}")
-                st.session_state[key_sel][i] = sel
-            if i%3 == 2:
-                cols = st.columns(3)
-
-    # show selected pages summary
-    selected_indices = [i for i,k in enumerate(st.session_state[key_sel]) if k]
-    st.markdown(f"**Selected pages:** {', '.join(str(i+1) for i in selected_indices) if selected_indices else '— none —'}")
-
-    # reorder (if sortable available) - fallback to text input
+                    # small snippet from the cached text layer
+                    snippet = snippets.get(i, "").replace("\n", " ")
+                    snippet = (snippet[:180] + "...") if len(snippet) > 180 else snippet
+                    if i in prep["engines"]:
+                        snippet = f"[{'text layer' if prep['engines'][i] == 'text' else 'scan, needs OCR'}] {snippet}"
+                    st.markdown(f"<div class='small'>{snippet}</div>", unsafe_allow_html=True)
+                    cb_key = f"{name}_cb_{i}"
+                    st.session_state[cb_key] = i in st.session_state[key_sel]
+                    st.checkbox(f"Page {i+1}", key=cb_key, on_change=toggle_page, args=(key_sel, cb_key, i))
+                if n%3 == 2:
+                    cols = st.columns(3)
+
+    # show selected pages summary (as ranges)
+    selected = st.session_state[key_sel]
+    st.markdown(f"**Selected pages:** {selected.spec().replace(',', ', ') + f' ({len(selected)} of {total_pages})' if selected else '— none —'}")
+
+    # reorder (if sortable available) - fallback to text input; the order is kept as (first, last) runs
     reorder_key = f"order_{name}"
-    if not selected_indices:
+    st.session_state[reorder_key] = selected.runs
+    if not selected:
         st.info("Select pages to enable reorder.")
-        st.session_state[reorder_key] = []
     else:
         st.markdown("#### Reorder selected pages")
-        # prepare miniature images/labels
-        items = []
-        for idx in selected_indices:
-            if idx < len(images) and images[idx] is not None:
-                b = io.BytesIO(); images[idx].save(b, format="PNG")
-                items.append(f'<div style="text-align:center"><img src="data:image/png;base64,{base64.b64encode(b.getvalue()).decode()}" width="120"><div>Pg {idx+1}</div></div>')
-            else:
-                items.append(f"Pg {idx+1}")
-        if SORTABLES_AVAILABLE:
-            try:
-                res = sort_items(items, direction="horizontal", key=f"sort_{name}")
-                order = [selected_indices[i] for i in res.get("order", list(range(len(items))))]
-                st.session_state[reorder_key] = order
-            except Exception:
-                st.warning("Drag & drop failed; use text input below.")
-                st.session_state[reorder_key] = selected_indices
+        if len(selected) > REORDER_DRAG_MAX:
+            st.caption(f"{len(selected)} pages selected: drag & drop is offered up to {REORDER_DRAG_MAX}; use the order box below.")
         else:
-            st.info("Drag & drop not installed; use text input for order.")
-            st.session_state[reorder_key] = selected_indices
+            selected_indices = list(selected)
+            # prepare miniature images/labels (labels only for collapsed grids or long selections)
+            if grid_shown and len(selected_indices) <= REORDER_THUMBS_MAX:
+                load_thumbs(selected_indices)
+            items = []
+            for idx in selected_indices:
+                if idx in thumbs_b64:
+                    items.append(f'<div style="text-align:center"><img src="data:image/png;base64,{thumbs_b64[idx]}" width="120"><div>Pg {idx+1}</div></div>')
+                else:
+                    items.append(f"Pg {idx+1}")
+            if SORTABLES_AVAILABLE:
+                try:
+                    res = sort_items(items, direction="horizontal", key=f"sort_{name}")
+                    order = [selected_indices[i] for i in res.get("order", list(range(len(items))))]
+                    st.session_state[reorder_key] = tuple(page_runs(order))
+                except Exception:
+                    st.warning("Drag & drop failed; use text input below.")
+            else:
+                st.info("Drag & drop not installed; use text input for order.")
 
-        order_txt = st.text_input(f"Alternative order (e.g. {','.join(str(i+1) for i in selected_indices)})", key=f"ordertxt_{name}")
+        order_txt = st.text_input(f"Alternative order, ranges allowed (e.g. {selected.spec()})", key=f"ordertxt_{name}")
         if order_txt:
             try:
-                new = [int(x.strip())-1 for x in order_txt.split(",") if x.strip().isdigit()]
-                if set(new) == set(selected_indices):
-                    st.session_state[reorder_key] = new
+                runs = [(first-1, last-1) for first, last, neg in parse_page_ranges(order_txt) if not neg and first <= last]
+                if PageSet(runs) == selected and sum(b - a + 1 for a, b in runs) == len(selected):
+                    st.session_state[reorder_key] = tuple(runs)
                 else:
-                    st.warning("New order must include exactly the same selected pages.")
+                    st.warning("New order must include exactly the same selected pages, each once.")
             except Exception:
                 st.error("Invalid format for order.")
 
+    batch_jobs.append((name, pdf_src, st.session_state[reorder_key]))
+
     # Export area for this file
     st.markdown("### Export / OCR / Save")
-    e1, e2, e3, e4 = st.columns([1,1,1,1])
+    e1, e2, e3, e4, e5 = st.columns([1,1,1,1,1])
     with e1:
         if st.button(f"Save PDF with selected pages — {name}", key=f"savepdf_{name}"):
-            if not selected_indices:
-                st.error("No pages selected")
-            else:
-                order = st.session_state.get(reorder_key, selected_indices)
-                # prepare writer with order
-                reader_local = PdfReader(io.BytesIO(pdf_bytes))
-                writer = PdfWriter()
-                for idx in order:
-                    writer.add_page(reader_local.pages[idx])
-                # write to output folder with same filename (overwrite)
-                out_folder = output_folder.strip() or config.get("output_folder","") or ""
-                if not out_folder:
-                    st.error("Output folder not set in sidebar or saved config.")
+            with tracer.span("export.save_pdf", file=name):
+                if not selected:
+                    st.error("No pages selected")
                 else:
-                    os.makedirs(out_folder, exist_ok=True)
-                    out_path = os.path.join(out_folder, name)
-                    try:
-                        with open(out_path, "wb") as f:
-                            writer.write(f)
-                        st.success(f"Saved PDF to {out_path}")
-                    except Exception as e:
-                        st.error(f"Save failed: {e}")
+                    order = expand_runs(st.session_state[reorder_key])
+                    # write to output folder with same filename (overwrite)
+                    out_folder = output_folder.strip() or config.get("output_folder","") or ""
+                    if not out_folder:
+                        st.error("Output folder not set in sidebar or saved config.")
+                    else:
+                        os.makedirs(out_folder, exist_ok=True)
+                        out_path = os.path.join(out_folder, name)
+                        queue_job("pdf", f"Save PDF — {name}", {"files": [job_file(name, pdf_src, order)], "out_path": out_path})
 
     with e2:
         if st.button(f"OCR Preview (selected pages) — {name}", key=f"ocr_preview_{name}"):
-            if not selected_indices:
-                st.error("No pages selected for OCR preview")
-            else:
-                # convert only selected pages to images (to save time)
-                with st.spinner("Converting selected pages to images..."):
-                    try:
-                        imgs = convert_pdf_to_images(pdf_bytes, dpi=300)
-                    except Exception as e:
-                        st.error(f"Image conversion failed: {e}")
-                        imgs = []
-                if not imgs:
-                    st.error("Cannot obtain page images for OCR.")
+            with tracer.span("export.ocr_preview", file=name):
+                if not selected:
+                    st.error("No pages selected for OCR preview")
                 else:
-                    # build preview text only for selected pages and show first 1000 chars
-                    preview_text = ""
-                    for i_idx, page_idx in enumerate(selected_indices):
-                        if page_idx < len(imgs):
-                            txt = ocr_image_to_text(imgs[page_idx], lang=ocr_lang)
-                        else:
-                            txt = ""
-                        preview_text += f"\n--- PAGE {page_idx+1} ---\n{txt}\n"
-                    st.markdown("**OCR Preview (first 1000 chars):**")
-                    st.code((preview_text[:1000] + ("..." if len(preview_text) > 1000 else "")))
-                    # store preview in session in case user wants to export docx immediately
-                    st.session_state[f"preview_text_{name}"] = preview_text
+                    # render and OCR only the selected pages; rendering streams into the OCR pool
+                    selected_indices = list(selected)
+                    page_texts = {}
+                    stage_timings.reset()
+                    plan = None
+                    with st.spinner("Converting selected pages to images and running OCR..."):
+                        try:
+                            doc_hash = pdf_content_hash(pdf_src)
+                            plan = plan_ocr_pages(pdf_src, doc_hash, selected_indices, OCR_DPI) if ocr_adaptive else None
+                            ocr_results = ocr_selected_pages(pdf_src, doc_hash, selected_indices, dpi=OCR_DPI, lang=ocr_lang,
+                                                             workers=ocr_workers, threads_per_worker=ocr_threads, plan=plan,
+                                                             settings=ocr_settings)
+                            page_texts = {page_idx: txt for page_idx, txt, _ in ocr_results}
+                            show_ocr_errors(ocr_results)
+                            show_stage_timings()
+                            if plan:
+                                st.caption(f"Adaptive OCR: {plan_summary(plan)}")
+                        except Exception as e:
+                            st.error(f"Image conversion failed: {e}")
+                    if not page_texts:
+                        st.error("Cannot obtain page images for OCR.")
+                    else:
+                        # preview of the selected pages: only the first 1000 chars are built, not the whole text
+                        engines = {page_idx: kind for page_idx, (kind, _) in plan.items()} if plan else None
+                        st.markdown("**OCR Preview (first 1000 chars):**")
+                        st.code(ocr_pages_preview(((page_idx, page_texts.get(page_idx, "")) for page_idx in selected_indices),
+                                                  engines=engines))
 
     with e3:
         if st.button(f"OCR -> DOCX (selected pages) — {name}", key=f"ocr_docx_{name}"):
-            # perform OCR on selected pages, with progress bar, create one docx per PDF
-            if not selected_indices:
-                st.error("No pages selected")
-            else:
-                # set tesseract path from settings if provided
-                if tesseract_path_effective:
-                    try:
-                        pytesseract.pytesseract.tesseract_cmd = tesseract_path_effective
-                    except Exception:
-                        pass
-                # convert all pages or only selected pages to images
-                with st.spinner("Converting PDF pages to images..."):
-                    try:
-                        imgs = convert_pdf_to_images(pdf_bytes, dpi=300)
-                    except Exception as e:
-                        st.error(f"Image conversion failed: {e}")
-                        imgs = []
-                if not imgs:
-                    st.error("No images for OCR.")
+            with tracer.span("export.ocr_docx", file=name):
+                # one DOCX per PDF, OCR'd in the background (only the selected pages are rendered)
+                if not selected:
+                    st.error("No pages selected")
                 else:
-                    total = len(selected_indices)
-                    progress_bar = st.progress(0)
-                    full_text = ""
-                    for idx_i, page_idx in enumerate(selected_indices):
-                        # avoid index error
-                        if page_idx < len(imgs):
-                            try:
-                                txt = ocr_image_to_text(imgs[page_idx], lang=ocr_lang)
-                            except Exception:
-                                txt = ""
-                        else:
-                            txt = ""
-                        full_text += f"\n--- PAGE {page_idx+1} ---\n{txt}\n"
-                        progress = int(((idx_i+1)/total) * 100)
-                        progress_bar.progress(progress)
-                    progress_bar.empty()
-                    # show preview
-                    st.markdown("**OCR Result preview (first 1000 chars):**")
-                    st.code((full_text[:1000] + ("..." if len(full_text) > 1000 else "")))
-                    # save docx (simple mode)
                     out_folder = output_folder.strip() or config.get("output_folder","") or ""
                     if not out_folder:
                         st.error("Output folder not set in sidebar or saved config.")
                     else:
                         os.makedirs(out_folder, exist_ok=True)
-                        base = os.path.splitext(name)[0]
-                        out_name = f"{base}.docx"   # no timestamp, overwrite allowed
-                        out_path = os.path.join(out_folder, out_name)
-                        try:
-                            buf = text_to_docx_simple(full_text, title=name)
-                            with open(out_path, "wb") as f:
-                                f.write(buf.getvalue())
-                            st.success(f"Saved DOCX to {out_path}")
-                            processed_outputs.append((out_name, io.BytesIO(buf.getvalue())))
-                        except Exception as e:
-                            st.error(f"Save DOCX failed: {e}")
+                        queue_job("ocr_docx", f"OCR → DOCX — {name}",
+                                  ocr_job_params("ocr", [job_file(name, pdf_src, selected)], out_folder))
 
     with e4:
         if st.button(f"Extract embedded text -> DOCX (selected pages) — {name}", key=f"emb_docx_{name}"):
-            # try to extract embedded text from pages and save docx
-            if not selected_indices:
-                st.error("No pages selected")
-            else:
-                # build text only for selected pages
-                full_text = ""
-                try:
-                    reader_local = PdfReader(io.BytesIO(pdf_bytes))
-                    for pidx in selected_indices:
-                        try:
-                            t = reader_local.pages[pidx].extract_text() or ""
-                        except Exception:
-                            t = ""
-                        full_text += f"\n--- PAGE {pidx+1} ---\n{t}\n"
-                    # save
+            with tracer.span("export.embedded_docx", file=name):
+                # try to extract embedded text from pages and save docx
+                if not selected:
+                    st.error("No pages selected")
+                else:
                     out_folder = output_folder.strip() or config.get("output_folder","") or ""
                     if not out_folder:
                         st.error("Output folder not set in sidebar or saved config.")
                     else:
                         os.makedirs(out_folder, exist_ok=True)
-                        base = os.path.splitext(name)[0]
-                        out_name = f"{base}.docx"
-                        out_path = os.path.join(out_folder, out_name)
-                        buf = text_to_docx_simple(full_text, title=name)
-                        with open(out_path, "wb") as f:
-                            f.write(buf.getvalue())
-                        st.success(f"Saved DOCX to {out_path}")
-                        processed_outputs.append((out_name, io.BytesIO(buf.getvalue())))
-                except Exception as e:
-                    st.error(f"Embedded extraction failed: {e}")
-
-    # Manual download original PDF
-    try:
-        st.download_button("Download original PDF", data=pdf_bytes, file_name=name, mime="application/pdf")
-    except Exception:
-        pass
+                        queue_job("embedded_docx", f"Embedded text → DOCX — {name}",
+                                  {"files": [job_file(name, pdf_src, selected)], "out_folder": out_folder})
+
+    with e5:
+        if st.button(f"Hybrid -> DOCX (text layer + OCR where needed) — {name}", key=f"hybrid_docx_{name}"):
+            with tracer.span("export.hybrid_docx", file=name):
+                # pages with a usable text layer are taken as-is; only the rest are rasterized and OCR'd
+                if not selected:
+                    st.error("No pages selected")
+                else:
+                    out_folder = output_folder.strip() or config.get("output_folder","") or ""
+                    if not out_folder:
+                        st.error("Output folder not set in sidebar or saved config.")
+                    else:
+                        os.makedirs(out_folder, exist_ok=True)
+                        queue_job("ocr_docx", f"Hybrid → DOCX — {name}",
+                                  ocr_job_params("hybrid", [job_file(name, pdf_src, selected)], out_folder))
+
+    # Manual download original PDF (read only when the button is clicked, not on every rerun)
+    st.download_button("Download original PDF", data=lambda src=pdf_src: read_pdf_bytes(src), file_name=name,
+                       mime="application/pdf", key=f"dl_original_{name}")
+
+# Search across all: bring the persistent index up to date (only new/changed files are read), then query it
+if st.session_state.pop("_search_all", False):
+    with tracer.span("search_all"):
+        st.markdown("---")
+        st.header("Search across all")
+        if not search_terms:
+            st.warning("Γράψε όρους αναζήτησης (χωρισμένους με κόμμα) και πάτα ξανά Search.")
+        else:
+            index = get_search_index()
+            index_bar = st.progress(0, text="Updating search index...")
+
+            def on_index_progress(done, total, fname):
+                index_bar.progress(int(done / max(total, 1) * 100), text=f"Indexing {done}/{total}: {fname}")
+
+            n_indexed, n_unchanged, index_errors = index.update([(job[0], job[1]) for job in batch_jobs], on_progress=on_index_progress)
+            index_bar.empty()
+            for fname, err in index_errors:
+                st.error(f"{fname}: not indexed — {err}")
+            t0 = time.perf_counter()
+            hits = index.search(search_terms)
+            n_files, n_pages = index.stats()
+            st.caption(f"{len(hits)} page hit(s) in {(time.perf_counter() - t0)*1000:.0f} ms · index: {n_files} file(s), "
+                       f"{n_pages} page(s) · updated {n_indexed}, unchanged {n_unchanged}")
+            if not hits:
+                st.info("No matches.")
+            for fname, key, page_idx, source, n_hits, contexts in hits:
+                where = "" if key.startswith("upload:") else f" <span class='small'>{os.path.dirname(key)}</span>"
+                st.markdown(f"**{fname}** — page {page_idx+1} ({'OCR' if source == 'ocr' else 'text layer'}, {n_hits} hit(s)){where}", unsafe_allow_html=True)
+                for ctx in contexts:
+                    st.text(f"… {ctx} …")
+
+# Find duplicates: fingerprints of every selected page (memoized), optionally thumbnail dHashes too;
+# the first occurrence in file order is the original
+if st.session_state.pop("_find_duplicates", False):
+    with tracer.span("find_duplicates"):
+        st.markdown("---")
+        st.header("Duplicates")
+        jobs = [(fname, src, expand_runs(runs)) for fname, src, runs in batch_jobs if runs]
+        dup_bar = st.progress(0, text="Fingerprinting pages...")
+
+        def on_dup_progress(done, total, fname):
+            dup_bar.progress(int(done / max(total, 1) * 100), text=f"Checked {done}/{total}: {fname}")
+
+        found = find_duplicates(jobs, similar=duplicates_compare_images, on_progress=on_dup_progress)
+        dup_bar.empty()
+        for fname, err in found["errors"]:
+            st.error(f"{fname}: not checked — {err}")
+        for fname, original in found["files"]:
+            st.markdown(f"**{fname}** is an identical copy of **{original}**")
+        by_file = {}
+        for fname, page_idx, original, orig_page, kind in found["pages"]:
+            by_file.setdefault(fname, []).append(
+                f"page {page_idx+1} = {original} page {orig_page+1}" + (" (looks the same)" if kind == "similar" else ""))
+        for fname, lines in by_file.items():
+            with st.expander(f"{fname}: {len(lines)} duplicate page(s)"):
+                st.text("\n".join(lines))
+        n_same = sum(1 for *_, kind in found["pages"] if kind == "same")
+        st.caption(f"{n_same} identical page(s), {len(found['pages']) - n_same} look-alike(s) across {len(jobs)} file(s). "
+                   "Identical pages are OCR'd once per batch; set \"duplicate pages\" above to drop them from Process all / Merge all.")
+
+# Process all (OCR → DOCX) over every file's current selection/order, as one background job
+if st.session_state.pop("_process_all", False):
+    with tracer.span("process_all"):
+        out_folder = output_folder.strip() or config.get("output_folder","") or ""
+        skipped = [job[0] for job in batch_jobs if not job[2]]
+        jobs = [(fname, src, expand_runs(runs)) for fname, src, runs in batch_jobs if runs]
+        if not out_folder:
+            st.error("Output folder not set in sidebar or saved config.")
+        elif not jobs:
+            st.error("No pages selected in any file.")
+        else:
+            os.makedirs(out_folder, exist_ok=True)
+            if skipped:
+                st.info(f"No pages selected, skipped: {', '.join(skipped)}")
+            # files whose DOCX is up to date (manifest) are skipped by the job itself, when it runs
+            batch_mode = "hybrid" if process_all_hybrid else "ocr"
+            queue_job("ocr_docx", f"Process all ({'hybrid' if process_all_hybrid else 'OCR'}) — {len(jobs)} file(s)",
+                      ocr_job_params(batch_mode, [job_file(*job) for job in jobs], out_folder,
+                                     skip_current=process_all_skip_current,
+                                     duplicates=batch_duplicates if batch_duplicates != "keep" else None))
+
+# Merge all: the selected pages of every file, in file order then each file's page order, into one PDF
+if st.session_state.pop("_merge_all", False):
+    with tracer.span("merge_all"):
+        out_folder = output_folder.strip() or config.get("output_folder","") or ""
+        merge_file = sanitize_filename(os.path.basename(merge_name.strip())) or "merged.pdf"
+        if not merge_file.lower().endswith(".pdf"):
+            merge_file += ".pdf"
+        jobs = [(fname, src, expand_runs(runs)) for fname, src, runs in batch_jobs if runs]
+        if not out_folder:
+            st.error("Output folder not set in sidebar or saved config.")
+        elif not jobs:
+            st.error("No pages selected in any file.")
+        else:
+            os.makedirs(out_folder, exist_ok=True)
+            queue_job("pdf", f"Merge all — {len(jobs)} file(s) → {merge_file}",
+                      {"files": [job_file(*job) for job in jobs], "out_path": os.path.join(out_folder, merge_file),
+                       "duplicates": batch_duplicates if batch_duplicates != "keep" else None})
 
-# Final downloads
-if processed_outputs:
-    st.markdown("---")
-    st.header("Downloads")
-    for fname, buf in processed_outputs:
-        buf.seek(0)
-        st.download_button(f"Download: {fname}", data=buf.getvalue(), file_name=fname, mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-else:
-    st.info("Δεν δημιουργήθηκαν .docx αρχεία ακόμα.")
+# Background jobs: status, progress, cancel/retry and downloads; polled while any job is queued or running
+st.markdown("---")
+st.header("Jobs")
+show_jobs_panel()
 
 st.markdown("---")
-st.markdown(f"© PDF Editor Ultimate • Local-only • Config stored in {CONFIG_PATH}")
\ No newline at end of file
+st.markdown(f"© PDF Editor Ultimate • Local-only • Config stored in {CONFIG_PATH}")
+show_perf_panel()
\ No newline at end of file
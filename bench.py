@@ -0,0 +1,328 @@
+# bench.py
+# Benchmark suite for the processing stages: rasterization, OCR, text-layer extraction, PDF page
+# export and DOCX export. Corpora are generated offline, so runs are comparable between versions and
+# machines: text PDFs drawn with reportlab, and image-only PDFs made by rasterizing those (what a
+# scanner would hand us). Each stage runs over every page count (and DPI / worker count where they
+# apply) and reports pages/sec, peak RSS and p50/p95 per-page latency as JSON.
+#
+# Examples:
+#   python bench.py                                            (defaults: 10 and 50 pages, all stages)
+#   python bench.py --pages 10,100,500 --stages extract,pdf,docx --out before.json
+#   python bench.py --pages 20 --dpi 200,300 --workers 1,2,4 --stages raster,ocr --out after.json --compare before.json
+#
+# Stages that need poppler (raster, ocr, and the image-only corpus) or tesseract (ocr) record an
+# "error" entry when those are missing; the other stages still run. The OCR cache, document cache and
+# thumbnail cache are bypassed, so every number is a cold run.
+
+import argparse, json, math, os, platform, random, sys, tempfile, threading, time
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+
+from pdf_core import (
+    OCR_DPI, load_config, set_tesseract_cmd, set_ocr_preprocess, iter_page_images, ocr_pages_parallel,
+    DocumentCache, write_selected_pages_pdf, save_docx, tesseract_version, resolve_ocr_workers,
+)
+from preprocess import DEFAULT_PREPROCESS, stage_timings, format_timings
+from perf import current_rss
+
+STAGES = ("extract", "pdf", "docx", "raster", "ocr")
+SCAN_DPI = 200            # resolution of the image-only corpus
+RSS_SAMPLE_SECONDS = 0.005
+CORPUS_SEED = 17
+_WORDS = ("the of and to in a is that for it as was with be by on not he this are or his from at which "
+          "but have an they you were her she there been one all we their has would when if so no will "
+          "invoice payment contract section article amount period notice party schedule annex total "
+          "report council decision minutes budget account balance signature date reference").split()
+
+# -- corpora -----------------------------------------------------------------------------------------
+
+def make_text_pdf(path, n_pages, seed=CORPUS_SEED):
+    """n_pages of Letter-size body text (10pt Helvetica, ~50 lines a page), deterministic for a seed."""
+    rnd = random.Random(seed)
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for page in range(n_pages):
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(72, height - 72, f"Benchmark document — page {page + 1}")
+        text = c.beginText(72, height - 100)
+        text.setFont("Helvetica", 10)
+        for _ in range(50):
+            text.textLine(" ".join(rnd.choice(_WORDS) for _ in range(14)))
+        c.drawText(text)
+        c.showPage()
+    c.save()
+    return path
+
+def make_image_pdf(text_pdf, path, n_pages, dpi=SCAN_DPI):
+    """Image-only copy of text_pdf: every page rasterized (grayscale, poppler) and placed full-page,
+    with no text layer left. One page image is held at a time."""
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for _, img in iter_page_images(text_pdf, range(n_pages), dpi=dpi):
+        c.drawImage(ImageReader(img.convert("L")), 0, 0, width, height)
+        c.showPage()
+    c.save()
+    return path
+
+# -- measurement -------------------------------------------------------------------------------------
+
+class PeakRss:
+    """Context manager sampling RSS on a background thread; .peak and .baseline in bytes (None if unknown).
+    Sampling rather than the OS high-water mark, which cannot be reset between stages."""
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.baseline = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="bench-rss", daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        if self.baseline is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return False
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+def measure(run, repeat):
+    """Run `run()` repeat times; it returns per-page latencies in seconds.
+    Returns the stats shared by every result entry."""
+    latencies = []
+    seconds = 0.0
+    with PeakRss() as rss:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            latencies += run()
+            seconds += time.perf_counter() - t0
+    mb = lambda b: round(b / 2**20, 1) if b is not None else None
+    return {
+        "seconds": round(seconds, 4),
+        "pages_per_sec": round(len(latencies) / seconds, 2) if seconds else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "peak_rss_mb": mb(rss.peak),
+        "rss_growth_mb": mb(rss.peak - rss.baseline) if rss.peak is not None and rss.baseline is not None else None,
+    }
+
+def gaps(iterable):
+    """Consume an iterable; the time each item took to arrive, in seconds."""
+    out = []
+    t = time.perf_counter()
+    for _ in iterable:
+        now = time.perf_counter()
+        out.append(now - t)
+        t = now
+    return out
+
+# -- stages ------------------------------------------------------------------------------------------
+# each returns a run() for measure(); a fresh DocumentCache keeps every repeat cold
+
+def stage_extract(text_pdf, n_pages, **_):
+    def run():
+        docs = DocumentCache()
+        return gaps(docs.page_texts(text_pdf, [i]) for i in range(n_pages))
+    return run
+
+def stage_pdf(text_pdf, n_pages, out_dir, **_):
+    # every page, last to first: the whole document is reassembled
+    out_path = os.path.join(out_dir, "bench_export.pdf")
+
+    def run():
+        t0 = time.perf_counter()
+        write_selected_pages_pdf(text_pdf, list(range(n_pages - 1, -1, -1)), out_path)
+        return [(time.perf_counter() - t0) / n_pages] * n_pages
+    return run
+
+def stage_docx(text_pdf, n_pages, out_dir, **_):
+    texts = DocumentCache().page_texts(text_pdf, range(n_pages))  # extraction is timed by its own stage
+    out_path = os.path.join(out_dir, "bench_export.docx")
+
+    def run():
+        stamps = []
+
+        def pages():
+            for item in texts:
+                stamps.append(time.perf_counter())
+                yield item
+        save_docx(pages(), out_path, title="bench")
+        stamps.append(time.perf_counter())
+        # a page's latency: from handing it to the writer until the writer asks for the next one
+        return [b - a for a, b in zip(stamps, stamps[1:])]
+    return run
+
+def stage_raster(text_pdf, n_pages, dpi, **_):
+    return lambda: gaps(iter_page_images(text_pdf, range(n_pages), dpi=dpi))
+
+def stage_ocr(image_pdf, n_pages, dpi, workers, lang, **_):
+    def run():
+        latencies = []
+        ocr_pages_parallel(iter_page_images(image_pdf, range(n_pages), dpi=dpi), lang=lang, workers=workers,
+                           on_result=lambda page_idx, text, seconds, words: latencies.append(seconds))
+        if len(latencies) < n_pages:
+            raise RuntimeError(f"OCR failed on {n_pages - len(latencies)} of {n_pages} page(s)")
+        return latencies
+    return run
+
+STAGE_RUNS = {"extract": stage_extract, "pdf": stage_pdf, "docx": stage_docx, "raster": stage_raster, "ocr": stage_ocr}
+
+# -- driver ------------------------------------------------------------------------------------------
+
+def int_list(spec):
+    try:
+        values = [int(v) for v in spec.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated integers, got {spec!r}")
+    if not values or min(values) < 1:
+        raise argparse.ArgumentTypeError(f"expected positive integers, got {spec!r}")
+    return values
+
+def stage_list(spec):
+    stages = [s.strip().lower() for s in spec.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown or not stages:
+        raise argparse.ArgumentTypeError(f"unknown stage(s) {', '.join(sorted(unknown)) or '(none)'}; choose from {','.join(STAGES)}")
+    return [s for s in STAGES if s in stages]
+
+def build_parser(cfg):
+    p = argparse.ArgumentParser(description="PDF Editor Ultimate — stage benchmarks on synthetic corpora, JSON report.")
+    p.add_argument("--pages", type=int_list, default=[10, 50], help="comma-separated page counts (default: 10,50)")
+    p.add_argument("--dpi", type=int_list, default=[OCR_DPI], help=f"rasterization/OCR DPIs (default: {OCR_DPI})")
+    p.add_argument("--workers", type=int_list, default=[resolve_ocr_workers(0)], help="OCR worker counts (default: auto)")
+    p.add_argument("--stages", type=stage_list, default=list(STAGES), help=f"comma-separated subset of {','.join(STAGES)} (default: all)")
+    p.add_argument("--repeat", type=int, default=1, help="runs per measurement; latencies are pooled (default: 1)")
+    p.add_argument("--lang", default="eng", help="Tesseract languages for the OCR stage (the corpus is English; default: eng)")
+    p.add_argument("--preprocess", default=cfg.get("ocr_preprocess", DEFAULT_PREPROCESS), help="OCR preprocessing stages, as in cli.py")
+    p.add_argument("--tesseract", default=cfg.get("tesseract_path", ""), help="path to the tesseract executable (blank: PATH)")
+    p.add_argument("--corpus-dir", default="", help="keep the generated corpora (and outputs) here instead of a temp folder")
+    p.add_argument("--out", default="", help="write the JSON report here (default: stdout)")
+    p.add_argument("--compare", default="", help="earlier JSON report: print pages/sec changes against it")
+    return p
+
+def result_key(entry):
+    return (entry["stage"], entry["pages"], entry.get("dpi"), entry.get("workers"))
+
+def compare_reports(old, new, out=sys.stderr):
+    """One line per measurement present in both reports: pages/sec before -> after."""
+    before = {result_key(e): e for e in old.get("results", []) if e.get("pages_per_sec")}
+    for e in new["results"]:
+        o = before.get(result_key(e))
+        if not o or not e.get("pages_per_sec"):
+            continue
+        ratio = e["pages_per_sec"] / o["pages_per_sec"]
+        stage, pages, dpi, workers = result_key(e)
+        where = f"{stage} {pages}p" + (f" {dpi}dpi" if dpi else "") + (f" x{workers}" if workers else "")
+        print(f"[compare] {where}: {o['pages_per_sec']} -> {e['pages_per_sec']} pages/s ({ratio - 1:+.0%})", file=out)
+
+def run_benchmarks(args, corpus_dir):
+    results = []
+
+    def record(params, make_run):
+        entry = dict(params)
+        try:
+            entry.update(measure(make_run(), args.repeat))
+        except Exception as e:
+            entry["error"] = str(e) or e.__class__.__name__
+        results.append(entry)
+        stats = entry.get("error") or f"{entry['pages_per_sec']} pages/s, p95 {entry['p95_ms']} ms, peak {entry['peak_rss_mb']} MB"
+        print(f"[bench] {' '.join(f'{k}={v}' for k, v in params.items())}: {stats}", file=sys.stderr)
+
+    for n_pages in args.pages:
+        text_pdf = make_text_pdf(os.path.join(corpus_dir, f"text_{n_pages}.pdf"), n_pages)
+        image_pdf, image_error = None, None
+        if "ocr" in args.stages:
+            try:
+                image_pdf = make_image_pdf(text_pdf, os.path.join(corpus_dir, f"image_{n_pages}.pdf"), n_pages)
+            except Exception as e:
+                image_error = f"image-only corpus: {e}"
+        ctx = {"text_pdf": text_pdf, "image_pdf": image_pdf, "n_pages": n_pages, "out_dir": corpus_dir, "lang": args.lang}
+        for stage in args.stages:
+            if stage in ("extract", "pdf", "docx"):
+                record({"stage": stage, "pages": n_pages}, lambda: STAGE_RUNS[stage](**ctx))
+                continue
+            for dpi in args.dpi:
+                if stage == "raster":
+                    record({"stage": stage, "pages": n_pages, "dpi": dpi}, lambda: STAGE_RUNS[stage](dpi=dpi, **ctx))
+                    continue
+                for workers in args.workers:
+                    def make_ocr_run():
+                        if image_error:
+                            raise RuntimeError(image_error)
+                        return STAGE_RUNS[stage](dpi=dpi, workers=workers, **ctx)
+                    stage_timings.reset()
+                    record({"stage": stage, "pages": n_pages, "dpi": dpi, "workers": workers}, make_ocr_run)
+                    timings = stage_timings.snapshot()
+                    if timings and "error" not in results[-1]:
+                        results[-1]["ocr_stages"] = {s: round(secs, 3) for s, (_, secs) in timings.items()}
+                        print(f"[bench]   time by stage: {format_timings(timings)}", file=sys.stderr)
+    return results
+
+def main(argv=None):
+    cfg = load_config()
+    parser = build_parser(cfg)
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    set_tesseract_cmd(args.tesseract)
+    try:
+        set_ocr_preprocess(args.preprocess)
+    except ValueError as e:
+        parser.error(f"--preprocess: {e}")
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"--compare: {e}")
+
+    started = time.time()
+    if args.corpus_dir:
+        os.makedirs(args.corpus_dir, exist_ok=True)
+        results = run_benchmarks(args, args.corpus_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="pdfeditor_bench_") as tmp:
+            results = run_benchmarks(args, tmp)
+    try:
+        tesseract = tesseract_version()
+    except Exception:
+        tesseract = None
+    report = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "tesseract": tesseract, "preprocess": args.preprocess, "lang": args.lang, "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"[bench] report written to {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    if baseline:
+        compare_reports(baseline, report)
+    return 1 if any("error" in e for e in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# cli.py
+# Headless front end for pdf_core — same operations as the Streamlit app, no Streamlit needed
+# (cron jobs, servers). Defaults for folders, language, workers and tesseract come from the
+# AppData config.json that the app's "Save settings" button writes.
+#
+# Examples:
+#   python cli.py --input D:\scans --output D:\out --mode ocr --workers 4
+#   python cli.py --input D:\scans --output D:\out --mode hybrid   (OCR only pages without a usable text layer)
+#   python cli.py --input scan.pdf --output D:\out --pages "1-3,7" --mode pdf --mode embedded
+#   python cli.py --input D:\scans --output D:\out --pages=-1 --mode ocr   (all pages except the first;
+#   use --pages=... when the spec starts with "-")
+#   python cli.py --input D:\scans --output D:\out --pages 1 --merge covers.pdf   (first page of every file -> one PDF)
+#   python cli.py --input D:\scans --output D:\out --mode hybrid --watch --interval 30
+#   python cli.py --input D:\scans --output D:\out --adaptive   (OCR DPI per page; blank and separator pages skipped)
+#   python cli.py --input D:\scans --output D:\out --searchable   (also <name>_ocr.pdf with an invisible text layer, same OCR pass)
+#   python cli.py --input D:\scans --output D:\out --merge all.pdf --duplicates same   (repeated pages left out)
+#   python cli.py --input D:\plans --output D:\out --tile-megapixels 20   (A0 drawings OCR'd in tiles of at most 20 MP)
+#   python cli.py --input D:\scans --output D:\out --profile --trace   (time by stage on stderr, trace file in AppData)
+#   (keep polling the folder a scanner feeds; only new or changed PDFs are processed)
+#
+# Every run consults the processing manifest (AppData manifest.sqlite): inputs whose outputs are
+# still current for the same pages and settings are skipped. --force reprocesses them anyway.
+
+import argparse, os, sys, time
+
+from pdf_core import (
+    OCR_DPI, OCR_TILE_MEGAPIXELS, TRACE_DIR, load_config, set_tesseract_cmd, set_ocr_preprocess, set_ocr_tile_budget,
+    get_document_cache, run_ocr_batch, plan_summary,
+    extract_embedded_pages, write_selected_pages_pdf, write_merged_pdf, docx_output_path, searchable_output_path, save_docx,
+    list_folder_pdfs, find_duplicates, drop_duplicate_pages,
+)
+from pagesel import PageSet, parse_page_ranges, apply_page_ranges
+from manifest import WATCH_RETRIES, get_manifest, mode_settings, StabilityTracker
+from perf import tracer, format_summary
+from preprocess import DEFAULT_PREPROCESS, TARGET_DPI, PREPROCESS_STAGES, stage_timings, format_timings
+
+MODES = ("ocr", "hybrid", "embedded", "pdf")
+DOCX_MODES = ("ocr", "hybrid", "embedded")  # all write <name>.docx
+
+def list_input_pdfs(path):
+    """[(name, path)] for a single PDF or every *.pdf directly inside a folder."""
+    if os.path.isfile(path):
+        return [(os.path.basename(path), path)]
+    return [(f.name, f.path) for f in list_folder_pdfs(path)]
+
+def select_pages(spec, total_pages):
+    """Page indices for a quick-selection spec (same syntax as the app).
+    Unlike the app there is no prior selection: a spec that names pages keeps only those,
+    a spec made only of "-N" parts removes pages from the full document."""
+    if not spec:
+        return list(range(total_pages))
+    changes = parse_page_ranges(spec)
+    keep_listed = any(not neg for *_, neg in changes)
+    return list(apply_page_ranges(PageSet() if keep_listed else PageSet.all(total_pages), changes, total_pages))
+
+def build_parser(cfg):
+    p = argparse.ArgumentParser(description="PDF Editor Ultimate — headless page selection, text extraction, OCR and DOCX export.")
+    p.add_argument("--input", "-i", default=cfg.get("input_folder", ""), help="input PDF or folder of PDFs (default: config input_folder)")
+    p.add_argument("--output", "-o", default=cfg.get("output_folder", ""), help="output folder (default: config output_folder)")
+    p.add_argument("--mode", "-m", action="append", choices=MODES,
+                   help="ocr: OCR -> DOCX; hybrid: text layer where usable, OCR for the rest -> DOCX; "
+                        "embedded: text layer -> DOCX; pdf: save selected pages. Repeatable (default: ocr)")
+    p.add_argument("--pages", "-p", default="", help='quick-selection syntax, e.g. "2,5,8", "3-6", "-3" (write --pages=-3 for a leading "-"; default: all pages)')
+    p.add_argument("--dpi", type=int, default=OCR_DPI, help=f"OCR rasterization DPI (default: {OCR_DPI})")
+    p.add_argument("--lang", default=cfg.get("ocr_lang", "ell+eng"), help="Tesseract languages (default: config ocr_lang)")
+    p.add_argument("--workers", type=int, default=int(cfg.get("ocr_workers", 0) or 0), help="OCR workers, 0 = auto")
+    p.add_argument("--threads", type=int, default=int(cfg.get("ocr_threads_per_worker", 1) or 1), help="OMP threads per OCR worker")
+    p.add_argument("--preprocess", default=cfg.get("ocr_preprocess", DEFAULT_PREPROCESS),
+                   help=f"stages before OCR, comma-separated from {','.join(PREPROCESS_STAGES)}, or none (default: config ocr_preprocess)")
+    p.add_argument("--target-dpi", type=int, default=int(cfg.get("ocr_target_dpi", TARGET_DPI) or TARGET_DPI),
+                   help="downscale renders above this DPI before OCR (with the normalize stage)")
+    p.add_argument("--tile-megapixels", type=float,
+                   default=float(cfg.get("ocr_tile_megapixels", OCR_TILE_MEGAPIXELS) or OCR_TILE_MEGAPIXELS),
+                   help="pages rendering larger than this at the OCR DPI are rendered and OCR'd in overlapping "
+                        "tiles of at most this size, bounding memory (default: config ocr_tile_megapixels)")
+    p.add_argument("--adaptive", action=argparse.BooleanOptionalAction, default=bool(cfg.get("ocr_adaptive", False)),
+                   help="pick the OCR DPI per page from a 100 DPI preview (--dpi for pages without one) and skip "
+                        "blank pages and separator sheets (default: config ocr_adaptive)")
+    p.add_argument("--searchable", action=argparse.BooleanOptionalAction, default=bool(cfg.get("ocr_searchable", False)),
+                   help="with --mode ocr/hybrid, also write <name>_ocr.pdf: the selected pages with an invisible "
+                        "OCR text layer, from the same OCR pass as the DOCX (default: config ocr_searchable)")
+    p.add_argument("--duplicates", choices=("keep", "same", "similar"), default="keep",
+                   help="with --mode ocr/hybrid and --merge: drop pages identical to an earlier page of the run "
+                        "(same), or also pages that only look the same, e.g. a sheet scanned twice (similar); "
+                        "dropped pages are listed. Identical pages are OCR'd once either way (default: keep)")
+    p.add_argument("--tesseract", default=cfg.get("tesseract_path", ""), help="path to the tesseract executable (blank: PATH)")
+    p.add_argument("--merge", metavar="NAME", default="",
+                   help="also write the selected pages of all inputs (in name order) into one PDF NAME in the output folder")
+    p.add_argument("--force", action="store_true", help="reprocess inputs even if the manifest says their outputs are current")
+    p.add_argument("--watch", action="store_true", help="keep polling the input folder and process new or changed PDFs "
+                   f"(a file that fails is retried up to {WATCH_RETRIES} times at the next polls)")
+    p.add_argument("--profile", action="store_true", help="print time by stage, cache hit rates and memory after each run")
+    p.add_argument("--trace", action="store_true", help=f"write a Chrome trace-event file per run to {TRACE_DIR}")
+    p.add_argument("--interval", type=float, default=10.0, help="seconds between polls in --watch mode (default: 10)")
+    return p
+
+def main(argv=None):
+    cfg = load_config()
+    parser = build_parser(cfg)
+    args = parser.parse_args(argv)
+    modes = args.mode or ([] if args.merge else ["ocr"])
+    if sum(1 for m in set(modes) if m in DOCX_MODES) > 1:
+        parser.error("--mode ocr, hybrid and embedded all write <name>.docx; pick one")
+    if not args.input or not os.path.exists(args.input):
+        parser.error(f"input not found: {args.input or '(not set)'}")
+    if not args.output:
+        parser.error("output folder not set (--output or config output_folder)")
+    in_folder = args.input if os.path.isdir(args.input) else os.path.dirname(os.path.abspath(args.input))
+    if "pdf" in modes and os.path.abspath(in_folder) == os.path.abspath(args.output):
+        parser.error("--mode pdf writes <name>.pdf into the output folder and would overwrite the input")
+    if args.merge and args.watch:
+        parser.error("--merge and --watch cannot be combined")
+    if args.merge and os.path.abspath(os.path.join(args.output, args.merge)) in {os.path.abspath(p) for _, p in list_input_pdfs(args.input)}:
+        parser.error(f"--merge {args.merge} would overwrite an input file")
+    os.makedirs(args.output, exist_ok=True)
+    set_tesseract_cmd(args.tesseract)
+    try:
+        set_ocr_preprocess(args.preprocess, args.target_dpi)
+    except ValueError as e:
+        parser.error(f"--preprocess: {e}")
+    try:
+        set_ocr_tile_budget(args.tile_megapixels)
+    except ValueError as e:
+        parser.error(f"--tile-megapixels: {e}")
+
+    if not args.watch:
+        tracer.begin("cli")
+        failures = process_inputs(list_input_pdfs(args.input), args, modes)
+        report_perf(args)
+        return 1 if failures else 0
+    if not os.path.isdir(args.input):
+        parser.error("--watch needs an input folder")
+    # polling rather than filesystem notifications: works the same on local disks, network shares
+    # and Windows; a scandir per interval costs next to nothing
+    tracker = StabilityTracker()
+    print(f"[watch] {args.input} every {args.interval:g}s (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        while True:
+            try:
+                ready = tracker.ready(list_folder_pdfs(args.input))
+                if ready:
+                    tracer.begin("watch")
+                    failed = process_inputs([(f.name, f.path) for f in ready], args, modes, quiet_skips=True)
+                    tracker.retry(failed)  # not in the manifest either: offered again at the next poll
+                    report_perf(args)
+            except OSError as e:
+                print(f"[error] {args.input}: {e}", file=sys.stderr)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+def report_perf(args):
+    """--profile / --trace output for the run the tracer has collected since its begin()."""
+    if args.profile:
+        for line in format_summary(tracer.summary()):
+            print(f"[perf] {line}", file=sys.stderr)
+    if args.trace:
+        try:
+            print(f"[perf] trace written to {tracer.dump(TRACE_DIR)}", file=sys.stderr)
+        except OSError as e:
+            print(f"[warn] trace not written: {e}", file=sys.stderr)
+
+def process_inputs(inputs, args, modes, quiet_skips=False):
+    """Run the requested modes over [(name, path)]; returns the paths that failed (inputs, or the
+    --merge output). Inputs whose outputs the manifest reports current are skipped unless --force."""
+    manifest = get_manifest()
+    failures = []
+    skipped = 0
+    ocr_jobs = []
+    merge_jobs = []
+    ocr_mode = "hybrid" if "hybrid" in modes else "ocr"
+
+    duplicates = args.duplicates if args.duplicates != "keep" else None
+
+    def settings_for(mode):
+        return mode_settings(mode, args.dpi, args.lang, args.adaptive, args.searchable, duplicates)
+
+    for name, path in inputs:
+        # files are passed around as paths: pypdf reads pages lazily, poppler reads the file itself
+        try:
+            total_pages = get_document_cache().page_count(path)
+            selected = select_pages(args.pages, total_pages)
+        except Exception as e:
+            print(f"[error] {name}: {e}", file=sys.stderr)
+            failures.append(path)
+            continue
+        if not selected:
+            print(f"[skip] {name}: no pages selected", file=sys.stderr)
+            continue
+        merge_jobs.append((name, path, selected))
+
+        def current(mode):
+            nonlocal skipped
+            if args.force or not manifest.is_current(name, path, mode, selected, settings_for(mode)):
+                return False
+            skipped += 1
+            if not quiet_skips:
+                print(f"[skip] {name}: {mode} output up to date", file=sys.stderr)
+            return True
+
+        def record(mode, out_path):
+            try:
+                manifest.record(name, path, mode, selected, settings_for(mode), [out_path])
+            except Exception as e:
+                print(f"[warn] {name}: manifest not updated: {e}", file=sys.stderr)
+
+        if "pdf" in modes and not current("pdf"):
+            out_path = os.path.join(args.output, name)
+            try:
+                with tracer.span("export.pdf", file=name):
+                    write_selected_pages_pdf(path, selected, out_path)
+                print(f"[pdf] {out_path}")
+                record("pdf", out_path)
+            except Exception as e:
+                print(f"[error] {name}: saving PDF failed: {e}", file=sys.stderr)
+                failures.append(path)
+        if "embedded" in modes and not current("embedded"):
+            out_path = docx_output_path(args.output, name)
+            try:
+                with tracer.span("export.embedded_docx", file=name):
+                    save_docx(extract_embedded_pages(path, selected), out_path, title=name)
+                print(f"[docx] {out_path}")
+                record("embedded", out_path)
+            except Exception as e:
+                print(f"[error] {name}: embedded extraction failed: {e}", file=sys.stderr)
+                failures.append(path)
+        if ("ocr" in modes or "hybrid" in modes) and not current(ocr_mode):
+            ocr_jobs.append((name, path, selected))
+
+    # pages the OCR run works on; manifest entries keep the selection as asked for, so skips still match
+    ocr_pages = {name: selected for name, _, selected in ocr_jobs}
+    if duplicates and merge_jobs:
+        with tracer.span("find_duplicates", files=len(merge_jobs)):
+            found = find_duplicates(merge_jobs, similar=duplicates == "similar")
+        for fname, err in found["errors"]:
+            print(f"[warn] {fname}: not checked for duplicates: {err}", file=sys.stderr)
+        for fname, page_idx, original, orig_page, kind in found["pages"]:
+            print(f"[dup] {fname} page {page_idx+1} = {original} page {orig_page+1}"
+                  + (" (looks the same)" if kind == "similar" else "") + ", dropped", file=sys.stderr)
+        merge_jobs = [job for job in drop_duplicate_pages(merge_jobs, found) if job[2]]
+        ocr_pages = {name: order for name, _, order in drop_duplicate_pages(ocr_jobs, found)}
+    if args.merge and merge_jobs:
+        out_path = os.path.join(args.output, args.merge)
+        try:
+            with tracer.span("merge"):
+                n_pages, _, n_shared = write_merged_pdf(merge_jobs, out_path)
+            print(f"[merge] {out_path}: {n_pages} page(s) from {len(merge_jobs)} file(s), {n_shared} shared resource(s) stored once")
+        except Exception as e:
+            print(f"[error] merge: {e}", file=sys.stderr)
+            failures.append(out_path)
+    if skipped and not quiet_skips:
+        print(f"[skip] {skipped} output(s) already up to date (--force to redo)", file=sys.stderr)
+    ocr_jobs = [job for job in ocr_jobs if ocr_pages[job[0]]]
+    if ocr_jobs:
+        t0 = time.perf_counter()
+        stage_timings.reset()
+        settings = settings_for(ocr_mode)
+
+        def on_plan(fname, plan):
+            print(f"[plan] {fname}: {plan_summary(plan)}", file=sys.stderr)
+
+        def on_progress(done, total, fname, file_done, file_total, finished):
+            if finished:
+                out_path, errs = finished
+                if out_path:
+                    print(f"[docx] {out_path}" + (f" ({len(errs)} error(s))" if errs else ""))
+                if out_path and args.searchable and not any(err.startswith("searchable PDF") for _, err in errs):
+                    print(f"[pdf] {searchable_output_path(args.output, fname)}")
+                for page_idx, err in errs:
+                    where = f"page {page_idx+1}" if page_idx is not None else "file"
+                    print(f"[error] {fname}: {where}: {err}", file=sys.stderr)
+                print(f"[ocr] {done}/{total} pages", file=sys.stderr)
+
+        with tracer.span("ocr_batch", files=len(ocr_jobs)):
+            results = run_ocr_batch([(name, path, ocr_pages[name]) for name, path, _ in ocr_jobs], args.output, dpi=args.dpi, lang=args.lang, workers=args.workers,
+                                    threads_per_worker=args.threads, on_progress=on_progress, hybrid=ocr_mode == "hybrid",
+                                    adaptive=args.adaptive, on_plan=on_plan, searchable=args.searchable)
+        for (name, path, selected), (_, out_path, errs) in zip(ocr_jobs, results):
+            if out_path and not errs:
+                # files with page errors are not recorded, so the next run retries them
+                outputs = [out_path] + ([searchable_output_path(args.output, name)] if args.searchable else [])
+                try:
+                    manifest.record(name, path, ocr_mode, selected, settings, outputs)
+                except Exception as e:
+                    print(f"[warn] {name}: manifest not updated: {e}", file=sys.stderr)
+        failures += [path for (_, path, _), (_, out_path, errs) in zip(ocr_jobs, results) if not out_path or errs]
+        pages = sum(len(ocr_pages[job[0]]) for job in ocr_jobs)
+        print(f"[ocr] {len(results)} file(s), {pages} page(s) in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        timings = stage_timings.snapshot()
+        if timings:
+            print(f"[ocr] time by stage: {format_timings(timings)}", file=sys.stderr)
+    return failures
+
+if __name__ == "__main__":
+    sys.exit(main())
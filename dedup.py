@@ -0,0 +1,115 @@
+# dedup.py
+# Duplicate detection for pages and files of a batch. Two signals:
+#   fingerprint  digest of what a page draws: its content stream(s), everything its resources reference
+#                (fonts, images, forms: hashed by their encoded bytes, no decoding), its boxes, rotation
+#                and annotations. Equal fingerprints mean the page renders identically, so the copies
+#                are OCR'd once and can be dropped from an output without losing anything.
+#   dhash        64-bit difference hash of the page thumbnail: catches the same sheet scanned twice,
+#                whose bytes never match. Close hashes only mean "looks the same" (a filled-in form
+#                and a blank one can be close), so these are reported, and dropped only on request.
+# Nothing here opens files; pdf_core feeds parsed pages and thumbnails in and keeps the results.
+
+import hashlib, io
+
+from PIL import Image
+from PyPDF2.generic import IndirectObject, StreamObject
+
+DHASH_SIZE = 8          # 8x8 gradient bits
+SIMILAR_MAX_BITS = 5    # dHashes at most this many bits apart count as look-alikes
+DHASH_MIN_CONTRAST = 12 # gray levels across the reduced page; below it the page is (nearly) blank
+FINGERPRINT_PAGE_KEYS = ("/Contents", "/Resources", "/MediaBox", "/CropBox", "/Rotate", "/UserUnit", "/Annots")
+
+def _feed(h, obj, memo):
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        digest = memo.get(key)
+        if digest is None:
+            memo[key] = b"cycle"  # a reference back into an object being hashed
+            try:
+                target = obj.get_object()
+                if hasattr(target, "get") and target.get("/Type") in ("/Page", "/Pages"):
+                    digest = b"page"  # link targets, annotation owners: not part of what is drawn
+                else:
+                    sub = hashlib.blake2b(digest_size=16)
+                    _feed(sub, target, memo)
+                    digest = sub.digest()
+            except Exception:
+                del memo[key]  # not a digest: other pages sharing the object must not reuse it
+                raise
+            memo[key] = digest
+        h.update(b"R" + digest)
+        return
+    if isinstance(obj, StreamObject):
+        h.update(b"S" + hashlib.blake2b(obj._data, digest_size=16).digest())  # encoded bytes, as stored
+    if isinstance(obj, dict):
+        h.update(b"<<")
+        for k in sorted(obj):
+            if k in ("/Length", "/Parent", "/P"):
+                continue
+            h.update(k.encode("utf-8", "surrogatepass") + b" ")
+            _feed(h, obj.raw_get(k) if hasattr(obj, "raw_get") else obj[k], memo)
+        h.update(b">>")
+    elif isinstance(obj, list):
+        h.update(b"[")
+        for v in obj:
+            _feed(h, v, memo)
+        h.update(b"]")
+    else:
+        h.update(type(obj).__name__.encode() + b":" + repr(obj).encode("utf-8", "surrogatepass") + b";")
+
+def page_fingerprint(page, memo):
+    """Hex digest of what a parsed page draws, or None for a page that cannot be hashed.
+    memo ({}) caches the digests of indirect objects: pass the same one for pages of one document,
+    so shared fonts and images are hashed once."""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        for key in FINGERPRINT_PAGE_KEYS:
+            if key in page:
+                h.update(key.encode() + b"=")
+                _feed(h, page.raw_get(key), memo)
+    except Exception:  # RecursionError on pathologically deep graphs, broken references
+        return None
+    return h.hexdigest()
+
+def dhash(png):
+    """Difference hash of a thumbnail (PNG bytes) as an int: one bit per horizontally adjacent pair
+    of cells in a (DHASH_SIZE+1) x DHASH_SIZE grayscale reduction, set where brightness drops.
+    None for a (nearly) blank page, whose bits would be noise: all blank pages would look alike."""
+    with Image.open(io.BytesIO(png)) as img:
+        small = img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR)
+        px = list(small.getdata())
+    if max(px) - min(px) < DHASH_MIN_CONTRAST:
+        return None
+    bits = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            left = px[row * (DHASH_SIZE + 1) + col]
+            bits = (bits << 1) | (left > px[row * (DHASH_SIZE + 1) + col + 1])
+    return bits
+
+class SimilarIndex:
+    """First-seen dHashes, searchable for one within SIMILAR_MAX_BITS. The 64 bits are cut into
+    max_bits + 1 bands: two hashes that close agree exactly on at least one band, so a lookup only
+    compares against hashes sharing a band instead of against every page seen."""
+
+    def __init__(self, max_bits=SIMILAR_MAX_BITS, bits=DHASH_SIZE * DHASH_SIZE):
+        self.max_bits = max_bits
+        n = max_bits + 1
+        edges = [bits * i // n for i in range(n + 1)]
+        self._bands = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._buckets = [{} for _ in self._bands]  # per band: band value -> [(seq, hash, item)]
+        self._seq = 0
+
+    def find(self, value):
+        """The earliest added item whose hash is within max_bits of value, or None."""
+        best = None
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for entry in buckets.get((value >> shift) & mask, ()):
+                if bin(value ^ entry[1]).count("1") <= self.max_bits and (best is None or entry[0] < best[0]):
+                    best = entry
+        return best[2] if best else None
+
+    def add(self, value, item):
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((value >> shift) & mask, []).append((self._seq, value, item))
+        self._seq += 1
@@ -0,0 +1,159 @@
+# docx_stream.py
+# Streaming DOCX writer for large exports. A .docx is a zip of a few XML parts; the static ones are
+# written up front and word/document.xml is streamed through zipfile as pages arrive, so a
+# thousand-page OCR job never exists as one string, one python-docx tree or one BytesIO.
+# One paragraph per text block (blank-line separated; line breaks inside a block are kept),
+# real page breaks between PDF pages. Written to a temp file and renamed into place when complete.
+
+import os, re, time, zipfile
+from xml.sax.saxutils import escape
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+    '</Types>')
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+    '</Relationships>')
+
+_DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>')
+
+# Normal style as in python-docx's default template (Calibri 11pt), so exports look the same as before
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:cs="Calibri" w:eastAsia="Calibri"/>'
+    '<w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="el-GR"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="160" w:line="259" w:lineRule="auto"/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '</w:styles>')
+
+_CORE = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<dc:title>{title}</dc:title>'
+    '<dcterms:created xsi:type="dcterms:W3CDTF">{created}</dcterms:created>'
+    '</cp:coreProperties>')
+
+_DOCUMENT_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+
+# US Letter with 1" margins, as python-docx's default template
+_DOCUMENT_TAIL = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/>'
+    '</w:sectPr></w:body></w:document>')
+
+_PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+# characters XML 1.0 cannot carry; tesseract ends every page with a form feed
+_XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+_BLOCK_SPLIT_RE = re.compile(r"\n[ \t]*\n")
+
+def _run(text, rpr=""):
+    lines = text.split("\n")
+    body = '<w:br/>'.join(f'<w:t xml:space="preserve">{escape(line)}</w:t>' for line in lines)
+    return f"<w:r>{rpr}{body}</w:r>"
+
+def text_blocks(text: str):
+    """Blank-line separated blocks of a page's text, cleaned for XML; empty blocks dropped."""
+    text = _XML_INVALID_RE.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    return [b.strip("\n") for b in _BLOCK_SPLIT_RE.split(text) if b.strip()]
+
+class DocxStreamWriter:
+    """Incremental .docx writer: add_page() per PDF page, then close(). Use as a context manager
+    to get abort() (temp file removed, existing output untouched) when an exception escapes."""
+
+    def __init__(self, out_path, title=None):
+        self.out_path = out_path
+        self.pages = 0
+        self._tmp = f"{out_path}.{os.getpid()}.tmp"
+        self._zip = zipfile.ZipFile(self._tmp, "w", zipfile.ZIP_DEFLATED)
+        try:
+            self._zip.writestr("[Content_Types].xml", _CONTENT_TYPES)
+            self._zip.writestr("_rels/.rels", _ROOT_RELS)
+            self._zip.writestr("word/_rels/document.xml.rels", _DOCUMENT_RELS)
+            self._zip.writestr("word/styles.xml", _STYLES)
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            self._zip.writestr("docProps/core.xml", _CORE.format(title=escape(title or ""), created=created))
+            # must be the last member: zipfile allows no other writes while a stream is open
+            self._doc = self._zip.open("word/document.xml", "w")
+            self._doc.write(_DOCUMENT_HEAD.encode("utf-8"))
+            if title:
+                rpr = '<w:rPr><w:b/><w:sz w:val="28"/><w:szCs w:val="28"/></w:rPr>'
+                self._write(f"<w:p>{_run(title, rpr)}</w:p><w:p/>")
+        except BaseException:
+            self.abort()
+            raise
+
+    def _write(self, xml):
+        self._doc.write(xml.encode("utf-8"))
+
+    def add_page(self, text: str, label: str = None):
+        """Append one PDF page: a page break (except before the first), an optional small grey
+        label paragraph, then one paragraph per block of text."""
+        parts = [_PAGE_BREAK] if self.pages else []
+        if label:
+            rpr = '<w:rPr><w:color w:val="808080"/><w:sz w:val="16"/><w:szCs w:val="16"/></w:rPr>'
+            parts.append(f"<w:p>{_run(label, rpr)}</w:p>")
+        parts.extend(f"<w:p>{_run(block)}</w:p>" for block in text_blocks(text or ""))
+        self._write("".join(parts))
+        self.pages += 1
+
+    def close(self):
+        """Finish the document and move it over out_path (overwriting). Returns out_path."""
+        try:
+            self._write(_DOCUMENT_TAIL)
+            self._doc.close()
+            self._zip.close()
+            os.replace(self._tmp, self.out_path)
+        except BaseException:
+            self.abort()
+            raise
+        return self.out_path
+
+    def abort(self):
+        for closer in (getattr(self, "_doc", None), self._zip):
+            try:
+                if closer is not None:
+                    closer.close()
+            except Exception:
+                pass
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def write_docx(pages, out_path, title=None, labels=None):
+    """Stream [(page_idx, text)] (any iterable, e.g. a generator) into out_path.
+    labels: optional {page_idx: str} shown above the page's text. Returns out_path."""
+    with DocxStreamWriter(out_path, title=title) as writer:
+        for page_idx, text in pages:
+            writer.add_page(text, label=(labels or {}).get(page_idx))
+    return out_path
@@ -0,0 +1,323 @@
+# jobs.py
+# Background jobs for the long OCR and export runs. A button in the app enqueues a job (a row in
+# APPDATA_DIR/jobs.sqlite) and returns; one worker thread, started on first use and living at module
+# level, runs the jobs in order. Streamlit reruns re-execute app.py but not this module, so a checkbox
+# ticked mid-OCR no longer kills the work: the UI only polls the table for status, progress and results.
+# Jobs can be cancelled (queued: at once; running: at the next page) and failed or cancelled jobs
+# retried. Uploads are copied under APPDATA_DIR/job_uploads (by content hash) so a job never depends
+# on the session that queued it; a job that was running when the app stopped is marked interrupted.
+# Each job records its own perf trace (not the rerun of whichever session happens to be running); its
+# summary is kept in the result, and params["trace"] also writes it to TRACE_DIR.
+
+import hashlib, json, os, sqlite3, threading, time, traceback
+
+from pdf_core import (
+    JOBS_PATH, JOB_UPLOADS_DIR, TRACE_DIR, OcrSettings, is_pdf_bytes, run_ocr_batch, extract_embedded_pages, save_docx,
+    write_merged_pdf, docx_output_path, searchable_output_path, find_duplicates, drop_duplicate_pages,
+)
+from manifest import get_manifest, mode_settings
+from perf import Tracer, use_tracer, format_summary
+from preprocess import stage_timings, format_timings
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+JOB_PROGRESS_INTERVAL = 0.5  # seconds between progress writes of a running job
+JOB_IDLE_POLL = 1.0          # worker wake-up interval when the queue is empty
+
+class JobCancelled(Exception):
+    pass
+
+class JobContext:
+    """Handed to a job handler: progress reporting (throttled) and cancellation."""
+
+    def __init__(self, jobs, job_id, cancel_event):
+        self._jobs = jobs
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self._last = 0.0
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def progress(self, done, total, message=None, force=False):
+        now = time.monotonic()
+        if force or now - self._last >= JOB_PROGRESS_INTERVAL or done >= total:
+            self._last = now
+            self._jobs._update(self.job_id, done=done, total=total, message=message)
+
+def _is_staged(src):
+    # staged uploads are recorded as uploads (upload:<name>), as when the app processes them inline;
+    # the manifest hashes them from the path in chunks, never reading the whole file in
+    return os.path.dirname(os.path.abspath(src)) == os.path.abspath(JOB_UPLOADS_DIR)
+
+def _drop_duplicates(files, duplicates, ctx):
+    """files with the batch's duplicate pages removed ("same": identical copies, "similar": look-alikes
+    too), plus a note for the summary; files left without pages keep an empty order."""
+    def on_progress(done, total, name):
+        ctx.check()
+        ctx.progress(done, total, f"looking for duplicates: {name}")
+    found = find_duplicates(files, similar=duplicates == "similar", on_progress=on_progress)
+    kept = drop_duplicate_pages(files, found)
+    note = f"{len(found['pages'])} duplicate page(s) dropped" if found["pages"] else "no duplicate pages"
+    emptied = [f[0] for f, k in zip(files, kept) if f[2] and not k[2]]
+    if emptied:
+        note += f" (only duplicates, skipped: {', '.join(emptied)})"
+    return kept, note
+
+# -- handlers ----------------------------------------------------------------------------------------
+# each takes (params, ctx) and returns {"outputs": [[name, path]], "errors": [[file, page or None, msg]],
+# "summary": str}; raising JobCancelled / any exception ends the job as cancelled / failed
+
+def _job_ocr_docx(params, ctx):
+    """OCR or hybrid DOCX for one or more files (the single-file buttons and Process all); with
+    "searchable", also each file's searchable PDF from the same OCR pass."""
+    mode = params["mode"]
+    searchable = params.get("searchable", False)
+    duplicates = params.get("duplicates")
+    # the OCR settings as they were when the job was queued, whatever the app is set to now
+    ocr = OcrSettings.from_params(params.get("ocr"))
+    settings = mode_settings(mode, params["dpi"], params["lang"], adaptive=params.get("adaptive", False),
+                             searchable=searchable, duplicates=duplicates, ocr=ocr)
+    manifest = get_manifest()
+    files = [tuple(f) for f in params["files"]]
+    skipped = []
+    if params.get("skip_current"):
+        skipped = [f for f in files if manifest.is_current(f[0], f[1], mode, f[2], settings, upload=_is_staged(f[1]))]
+        files = [f for f in files if f not in skipped]
+    kept, dup_note = files, None
+    if duplicates and files:
+        kept, dup_note = _drop_duplicates(files, duplicates, ctx)
+    # manifest entries keep the selection as asked for, so the skip check above still matches them
+    batch = [(f, k) for f, k in zip(files, kept) if k[2]]
+    total = sum(len(k[2]) for _, k in batch)
+    ctx.progress(0, total, force=True)
+
+    def on_progress(done, total, fname, file_done, file_total, finished):
+        ctx.check()  # raising here stops the batch and drops its unfinished DOCX files
+        ctx.progress(done, total, f"{fname}: {file_done}/{file_total} pages")
+
+    stage_timings.reset()
+    results = run_ocr_batch([k for _, k in batch], params["out_folder"], dpi=params["dpi"], lang=params["lang"],
+                            workers=params.get("workers", 0), threads_per_worker=params.get("threads", 1),
+                            on_progress=on_progress, hybrid=mode == "hybrid",
+                            adaptive=params.get("adaptive", False), searchable=searchable, settings=ocr)
+    outputs, errors = [], []
+    for ((name, src, order), _), (_, out_path, errs) in zip(batch, results):
+        pdf_path = searchable_output_path(params["out_folder"], name) if searchable else None
+        if out_path:
+            outputs.append([os.path.basename(out_path), out_path])
+            if pdf_path and not any(err.startswith("searchable PDF") for _, err in errs):
+                outputs.append([os.path.basename(pdf_path), pdf_path])
+            if not errs:
+                try:
+                    manifest.record(name, src, mode, order, settings, [out_path] + ([pdf_path] if pdf_path else []),
+                                    upload=_is_staged(src))
+                except Exception as e:
+                    errors.append([name, None, f"manifest not updated: {e}"])
+        errors += [[name, page_idx, err] for page_idx, err in errs]
+    summary = f"{sum(1 for _, out_path, _ in results if out_path)}/{len(batch)} DOCX file(s)"
+    if searchable:
+        summary += " with searchable PDFs"
+    if dup_note:
+        summary += f"; {dup_note}"
+    if skipped:
+        summary += f"; up to date, skipped: {', '.join(f[0] for f in skipped)}"
+    timings = stage_timings.snapshot()
+    if timings:
+        summary += f" · OCR time by stage: {format_timings(timings)}"
+    return {"outputs": outputs, "errors": errors, "summary": summary}
+
+def _job_embedded_docx(params, ctx):
+    name, src, pages = params["files"][0]
+    out_path = docx_output_path(params["out_folder"], name)
+
+    def texts():
+        for n, item in enumerate(extract_embedded_pages(src, pages)):
+            ctx.check()
+            ctx.progress(n + 1, len(pages))
+            yield item
+    save_docx(texts(), out_path, title=name)
+    return {"outputs": [[os.path.basename(out_path), out_path]], "errors": [], "summary": f"{len(pages)} page(s)"}
+
+def _job_pdf(params, ctx):
+    """Selected pages of one file (Save PDF) or of several (Merge all) into one PDF."""
+    out_path = params["out_path"]
+    files = [tuple(f) for f in params["files"]]
+    dup_note = None
+    if params.get("duplicates"):
+        files, dup_note = _drop_duplicates(files, params["duplicates"], ctx)
+        files = [f for f in files if f[2]]
+
+    def on_progress(done, total):
+        ctx.check()
+        ctx.progress(done, total)
+    n_pages, n_objects, n_shared = write_merged_pdf(files, out_path, on_progress=on_progress)
+    summary = f"{n_pages} page(s) from {len(files)} file(s); {n_objects} objects, {n_shared} shared resource(s) stored once"
+    return {"outputs": [[os.path.basename(out_path), out_path]], "errors": [],
+            "summary": summary + (f"; {dup_note}" if dup_note else "")}
+
+JOB_KINDS = {"ocr_docx": _job_ocr_docx, "embedded_docx": _job_embedded_docx, "pdf": _job_pdf}
+
+# -- queue -------------------------------------------------------------------------------------------
+
+_COLUMNS = ("id", "kind", "title", "params", "status", "done", "total", "message", "result",
+            "attempts", "created_at", "started_at", "finished_at")
+
+class JobQueue:
+    """jobs: one row per job; params and result are JSON. One worker thread runs queued jobs by id."""
+
+    def __init__(self, path=JOBS_PATH, uploads_dir=JOB_UPLOADS_DIR):
+        self.uploads_dir = uploads_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._wake = threading.Event()
+        self._cancel = {}  # job id -> Event, for the running job
+        self._worker = None
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, title TEXT, params TEXT, status TEXT,
+                done INTEGER DEFAULT 0, total INTEGER DEFAULT 0, message TEXT DEFAULT '', result TEXT,
+                attempts INTEGER DEFAULT 0, created_at REAL, started_at REAL, finished_at REAL)""")
+            # this process just started: nothing of ours can be running
+            self._conn.execute("UPDATE jobs SET status='failed', finished_at=?, message='interrupted: the app stopped "
+                               "while this job was running' WHERE status='running'", (time.time(),))
+        os.makedirs(uploads_dir, exist_ok=True)
+
+    def stage_source(self, pdf_src):
+        """A path a job can read later: folder files as they are, uploads copied in by content hash."""
+        if not is_pdf_bytes(pdf_src):
+            return os.path.abspath(pdf_src)
+        path = os.path.join(self.uploads_dir, f"{hashlib.sha256(pdf_src).hexdigest()}.pdf")
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf_src)
+            os.replace(tmp, path)
+        return path
+
+    def submit(self, kind, title, params):
+        """Queue a job; returns its id. params must be JSON-serialisable (stage_source() the inputs)."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"unknown job kind: {kind}")
+        with self._lock, self._conn:
+            job_id = self._conn.execute(
+                "INSERT INTO jobs (kind, title, params, status, created_at) VALUES (?,?,?,?,?)",
+                (kind, title, json.dumps(params, ensure_ascii=False), "queued", time.time())).lastrowid
+        self._start_worker()
+        return job_id
+
+    def _row(self, row):
+        job = dict(zip(_COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {','.join(_COLUMNS)} FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def recent(self, limit=20):
+        """Newest jobs first, as dicts."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {','.join(_COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def active(self):
+        """Number of queued or running jobs."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued','running')").fetchone()[0]
+
+    def cancel(self, job_id):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET status='cancelled', finished_at=?, message='cancelled before it started' "
+                               "WHERE id=? AND status='queued'", (time.time(), job_id))
+            event = self._cancel.get(job_id)
+        if event:
+            event.set()  # the handler stops at its next page
+
+    def retry(self, job_id):
+        """Queue a failed or cancelled job again, with the same parameters."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET status='queued', done=0, total=0, message='', result=NULL, "
+                               "started_at=NULL, finished_at=NULL WHERE id=? AND status IN ('failed','cancelled')", (job_id,))
+        self._start_worker()
+
+    def clear_finished(self):
+        """Drop done/failed/cancelled jobs, and staged uploads no remaining job reads."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE status IN ('done','failed','cancelled')")
+            params = [p for (p,) in self._conn.execute("SELECT params FROM jobs")]
+        in_use = {os.path.basename(src) for p in params for _, src, _ in json.loads(p).get("files", [])}
+        for f in os.listdir(self.uploads_dir):
+            if f.endswith(".pdf") and f not in in_use:
+                try:
+                    os.remove(os.path.join(self.uploads_dir, f))
+                except OSError:
+                    pass
+
+    def _update(self, job_id, **fields):
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {cols} WHERE id=?", (*fields.values(), job_id))
+
+    # -- worker ------------------------------------------------------------------------------------
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="job-worker", daemon=True)
+                self._worker.start()
+        self._wake.set()
+
+    def _claim(self):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id, kind, params FROM jobs WHERE status='queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE jobs SET status='running', started_at=?, attempts=attempts+1, "
+                               "message='' WHERE id=?", (time.time(), row[0]))
+            self._cancel[row[0]] = threading.Event()
+            return row[0], row[1], json.loads(row[2]), self._cancel[row[0]]
+
+    def _run(self):
+        while True:
+            claimed = self._claim()
+            if claimed is None:
+                self._wake.wait(JOB_IDLE_POLL)
+                self._wake.clear()
+                continue
+            job_id, kind, params, cancel_event = claimed
+            ctx = JobContext(self, job_id, cancel_event)
+            trace = Tracer()
+            trace.begin(f"job-{job_id}-{kind}")
+            try:
+                with use_tracer(trace), trace.span(f"job.{kind}", job=job_id):
+                    result = JOB_KINDS[kind](params, ctx)
+                status, message = "done", result.get("summary", "")
+                result["perf"] = format_summary(trace.summary())
+                if params.get("trace"):
+                    try:
+                        result["trace"] = trace.dump(TRACE_DIR)
+                    except OSError:
+                        pass
+            except JobCancelled:
+                status, message, result = "cancelled", "cancelled", None
+            except Exception as e:
+                status, message = "failed", str(e) or e.__class__.__name__
+                result = {"traceback": traceback.format_exc()}
+            with self._lock:
+                self._cancel.pop(job_id, None)
+            self._update(job_id, status=status, message=message, finished_at=time.time(),
+                         result=json.dumps(result, ensure_ascii=False) if result is not None else None)
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+    return _job_queue
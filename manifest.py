@@ -0,0 +1,158 @@
+# manifest.py
+# Processing manifest under APPDATA_DIR: what was produced from which input, with which page
+# selection and settings. Lets "Process all" and the CLI (including --watch, for folders a scanner
+# keeps filling) skip inputs whose outputs are still current instead of redoing and overwriting them.
+# An input counts as unchanged when size+mtime match, or — if only the mtime moved — when its
+# content hash still matches; outputs count as current when they exist with the recorded size/mtime.
+
+import json, os, sqlite3, threading, time
+
+from pdf_core import MANIFEST_PATH, is_pdf_bytes, source_key, pdf_content_hash, ocr_engine
+
+WATCH_RETRIES = 3  # --watch: further attempts at a file whose run failed, before waiting for it to change
+
+def _stat(path):
+    st_ = os.stat(path)
+    return st_.st_size, st_.st_mtime_ns
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+def mode_settings(mode, dpi, lang, adaptive=False, searchable=False, duplicates=None, ocr=None):
+    """Settings that shape the output of a mode; a change in any of them makes old outputs stale.
+    duplicates: "same" or "similar" when the batch's duplicate pages were dropped (find_duplicates).
+    ocr: the run's OcrSettings (default: pdf_core.get_ocr_settings())."""
+    if mode in ("ocr", "hybrid"):
+        settings = {"dpi": dpi, "lang": lang, "engine": ocr_engine(ocr)}
+        # only when on: entries recorded before these options existed stay current
+        if adaptive:
+            settings["adaptive"] = True
+        if searchable:
+            settings["searchable"] = True
+        if duplicates:
+            settings["duplicates"] = duplicates
+        return settings
+    return {}
+
+class Manifest:
+    """entries: one row per (input key, mode); key as in source_key() (absolute path or upload:<name>)."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT, mode TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, doc_hash TEXT,
+                selection TEXT, settings TEXT, outputs TEXT, processed_at REAL, PRIMARY KEY (key, mode))""")
+
+    def _input_state(self, pdf_src, upload=False):
+        if is_pdf_bytes(pdf_src):
+            return len(pdf_src), 0
+        if upload:
+            return os.path.getsize(pdf_src), 0
+        return _stat(pdf_src)
+
+    def _key(self, name, pdf_src, upload):
+        return f"upload:{name}" if upload else source_key(name, pdf_src)
+
+    def is_current(self, name, pdf_src, mode, selection, settings, upload=False):
+        """True when this input was already processed in this mode with the same pages and settings,
+        it has not changed since, and every recorded output is still there untouched.
+        upload=True: pdf_src is the path of a staged copy of an upload, recorded as upload:<name>."""
+        upload = upload or is_pdf_bytes(pdf_src)
+        key = self._key(name, pdf_src, upload)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, doc_hash, selection, settings, outputs FROM entries WHERE key=? AND mode=?",
+                (key, mode)).fetchone()
+        if row is None:
+            return False
+        size, mtime_ns, doc_hash, sel_json, settings_json, outputs_json = row
+        if sel_json != _dumps(list(selection)) or settings_json != _dumps(settings):
+            return False
+        try:
+            state = self._input_state(pdf_src, upload)
+            if upload or state != (size, mtime_ns):
+                # uploads have no mtime; a touched-but-identical file is still the same input
+                if state[0] != size or pdf_content_hash(pdf_src) != doc_hash:
+                    return False
+                if not upload:
+                    with self._lock, self._conn:
+                        self._conn.execute("UPDATE entries SET mtime_ns=? WHERE key=? AND mode=?", (state[1], key, mode))
+            for out_path, out_size, out_mtime_ns in json.loads(outputs_json):
+                if _stat(out_path) != (out_size, out_mtime_ns):
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def record(self, name, pdf_src, mode, selection, settings, outputs, upload=False):
+        """Remember that `outputs` (paths, already written) were produced from this input."""
+        upload = upload or is_pdf_bytes(pdf_src)
+        size, mtime_ns = self._input_state(pdf_src, upload)
+        outs = [[os.path.abspath(p)] + list(_stat(p)) for p in outputs]
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?,?,?,?)",
+                               (self._key(name, pdf_src, upload), mode, name, size, mtime_ns, pdf_content_hash(pdf_src),
+                                _dumps(list(selection)), _dumps(settings), json.dumps(outs), time.time()))
+
+    def forget(self, name, pdf_src, mode=None):
+        key = source_key(name, pdf_src)
+        with self._lock, self._conn:
+            if mode is None:
+                self._conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            else:
+                self._conn.execute("DELETE FROM entries WHERE key=? AND mode=?", (key, mode))
+
+    def prune(self):
+        """Drop entries of input files that no longer exist."""
+        with self._lock, self._conn:
+            keys = [k for (k,) in self._conn.execute("SELECT DISTINCT key FROM entries WHERE key NOT LIKE 'upload:%'")]
+            self._conn.executemany("DELETE FROM entries WHERE key=?", [(k,) for k in keys if not os.path.exists(k)])
+
+class StabilityTracker:
+    """Watch-mode filter over successive folder listings. A file is handed out once it is stable
+    (size and mtime identical on two consecutive polls, so a scan still being written is left alone),
+    and then not again until it changes (or retry() is called after a failed run) — untouched files
+    cost one stat per poll, nothing more."""
+
+    def __init__(self, max_retries=WATCH_RETRIES):
+        self.max_retries = max_retries
+        self._last = {}
+        self._handed_out = {}
+        self._retries = {}  # path -> ((size, mtime), retries so far) of a file whose run failed
+
+    def ready(self, folder_pdfs):
+        seen = {f.path: (f.size, f.mtime) for f in folder_pdfs}
+        ready = [f for f in folder_pdfs
+                 if self._last.get(f.path) == seen[f.path] and self._handed_out.get(f.path) != seen[f.path]]
+        for f in ready:
+            self._handed_out[f.path] = seen[f.path]
+        self._last = seen
+        if self._retries:
+            self._retries = {path: v for path, v in self._retries.items() if path in seen}
+        return ready
+
+    def retry(self, paths):
+        """Hand these files out again at the next poll: their run failed (e.g. page errors, which the
+        manifest does not record). Up to max_retries times per version of a file; then it waits for a change."""
+        for path in paths:
+            version = self._handed_out.get(path)
+            if version is None:
+                continue
+            last, count = self._retries.get(path, (None, 0))
+            count = count if last == version else 0
+            if count < self.max_retries:
+                del self._handed_out[path]
+                self._retries[path] = (version, count + 1)
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest():
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = Manifest()
+    return _manifest
@@ -0,0 +1,126 @@
+# ocr_words.py
+# Word-level OCR results: one tesseract call per page (image_to_data, TSV) gives both the page text
+# and every word's box and confidence. Boxes are mapped back from the preprocessed image to the
+# rendered page (preprocess.to_source), so they stay valid whatever cropping/scaling/deskew was
+# applied, and are stored compactly (zlib'd JSON, a few KB per page) next to the text in the OCR cache.
+# build_text_layer() turns them into an invisible (text render mode 3) reportlab PDF, one page per
+# input page, that pdf_assemble lays over the original pages for the searchable-PDF export.
+
+import json, os, zlib
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from preprocess import to_source
+
+WORDS_VERSION = 1
+# fonts with Greek and Latin glyphs; the text is invisible, but a font without the characters would
+# make them unsearchable. Helvetica (Latin only) is the last resort.
+TEXT_LAYER_FONTS = [
+    os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts", f) for f in ("arial.ttf", "segoeui.ttf", "tahoma.ttf")
+] + [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf", "/System/Library/Fonts/Supplemental/Arial.ttf", "/Library/Fonts/Arial.ttf",
+]
+TEXT_LAYER_FONT_NAME = "OcrTextLayer"
+
+def parse_tsv(tsv, transform, size):
+    """(text, words) from tesseract's TSV for an image preprocessed with `transform`, rendered at
+    `size` (w, h) pixels. text is laid out like image_to_string (words joined by spaces, one line
+    per text line, a blank line between paragraphs); words is {"size": [w, h], "words": [[x0, y0,
+    x1, y1, conf, line, text]]} in page-image pixels, line numbering the text lines in reading order."""
+    lines = []   # [(paragraph key, [word texts])]
+    words = []
+    line_key = None
+    for row in tsv.splitlines()[1:]:
+        cols = row.split("\t", 11)
+        if len(cols) < 12 or cols[0] != "5":
+            continue
+        text = cols[11].strip()
+        if not text:
+            continue
+        block, par, line = cols[2], cols[3], cols[4]
+        if (block, par, line) != line_key:
+            line_key = (block, par, line)
+            lines.append(((block, par), []))
+        lines[-1][1].append(text)
+        left, top, width, height = (int(c) for c in cols[6:10])
+        corners = [to_source(transform, x, y) for x in (left, left + width) for y in (top, top + height)]
+        xs, ys = [p[0] for p in corners], [p[1] for p in corners]
+        words.append([round(min(xs)), round(min(ys)), round(max(xs)), round(max(ys)),
+                      round(float(cols[10])), len(lines) - 1, text])
+    out = []
+    for n, (par_key, line_words) in enumerate(lines):
+        if n and par_key != lines[n - 1][0]:
+            out.append("")
+        out.append(" ".join(line_words))
+    text = "\n".join(out) + "\n" if out else ""
+    return text, {"v": WORDS_VERSION, "size": list(size), "words": words}
+
+def pack_words(words):
+    return zlib.compress(json.dumps(words, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+def unpack_words(blob):
+    """The words dict of pack_words(), or None for a missing or unreadable blob."""
+    if not blob:
+        return None
+    try:
+        words = json.loads(zlib.decompress(blob).decode("utf-8"))
+    except (zlib.error, ValueError):
+        return None
+    return words if words.get("v") == WORDS_VERSION else None
+
+_font = None
+
+def text_layer_font():
+    """Name of the font for the invisible text, registered with reportlab on first use."""
+    global _font
+    if _font is None:
+        _font = "Helvetica"
+        for path in TEXT_LAYER_FONTS:
+            if os.path.exists(path):
+                try:
+                    pdfmetrics.registerFont(TTFont(TEXT_LAYER_FONT_NAME, path))
+                    _font = TEXT_LAYER_FONT_NAME
+                    break
+                except Exception:
+                    continue
+    return _font
+
+def build_text_layer(out, pages):
+    """Write a PDF to `out` (path or file object) with one page per (width, height, words) in `pages`,
+    in points as the page is displayed; words (parse_tsv) may be None for a page left without text.
+    Each word is drawn invisibly over its box, stretched to the box width, so selection and search
+    hits line up with the scan underneath."""
+    font = text_layer_font()
+    c = canvas.Canvas(out, pageCompression=1)
+    for width, height, words in pages:
+        c.setPageSize((width, height))
+        if words and words["words"]:
+            img_w, img_h = words["size"]
+            sx, sy = width / img_w, height / img_h
+            # one size and baseline per text line (word boxes vary with ascenders/descenders), so
+            # extractors keep each line together
+            line_box = {}
+            for _, y0, _, y1, _, line, _ in words["words"]:
+                top, bottom = line_box.get(line, (y0, y1))
+                line_box[line] = (min(top, y0), max(bottom, y1))
+            text = c.beginText()
+            text.setTextRenderMode(3)  # neither fill nor stroke: invisible, still extractable
+            for n, (x0, _, x1, _, _, line, word) in enumerate(words["words"]):
+                top, bottom = line_box[line]
+                size = max((bottom - top) * sy, 1.0)
+                natural = pdfmetrics.stringWidth(word, font, size)
+                if natural <= 0:
+                    continue
+                text.setFont(font, size)
+                text.setHorizScale(max((x1 - x0) * sx / natural * 100, 1.0))
+                # baseline a little above the line's bottom, where descenders end
+                text.setTextOrigin(x0 * sx, height - bottom * sy + size * 0.2)
+                # a space after every word that has a neighbour on its line, so extractors split the words
+                last_on_line = n + 1 == len(words["words"]) or words["words"][n + 1][5] != line
+                text.textOut(word if last_on_line else word + " ")
+            c.drawText(text)
+        c.showPage()
+    c.save()
@@ -0,0 +1,138 @@
+# pagesel.py
+# Page selections and orders as (first, last) runs of 0-based page indices instead of one bool or
+# int per page: "all 40,000 pages" is a single run, and union / intersection / difference cost the
+# number of runs, not of pages. Quick-selection specs ("2,5,8", "3-6", "-3") are parsed into ranges
+# and applied as range operations, so "1-50000" never expands page by page; spec() writes a
+# selection back in the same syntax. Nothing here knows about PDFs or Streamlit.
+
+import bisect
+
+def page_runs(indices):
+    """Group page indices into contiguous (first, last) runs, keeping the given order."""
+    runs = []
+    for i in indices:
+        if runs and i == runs[-1][1] + 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return [(a, b) for a, b in runs]
+
+def expand_runs(runs):
+    """The page indices of (first, last) runs, in run order."""
+    return [i for first, last in runs for i in range(first, last + 1)]
+
+def runs_spec(runs):
+    """(first, last) runs as quick-selection text, 1-based: "1-3,7,9-12"."""
+    return ",".join(str(a + 1) if a == b else f"{a + 1}-{b + 1}" for a, b in runs)
+
+class PageSet:
+    """Immutable set of page indices stored as sorted, disjoint, non-adjacent (first, last) runs.
+    Supports len(), iteration (ascending), `in` (binary search), ==, and | & - with another PageSet."""
+
+    __slots__ = ("runs",)
+
+    def __init__(self, runs=()):
+        merged = []
+        for a, b in sorted(runs):
+            if b < a:
+                continue
+            if merged and a <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        self.runs = tuple((a, b) for a, b in merged)
+
+    @classmethod
+    def all(cls, total_pages):
+        return cls([(0, total_pages - 1)])
+
+    @classmethod
+    def of(cls, pages):
+        return cls(page_runs(sorted(set(pages))))
+
+    def __len__(self):
+        return sum(b - a + 1 for a, b in self.runs)
+
+    def __bool__(self):
+        return bool(self.runs)
+
+    def __iter__(self):
+        for a, b in self.runs:
+            yield from range(a, b + 1)
+
+    def __contains__(self, page_idx):
+        k = bisect.bisect_right(self.runs, (page_idx, float("inf"))) - 1
+        return k >= 0 and self.runs[k][1] >= page_idx
+
+    def __eq__(self, other):
+        return isinstance(other, PageSet) and self.runs == other.runs
+
+    def __hash__(self):
+        return hash(self.runs)
+
+    def __or__(self, other):
+        return PageSet(self.runs + other.runs)
+
+    def __and__(self, other):
+        out = []
+        i = j = 0
+        a, b = self.runs, other.runs
+        while i < len(a) and j < len(b):
+            lo, hi = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+            if lo <= hi:
+                out.append((lo, hi))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return PageSet(out)
+
+    def __sub__(self, other):
+        out = []
+        j = 0
+        cut = other.runs
+        for a, b in self.runs:
+            while j < len(cut) and cut[j][1] < a:
+                j += 1
+            k = j
+            while k < len(cut) and cut[k][0] <= b:
+                if cut[k][0] > a:
+                    out.append((a, cut[k][0] - 1))
+                a = max(a, cut[k][1] + 1)
+                k += 1
+            if a <= b:
+                out.append((a, b))
+        return PageSet(out)
+
+    def spec(self):
+        return runs_spec(self.runs)
+
+    def __repr__(self):
+        return f"PageSet({self.spec() or '-'})"
+
+def parse_page_ranges(txt: str):
+    """Quick-selection syntax: "2,5,8", "3-6", "-3" (unselect). Returns [(first, last, negated)],
+    1-based and inclusive; a range written backwards ("6-3") is empty. Raises ValueError on malformed input."""
+    ranges = []
+    for part in txt.split(","):
+        p = part.strip()
+        if not p:
+            continue
+        neg = p.startswith("-")
+        if neg:
+            p = p[1:]
+        if "-" in p:
+            a, b = p.split("-", 1)
+            ranges.append((int(a), int(b), neg))
+        else:
+            ranges.append((int(p), int(p), neg))
+    return ranges
+
+def apply_page_ranges(selection, changes, total_pages):
+    """selection (PageSet) with parse_page_ranges() changes applied in order, as range operations;
+    pages outside 1..total_pages are ignored. Returns a new PageSet."""
+    bound = PageSet.all(total_pages)
+    for first, last, neg in changes:
+        part = PageSet([(first - 1, last - 1)]) & bound
+        selection = selection - part if neg else selection | part
+    return selection
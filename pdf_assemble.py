@@ -0,0 +1,317 @@
+# pdf_assemble.py
+# Page assembly engine: builds one PDF from pages of any number of input PDFs, in any order,
+# without PdfWriter. Objects are copied as-is (streams keep their original encoded bytes, nothing
+# is re-compressed or re-rendered) and written to disk the moment they are reached, with a classic
+# xref table at the end. Identical resources — the same font or image embedded in several inputs,
+# or pages of one file sharing them — are written once: every copied object is keyed by a digest of
+# its content and of everything it references. Memory holds the object-number maps and digests, one
+# page's object graph at a time, and the parsed page dictionaries of the open readers.
+# A page can carry an overlay: a page of another PDF (e.g. the invisible OCR text layer) wrapped in a
+# form XObject and drawn on top of the untouched original content.
+
+import hashlib, io, os, zlib
+from collections import OrderedDict
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, FloatObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject,
+)
+
+ASSEMBLE_OPEN_READERS = 4  # inputs kept open at once when the page order jumps between files
+PAGES_OBJ, CATALOG_OBJ = 1, 2
+SKIP_PAGE_KEYS = ("/Parent", "/B")  # page tree link (rewritten) and article beads (would pull in threads)
+OVERLAY_XOBJECT = "/OverlayLayer"
+
+class _Source:
+    """An input opened for assembly: bytes via BytesIO, paths via a file handle (read lazily)."""
+
+    def __init__(self, pdf_src):
+        if isinstance(pdf_src, (bytes, bytearray, memoryview)):
+            self._fh = io.BytesIO(pdf_src)
+        else:
+            self._fh = open(pdf_src, "rb")
+        self.reader = PdfReader(self._fh)
+
+    def close(self):
+        self._fh.close()
+
+def _source_id(pdf_src):
+    if isinstance(pdf_src, (bytes, bytearray, memoryview)):
+        return ("bytes", id(pdf_src))
+    return ("path", os.path.abspath(pdf_src))
+
+def _page_type(obj):
+    if isinstance(obj, DictionaryObject):
+        t = obj.get("/Type")
+        if t in ("/Page", "/Pages"):
+            return t
+    return None
+
+class _Assembler:
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}  # output object number -> file offset
+        self.next_num = CATALOG_OBJ + 1
+        self.numbers = {}  # (src_i, idnum) -> output object number
+        self.digests = {}  # (src_i, idnum) -> digest, or None when the object must not be shared
+        self.by_digest = {}  # digest -> output object number
+        self.page_nums = {}  # (src_i, idnum) of an input page -> output number of its (first) copy
+        self.pending = []  # (output number, src_i, input reference) still to be written
+        self.deduped = 0
+        self.save_state = None  # output number of the shared "q" stream opening overlaid pages
+
+    def alloc(self):
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def write_object(self, num, obj):
+        self.offsets[num] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % num)
+        obj.write_to_stream(self.f, None)
+        self.f.write(b"\nendobj\n")
+
+    # -- content digests -------------------------------------------------------------------------
+
+    def digest(self, src_i, ref, stack=()):
+        """Digest of an indirect object and its whole reference graph, or None when it must keep its
+        own copy: it points at a page (annotations, destinations) or sits on a reference cycle."""
+        key = (src_i, ref.idnum)
+        if key in self.digests:
+            return self.digests[key]
+        if key in stack:
+            return None
+        h = hashlib.sha256()
+        shareable = self._feed(h, src_i, ref.get_object(), stack + (key,))
+        d = h.digest() if shareable else None
+        self.digests[key] = d
+        return d
+
+    def _feed(self, h, src_i, obj, stack):
+        if isinstance(obj, IndirectObject):
+            if _page_type(obj.get_object()):
+                return False
+            d = self.digest(src_i, obj, stack)
+            if d is None:
+                return False
+            h.update(b"R" + d)
+            return True
+        if isinstance(obj, StreamObject):
+            h.update(b"S" + hashlib.sha256(obj._data).digest())
+            obj = {k: v for k, v in obj.items() if k != "/Length"}
+        if isinstance(obj, dict):
+            if "/Rect" in obj:
+                return False  # annotation: belongs to exactly one page
+            h.update(b"<<")
+            for k in sorted(obj):
+                h.update(k.encode("utf-8", "surrogatepass") + b" ")
+                if not self._feed(h, src_i, obj[k], stack):
+                    return False
+            h.update(b">>")
+            return True
+        if isinstance(obj, list):
+            h.update(b"[")
+            for v in obj:
+                if not self._feed(h, src_i, v, stack):
+                    return False
+            h.update(b"]")
+            return True
+        h.update(type(obj).__name__.encode() + b":" + repr(obj).encode("utf-8", "surrogatepass") + b";")
+        return True
+
+    # -- copying ---------------------------------------------------------------------------------
+
+    def ref(self, src_i, ref):
+        """Output reference for an input reference; queues the object for writing on first sight."""
+        key = (src_i, ref.idnum)
+        if key in self.numbers:
+            return IndirectObject(self.numbers[key], 0, None)
+        target = ref.get_object()
+        kind = _page_type(target)
+        if kind == "/Page" and key in self.page_nums:
+            return IndirectObject(self.page_nums[key], 0, None)
+        if kind:
+            return NullObject()  # a page that is not part of the output, or the input's page tree
+        try:
+            d = self.digest(src_i, ref)
+        except RecursionError:
+            d = None  # pathologically deep graph: copy it without sharing
+        if d is not None and d in self.by_digest:
+            self.numbers[key] = self.by_digest[d]
+            self.deduped += 1
+            return IndirectObject(self.by_digest[d], 0, None)
+        num = self.alloc()
+        self.numbers[key] = num
+        if d is not None:
+            self.by_digest[d] = num
+        self.pending.append((num, src_i, ref))
+        return IndirectObject(num, 0, None)
+
+    def copy(self, src_i, obj):
+        if isinstance(obj, IndirectObject):
+            return self.ref(src_i, obj)
+        if isinstance(obj, StreamObject):
+            new = StreamObject()
+            for k, v in obj.items():
+                if k != "/Length":  # written directly from the data length
+                    new[NameObject(k)] = self.copy(src_i, v)
+            new._data = obj._data  # original encoded bytes; get_data() would decode them
+            return new
+        if isinstance(obj, dict):
+            new = DictionaryObject()
+            for k, v in obj.items():
+                new[NameObject(k)] = self.copy(src_i, v)
+            return new
+        if isinstance(obj, list):
+            return ArrayObject(self.copy(src_i, v) for v in obj)
+        return obj
+
+    def write_stream(self, data, extra=None):
+        stream = StreamObject()
+        stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+        for k, v in (extra or {}).items():
+            stream[NameObject(k)] = v
+        stream._data = zlib.compress(data)
+        num = self.alloc()
+        self.write_object(num, stream)
+        return num
+
+    def overlay(self, new, src_i, page, ov_i, ov_page):
+        """Draw ov_page over the copied page dictionary `new`: the overlay becomes a form XObject whose
+        matrix maps its (displayed, unrotated) space onto the page's user space."""
+        box = [float(v) for v in page.mediabox]
+        x0, y0, w, h = box[0], box[1], box[2] - box[0], box[3] - box[1]
+        rotate = int(page.get("/Rotate", 0) or 0) % 360
+        matrix = {0: (1, 0, 0, 1, x0, y0), 90: (0, 1, -1, 0, x0 + w, y0),
+                  180: (-1, 0, 0, -1, x0 + w, y0 + h), 270: (0, -1, 1, 0, x0, y0 + h)}.get(rotate, (1, 0, 0, 1, x0, y0))
+        contents = ov_page.get_contents()
+        form = self.write_stream(contents.get_data() if contents is not None else b"", {
+            "/Type": NameObject("/XObject"), "/Subtype": NameObject("/Form"),
+            "/BBox": ArrayObject(FloatObject(v) for v in ov_page.mediabox),
+            "/Matrix": ArrayObject(FloatObject(v) for v in matrix),
+            "/Resources": self.copy(ov_i, ov_page.get("/Resources", DictionaryObject())),
+        })
+        # resources: a page-own copy (the original may be shared) with the form added to /XObject
+        resources = page.get("/Resources")
+        resources = self.copy(src_i, resources.get_object()) if resources is not None else DictionaryObject()
+        xobjects = resources.get("/XObject")
+        xobjects = self.copy(src_i, xobjects.get_object()) if xobjects is not None else DictionaryObject()
+        name = OVERLAY_XOBJECT
+        while name in xobjects:
+            name += "_"
+        xobjects[NameObject(name)] = IndirectObject(form, 0, None)
+        resources[NameObject("/XObject")] = xobjects
+        new[NameObject("/Resources")] = resources
+        # contents: q <original> Q <overlay>, so the original's graphics state cannot leak into the overlay
+        if self.save_state is None:
+            self.save_state = self.write_stream(b"q\n")
+        original = new.get("/Contents")
+        original = list(original) if isinstance(original, ArrayObject) else [original] if original is not None else []
+        draw = self.write_stream(b"Q\nq %s Do Q\n" % name.encode("latin-1"))
+        new[NameObject("/Contents")] = ArrayObject([IndirectObject(self.save_state, 0, None), *original,
+                                                   IndirectObject(draw, 0, None)])
+
+    def write_page(self, src_i, page, num, overlay=None):
+        new = DictionaryObject()
+        for k, v in page.items():
+            if k not in SKIP_PAGE_KEYS and not (overlay is not None and k == "/Resources"):
+                new[NameObject(k)] = self.copy(src_i, v)
+        new[NameObject("/Parent")] = IndirectObject(PAGES_OBJ, 0, None)
+        if overlay is not None:
+            self.overlay(new, src_i, page, *overlay)  # sets a page-own /Resources
+        self.write_object(num, new)
+        while self.pending:
+            obj_num, obj_src, ref = self.pending.pop()
+            self.write_object(obj_num, self.copy(obj_src, ref.get_object()))
+
+    def finish(self, page_objs):
+        kids = ArrayObject(IndirectObject(n, 0, None) for n in page_objs)
+        pages = DictionaryObject({NameObject("/Type"): NameObject("/Pages"), NameObject("/Kids"): kids,
+                                  NameObject("/Count"): NumberObject(len(page_objs))})
+        self.write_object(PAGES_OBJ, pages)
+        catalog = DictionaryObject({NameObject("/Type"): NameObject("/Catalog"),
+                                    NameObject("/Pages"): IndirectObject(PAGES_OBJ, 0, None)})
+        self.write_object(CATALOG_OBJ, catalog)
+        xref_at = self.f.tell()
+        size = self.next_num
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for num in range(1, size):
+            self.f.write(b"%010d 00000 n \n" % self.offsets[num])
+        self.f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, CATALOG_OBJ, xref_at))
+
+def assemble_pdf(pages, out_path, on_progress=None):
+    """Write the given pages, in order, to out_path (overwriting it; a temp file is renamed into place).
+    pages: iterable of (pdf_src, page_idx) or (pdf_src, page_idx, overlay), overlay being None or
+    (overlay_src, overlay_page_idx): that page, sized as the page is displayed, is drawn on top of it.
+    Sources may repeat and interleave freely. Out-of-range indices are skipped. on_progress(done, total)
+    runs after each page.
+    Returns (n_pages, n_objects, n_deduplicated). Raises on failure."""
+    plan = []
+    ids = {}
+    srcs = []
+
+    def src_index(pdf_src):
+        sid = _source_id(pdf_src)
+        if sid not in ids:
+            ids[sid] = len(srcs)
+            srcs.append(pdf_src)
+        return ids[sid]
+
+    for pdf_src, page_idx, *overlay in pages:
+        overlay = overlay[0] if overlay else None
+        plan.append((src_index(pdf_src), page_idx, (src_index(overlay[0]), overlay[1]) if overlay else None))
+
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    opened = OrderedDict()  # src_i -> _Source, least recently used first
+
+    def reader(src_i):
+        if src_i in opened:
+            opened.move_to_end(src_i)
+        else:
+            opened[src_i] = _Source(srcs[src_i])
+            while len(opened) > ASSEMBLE_OPEN_READERS:
+                opened.popitem(last=False)[1].close()
+        return opened[src_i].reader
+
+    def close_all():
+        while opened:
+            opened.popitem()[1].close()
+
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+            asm = _Assembler(f)
+            # number the output pages up front, so links between copied pages resolve in any order
+            jobs = []
+            for src_i, page_idx, overlay in plan:
+                r = reader(src_i)
+                if not 0 <= page_idx < len(r.pages):
+                    continue
+                page_ref = r.pages[page_idx].indirect_reference
+                num = asm.alloc()
+                if page_ref is not None:
+                    asm.page_nums.setdefault((src_i, page_ref.idnum), num)
+                jobs.append((src_i, page_idx, num, overlay))
+            for n, (src_i, page_idx, num, overlay) in enumerate(jobs):
+                ov_page = None
+                if overlay is not None:
+                    ov_reader = reader(overlay[0])
+                    if 0 <= overlay[1] < len(ov_reader.pages):
+                        ov_page = (overlay[0], ov_reader.pages[overlay[1]])
+                r = reader(src_i)
+                asm.write_page(src_i, r.pages[page_idx], num, overlay=ov_page)
+                # the page's objects are on disk now; let pypdf forget them instead of caching every object it parsed
+                r.resolved_objects.clear()
+                if on_progress:
+                    on_progress(n + 1, len(jobs))
+            asm.finish([num for _, _, num, _ in jobs])
+        close_all()  # before the rename: Windows cannot replace a file that is still open (output == an input)
+        os.replace(tmp, out_path)
+    except BaseException:
+        close_all()
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return len(jobs), asm.next_num - 1, asm.deduped
@@ -0,0 +1,1553 @@
+# pdf_core.py
+# Core PDF / OCR / DOCX operations, shared by app.py (Streamlit UI) and cli.py (headless).
+# Nothing here imports streamlit: errors are raised or returned, and callers report them.
+# Caches live at module level, so in Streamlit they outlive reruns (imported modules are not re-executed).
+
+from PyPDF2 import PdfReader
+from pdf2image import convert_from_bytes, convert_from_path
+from PIL import Image
+import io, re, hashlib, os, json, math, time, threading, tempfile, sqlite3, queue, subprocess
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# OCR + docx
+from docx_stream import DocxStreamWriter, write_docx
+from dedup import page_fingerprint, dhash, SimilarIndex
+from pagesel import page_runs
+from ocr_words import parse_tsv, pack_words, unpack_words, build_text_layer
+from tiles import plan_tiles, stitch_words
+from pdf_assemble import assemble_pdf
+from perf import tracer, bind
+from preprocess import (
+    DEFAULT_PREPROCESS, TARGET_DPI, parse_stages, stages_signature, preprocess_image, save_for_tesseract, stage_timings,
+    plan_page,
+)
+
+# ---------------------------
+# AppData config
+# ---------------------------
+APP_NAME = "PDFEditorUltimate"
+LOCALAPPDATA = os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+APPDATA_DIR = os.path.join(LOCALAPPDATA, APP_NAME)
+CONFIG_PATH = os.path.join(APPDATA_DIR, "config.json")
+THUMB_CACHE_DIR = os.path.join(APPDATA_DIR, "thumbs")
+THUMB_MEM_BUDGET = 64 * 1024 * 1024  # bytes of PNG data kept in RAM across reruns
+THUMB_DISK_MAX_BYTES = 512 * 1024 * 1024  # PNG files kept under THUMB_CACHE_DIR; least recently used go first
+THUMB_DPI = 100
+OCR_DPI = 300
+OCR_CACHE_PATH = os.path.join(APPDATA_DIR, "ocr_cache.sqlite")
+OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RASTER_RUN_MAX = 8  # pages per pdftoppm call when streaming OCR images (bounds temp disk use)
+OCR_TILE_MEGAPIXELS = 40  # pages rendering larger than this at their OCR DPI are rendered and OCR'd in tiles
+OCR_TILE_OVERLAP = 0.5    # inches shared by neighbouring tiles: words up to twice this tall are read whole
+READER_CACHE_SIZE = 8  # parsed PdfReaders kept alive (folder files keep a file handle open)
+MEMO_DOCUMENTS = 512   # documents whose content hash / page fingerprints stay memoized (a few KB each)
+MEMO_THUMB_PRINTS = 65536  # page fingerprints remembered as having a cached thumbnail
+PAGE_TEXT_CACHE_CHARS = 20_000_000  # extracted text kept in RAM across reruns
+TEXT_LAYER_MIN_CHARS = 25       # fewer non-space characters than this: page needs OCR
+TEXT_LAYER_MIN_QUALITY = 0.85   # share of characters that look like real text (vs. (cid:N), U+FFFD, junk)
+SCAN_PAGE_TEXT_CHARS = 200      # a full-page image with less text than this is treated as a scan
+MANIFEST_PATH = os.path.join(APPDATA_DIR, "manifest.sqlite")
+TRACE_DIR = os.path.join(APPDATA_DIR, "traces")  # perf trace dumps (Chrome trace-event JSON)
+JOBS_PATH = os.path.join(APPDATA_DIR, "jobs.sqlite")
+JOB_UPLOADS_DIR = os.path.join(APPDATA_DIR, "job_uploads")  # uploads queued jobs read, by content hash
+PLAN_THUMB_CHUNK = 32  # pages per thumbnail lookup when planning adaptive OCR
+BATCH_PAGES_PER_WORKER = 2  # rendered pages buffered per OCR worker between batch stages
+PREPARE_WORKERS = min(4, os.cpu_count() or 1)  # files prepared concurrently while the app loads
+
+DEFAULT_CONFIG = {
+    "input_folder": "",
+    "output_folder": "",
+    "tesseract_path": r"C:\Users\{user}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe".format(user=os.getenv("USERNAME") or ""),
+    "ocr_lang": "ell+eng",
+    "ocr_workers": 0,             # 0 = auto (cores / threads per worker)
+    "ocr_threads_per_worker": 1,  # OMP threads inside each tesseract process
+    "ocr_preprocess": DEFAULT_PREPROCESS,  # stages before tesseract (preprocess.py), or "none"
+    "ocr_target_dpi": TARGET_DPI,          # renders above this are downscaled before OCR
+    "ocr_adaptive": False,                 # per-page OCR DPI from the thumbnails; blank/separator pages skipped
+    "ocr_searchable": False,               # OCR exports also write <name>_ocr.pdf with an invisible text layer
+    "ocr_tile_megapixels": OCR_TILE_MEGAPIXELS  # larger page renders are OCR'd in tiles of at most this size
+}
+
+os.makedirs(APPDATA_DIR, exist_ok=True)
+
+def load_config():
+    if os.path.exists(CONFIG_PATH):
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+            # ensure keys
+            for k, v in DEFAULT_CONFIG.items():
+                if k not in cfg:
+                    cfg[k] = v
+            return cfg
+        except Exception:
+            return DEFAULT_CONFIG.copy()
+    else:
+        cfg = DEFAULT_CONFIG.copy()
+        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+            json.dump(cfg, f, indent=2, ensure_ascii=False)
+        return cfg
+
+def write_config(cfg):
+    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, indent=2, ensure_ascii=False)
+
+_singleton_lock = threading.Lock()
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def sanitize_filename(name: str):
+    return re.sub(r'[^A-Za-z0-9_\-\.Α-Ωα-ωίόάέύήϊϋΰΪΫ ]', '_', name)
+
+# A "pdf source" is either the PDF bytes (uploads) or a file path (input folder). Paths are
+# never read into memory as a whole: pypdf gets an open file handle, poppler gets the path.
+def is_pdf_bytes(pdf_src):
+    return isinstance(pdf_src, (bytes, bytearray, memoryview))
+
+def open_pdf_reader(pdf_src):
+    """PdfReader over bytes or a path. PdfReader(path) would copy the whole file into a BytesIO,
+    so paths are opened as a file handle and pages are read lazily."""
+    if is_pdf_bytes(pdf_src):
+        return PdfReader(io.BytesIO(pdf_src))
+    return PdfReader(open(pdf_src, "rb"))
+
+def source_key(name, pdf_src):
+    """Stable key of an input for the persistent indexes: absolute path, or upload:<name> for uploads."""
+    return f"upload:{name}" if is_pdf_bytes(pdf_src) else os.path.abspath(pdf_src)
+
+def unique_names(names):
+    """names with repeats made distinct ("scan.pdf", "scan (2).pdf", ...; case-insensitive, as on Windows),
+    so the per-file UI state and the output files of same-named inputs never collide."""
+    seen = set()
+    out = []
+    for name in names:
+        base, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{base} ({n}){ext}"
+        seen.add(candidate.lower())
+        out.append(candidate)
+    return out
+
+def read_pdf_bytes(pdf_src):
+    if is_pdf_bytes(pdf_src):
+        return bytes(pdf_src)
+    with open(pdf_src, "rb") as f:
+        return f.read()
+
+class FolderPdf:
+    """A PDF in the input folder, listed from directory metadata only (name, size, mtime).
+    Contents stay on disk until something reads them through .path or .read()."""
+
+    def __init__(self, path, size, mtime):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = size
+        self.mtime = mtime
+
+    def read(self):
+        return read_pdf_bytes(self.path)
+
+    def seek(self, pos):
+        pass
+
+def list_folder_pdfs(folder):
+    """FolderPdf for every *.pdf directly inside folder, sorted by name; one stat per file, no reads."""
+    files = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                st_ = entry.stat()
+                files.append(FolderPdf(entry.path, st_.st_size, st_.st_mtime))
+    return sorted(files, key=lambda f: f.name.lower())
+
+def convert_pdf_to_images(pdf_src, dpi=200, first_page=None, last_page=None):
+    """Raises on poppler errors; callers decide how to report them."""
+    if is_pdf_bytes(pdf_src):
+        return convert_from_bytes(pdf_src, dpi=dpi, first_page=first_page, last_page=last_page)
+    return convert_from_path(pdf_src, dpi=dpi, first_page=first_page, last_page=last_page)
+
+def _dpi_runs(page_indices, dpi, alone=()):
+    # page_runs() split further wherever the per-page DPI changes; pages in `alone` get a run of their own
+    for first, last in page_runs(page_indices):
+        start = first
+        for i in range(first + 1, last + 2):
+            if i > last or i in alone or i - 1 in alone or (isinstance(dpi, dict) and dpi[i] != dpi[start]):
+                yield start, i - 1, dpi[start] if isinstance(dpi, dict) else dpi
+                start = i
+
+class OcrSettings:
+    """What shapes OCR besides DPI and language: preprocessing stages and target DPI, the tile budget and
+    the tesseract binary. Passed explicitly through an OCR run, so a background job keeps the settings
+    it was queued with whatever a rerun sets meanwhile; params() is the JSON form jobs store.
+    Raises ValueError on an unknown stage or a tile budget below 1 megapixel."""
+
+    def __init__(self, preprocess=DEFAULT_PREPROCESS, target_dpi=TARGET_DPI, tile_megapixels=OCR_TILE_MEGAPIXELS,
+                 tesseract=""):
+        self.stages = parse_stages(preprocess)
+        self.target_dpi = int(target_dpi or TARGET_DPI)
+        if not tile_megapixels or float(tile_megapixels) < 1:
+            raise ValueError(f"tile budget must be at least 1 megapixel, got {tile_megapixels}")
+        self.tile_megapixels = float(tile_megapixels)
+        self.tile_max_pixels = int(self.tile_megapixels * 1_000_000)
+        self.tesseract = tesseract or "tesseract"  # blank: the one on PATH
+
+    def params(self):
+        return {"preprocess": ",".join(self.stages) or "none", "target_dpi": self.target_dpi,
+                "tile_megapixels": self.tile_megapixels, "tesseract": self.tesseract}
+
+    @classmethod
+    def from_params(cls, params):
+        """Settings stored by params(); None (jobs queued before settings were stored): the defaults."""
+        return cls(**params) if params else get_ocr_settings()
+
+    def replace(self, **changes):
+        return OcrSettings(**{**self.params(), **changes})
+
+_ocr_settings = OcrSettings()
+
+def get_ocr_settings():
+    """The defaults used where no OcrSettings is passed: set by set_ocr_preprocess(), set_ocr_tile_budget()
+    and set_tesseract_cmd() (the CLI and bench; the app passes its own per session)."""
+    return _ocr_settings
+
+class TiledPage:
+    """Stands in for the image of a page too large to render whole (iter_page_images): _timed_ocr_page
+    renders and OCRs it tile by tile (tiles.py). size: (w, h) of the full render in pixels."""
+
+    def __init__(self, pdf_src, page_idx, dpi, size):
+        self.pdf_src = pdf_src
+        self.page_idx = page_idx
+        self.dpi = dpi
+        self.size = size
+
+def _oversized_pages(pdf_src, page_indices, dpi, max_pixels):
+    # {page_idx: (w, h)} of the pages whose render at their DPI exceeds the tile budget; pdftoppm draws
+    # the media box, rotated, ceil(points / 72 * dpi) pixels a side
+    oversized = {}
+    try:
+        with get_document_cache().reader(pdf_src) as reader:
+            for i in page_indices:
+                page = reader.pages[i]
+                page_dpi = dpi[i] if isinstance(dpi, dict) else dpi
+                w, h = float(page.mediabox.width), float(page.mediabox.height)
+                if int(page.get("/Rotate", 0) or 0) % 180:
+                    w, h = h, w
+                size = (math.ceil(w * page_dpi / 72), math.ceil(h * page_dpi / 72))
+                if size[0] * size[1] > max_pixels:
+                    oversized[i] = size
+    except Exception:
+        return {}  # unreadable page tree: render whole, poppler reports what is wrong
+    return oversized
+
+def iter_page_images(pdf_src, page_indices, dpi=OCR_DPI, settings=None):
+    """Yield (page_idx, image) for the requested pages only, in the given order.
+    Contiguous runs are rendered by one pdftoppm call into a temp folder; each page file
+    is loaded, yielded and deleted before the next one, so one full-res image is held at a time.
+    Pages rendering larger than the tile budget (OcrSettings, default: get_ocr_settings()) come as a
+    TiledPage instead, rendered by the OCR worker one tile at a time.
+    dpi: one resolution for all pages, or {page_idx: dpi} (adaptive OCR plans)."""
+    page_indices = list(page_indices)
+    oversized = _oversized_pages(pdf_src, page_indices, dpi, (settings or _ocr_settings).tile_max_pixels)
+    with tempfile.TemporaryDirectory(prefix="pdfeditor_") as tmp:
+        if is_pdf_bytes(pdf_src) and len(oversized) < len(page_indices):
+            # write the PDF once instead of once per pdftoppm call (convert_from_bytes would)
+            src = os.path.join(tmp, "source.pdf")
+            with open(src, "wb") as f:
+                f.write(pdf_src)
+        else:
+            src = pdf_src
+        for first, last, run_dpi in _dpi_runs(page_indices, dpi, alone=oversized):
+            if first in oversized:
+                tracer.count("ocr.tiled_pages")
+                yield first, TiledPage(pdf_src, first, run_dpi, oversized[first])
+                continue
+            for start in range(first, last + 1, RASTER_RUN_MAX):
+                end = min(last, start + RASTER_RUN_MAX - 1)
+                with tracer.span("rasterize", pages=end - start + 1, dpi=run_dpi):
+                    paths = convert_from_path(src, dpi=run_dpi, first_page=start+1, last_page=end+1,
+                                              output_folder=tmp, paths_only=True)
+                for page_idx, path in zip(range(start, end + 1), paths):
+                    with Image.open(path) as im:
+                        im.load()
+                        img = im.copy()
+                    os.remove(path)
+                    img.info["dpi"] = (run_dpi, run_dpi)  # read by the preprocessing stage
+                    yield page_idx, img
+                    del img
+
+# pdftoppm run directly for tiles (pdf2image has no crop options); no console window on Windows
+_NO_WINDOW = {"creationflags": subprocess.CREATE_NO_WINDOW} if os.name == "nt" else {}
+
+def render_tile(pdf_path, page_idx, dpi, box, folder):
+    """The part box (x0, y0, x1, y1) of a page rendered at dpi, in pixels of the full render.
+    Raises RuntimeError with poppler's message on failure."""
+    x0, y0, x1, y1 = box
+    out = os.path.join(folder, f"tile-{page_idx}")
+    cmd = ["pdftoppm", "-r", str(dpi), "-f", str(page_idx + 1), "-l", str(page_idx + 1),
+           "-x", str(x0), "-y", str(y0), "-W", str(x1 - x0), "-H", str(y1 - y0), "-singlefile", pdf_path, out]
+    proc = subprocess.run(cmd, capture_output=True, **_NO_WINDOW)
+    if proc.returncode:
+        raise RuntimeError(f"pdftoppm failed: {proc.stderr.decode('utf-8', 'replace').strip() or proc.returncode}")
+    with Image.open(out + ".ppm") as im:
+        im.load()
+        img = im.copy()
+    os.remove(out + ".ppm")
+    img.info["dpi"] = (dpi, dpi)
+    return img
+
+def resolve_ocr_workers(workers=0, threads_per_worker=1):
+    """0 workers means auto: enough tesseract processes to fill the cores at the given OMP thread count."""
+    if workers and workers > 0:
+        return int(workers)
+    return max(1, (os.cpu_count() or 1) // max(1, int(threads_per_worker)))
+
+def set_ocr_preprocess(spec, target_dpi=TARGET_DPI):
+    """Default preprocessing before every tesseract call ("grayscale,deskew,...", a list, or "none").
+    Raises ValueError on an unknown stage."""
+    global _ocr_settings
+    _ocr_settings = _ocr_settings.replace(preprocess=spec, target_dpi=target_dpi)
+
+def set_ocr_tile_budget(megapixels):
+    """Default largest page render OCR'd in one piece; bigger pages are rendered and OCR'd in tiles of
+    at most this many pixels each (one per OCR worker in memory at a time). Raises ValueError below 1."""
+    global _ocr_settings
+    _ocr_settings = _ocr_settings.replace(tile_megapixels=megapixels)
+
+def _run_tesseract(path, lang, dpi, settings, threads):
+    # image_to_data()'s TSV, run directly: the binary comes from the run's settings and OMP_THREAD_LIMIT
+    # is set for this process only, so concurrent runs with other settings do not change each other's
+    env = dict(os.environ, OMP_THREAD_LIMIT=str(max(1, int(threads))))
+    try:
+        proc = subprocess.run([settings.tesseract, path, "stdout", "-l", lang, "--dpi", str(dpi), "tsv"],
+                              capture_output=True, env=env, **_NO_WINDOW)
+    except FileNotFoundError:
+        raise RuntimeError(f"tesseract not found: {settings.tesseract} (set its path in the settings)")
+    if proc.returncode:
+        raise RuntimeError(f"tesseract failed: {proc.stderr.decode('utf-8', 'replace').strip() or proc.returncode}")
+    return proc.stdout.decode("utf-8", "replace")
+
+def _ocr_image(img, lang, settings, threads=1):
+    # preprocess, hand to tesseract as a PBM/PGM file, OCR; (text, words) on img's pixels
+    size = img.size
+    with tracer.span("preprocess"):
+        img, transform = preprocess_image(img, settings.stages, target_dpi=settings.target_dpi)
+    t1 = time.perf_counter()
+    path = save_for_tesseract(img)
+    try:
+        t2 = time.perf_counter()
+        stage_timings.add("encode", t2 - t1)
+        # PNM carries no resolution; without --dpi tesseract guesses 70
+        with tracer.span("tesseract"):
+            tsv = _run_tesseract(path, lang, transform["dpi"], settings, threads)
+        stage_timings.add("tesseract", time.perf_counter() - t2)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return parse_tsv(tsv, transform, size)
+
+def _ocr_tiled_page(page, lang, settings, threads=1):
+    # render and OCR a TiledPage one tile at a time, then stitch the words each tile owns
+    with tempfile.TemporaryDirectory(prefix="pdfeditor_") as tmp:
+        src = page.pdf_src
+        if is_pdf_bytes(src):
+            src = os.path.join(tmp, "source.pdf")
+            with open(src, "wb") as f:
+                f.write(page.pdf_src)
+        tiles = []
+        for box, core in plan_tiles(*page.size, settings.tile_max_pixels, round(OCR_TILE_OVERLAP * page.dpi)):
+            with tracer.span("rasterize", pages=1, dpi=page.dpi, tile=True):
+                img = render_tile(src, page.page_idx, page.dpi, box, tmp)
+            _, words = _ocr_image(img, lang, settings, threads)
+            del img
+            dx, dy = box[:2]
+            tiles.append((core, [[x0 + dx, y0 + dy, x1 + dx, y1 + dy, *rest]
+                                 for x0, y0, x1, y1, *rest in words["words"]]))
+    return stitch_words(page.size, tiles)
+
+def _timed_ocr_page(img, lang, settings=None, threads=1):
+    """OCR one rendered page (or a TiledPage, tile by tile) with `settings` (OcrSettings, default:
+    get_ocr_settings()), tesseract limited to `threads` OMP threads. One tesseract call per image gives
+    the text and the word boxes (TSV), mapped back onto the rendered page.
+    Returns (text, seconds, words) with words packed for the cache (ocr_words.pack_words);
+    per-stage times go to preprocess.stage_timings."""
+    t0 = time.perf_counter()
+    settings = settings or _ocr_settings
+    with tracer.span("ocr_page"):
+        if isinstance(img, TiledPage):
+            text, words = _ocr_tiled_page(img, lang, settings, threads)
+        else:
+            text, words = _ocr_image(img, lang, settings, threads)
+    return text, time.perf_counter() - t0, pack_words(words)
+
+def ocr_pages_parallel(page_images, lang="ell+eng", workers=0, threads_per_worker=1, on_page_done=None, on_result=None,
+                       settings=None):
+    """OCR an iterable of (page_idx, image) on a pool of workers.
+    Returns [(page_idx, text, error)] in input order; error is None or the failure message.
+    on_page_done(done, page_idx, error) and on_result(page_idx, text, seconds, words) (successes only)
+    are called from the caller's thread as pages finish. settings: OcrSettings (default: get_ocr_settings()).
+    Each worker thread drives its own tesseract process (the GIL is released while it runs);
+    OMP_THREAD_LIMIT=threads_per_worker keeps the processes from oversubscribing the cores."""
+    workers = resolve_ocr_workers(workers, threads_per_worker)
+    settings = settings or _ocr_settings
+    max_in_flight = workers * 2  # bounds how many rendered pages wait in memory
+    order = []
+    results = {}
+    pending = {}
+    done_count = 0
+
+    def collect(futures):
+        nonlocal done_count
+        for fut in futures:
+            page_idx = pending.pop(fut)
+            try:
+                text, seconds, words = fut.result()
+                results[page_idx] = (text, None)
+                if on_result:
+                    on_result(page_idx, text, seconds, words)
+            except Exception as e:
+                results[page_idx] = ("", str(e) or e.__class__.__name__)
+            done_count += 1
+            if on_page_done:
+                on_page_done(done_count, page_idx, results[page_idx][1])
+
+    ocr_page = bind(_timed_ocr_page)  # workers record into the caller's trace
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+        for page_idx, img in page_images:
+            order.append(page_idx)
+            pending[pool.submit(ocr_page, img, lang, settings, threads_per_worker)] = page_idx
+            if len(pending) >= max_in_flight:
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(finished)
+        while pending:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            collect(finished)
+    return [(page_idx, results[page_idx][0], results[page_idx][1]) for page_idx in order]
+
+class OcrCache:
+    """Recognized page text in SQLite, keyed by (content hash, page, dpi, lang, tesseract version).
+    Rows carry OCR timing and the packed word boxes (NULL for rows from before word capture);
+    least recently used rows are evicted past max_bytes of text and words."""
+
+    def __init__(self, path, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._written_since_evict = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS ocr_pages (
+                doc_hash TEXT, page_idx INTEGER, dpi INTEGER, lang TEXT, engine TEXT,
+                text TEXT, ocr_seconds REAL, size INTEGER, created_at REAL, accessed_at REAL,
+                PRIMARY KEY (doc_hash, page_idx, dpi, lang, engine))""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_pages_accessed ON ocr_pages(accessed_at)")
+            if "words" not in [row[1] for row in self._conn.execute("PRAGMA table_info(ocr_pages)")]:
+                self._conn.execute("ALTER TABLE ocr_pages ADD COLUMN words BLOB")
+        self.evict()
+
+    def get_many(self, doc_hash, page_indices, dpi, lang, engine, with_words=False, column="text"):
+        """Return {page_idx: text} for the cached pages among page_indices; with_words=True only
+        counts pages whose word boxes are cached too. column="words" returns the packed words instead."""
+        found = {}
+        page_indices = list(page_indices)
+        now = time.time()
+        words_only = " AND words IS NOT NULL" if with_words or column == "words" else ""
+        with self._lock, self._conn:
+            for start in range(0, len(page_indices), 500):  # stay under SQLite's parameter limit
+                chunk = page_indices[start:start+500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT page_idx, {column} FROM ocr_pages WHERE doc_hash=? AND dpi=? AND lang=? AND engine=?{words_only} "
+                    f"AND page_idx IN ({marks})",
+                    [doc_hash, dpi, lang, engine, *chunk]).fetchall()
+                found.update(rows)
+                self._conn.execute(
+                    f"UPDATE ocr_pages SET accessed_at=? WHERE doc_hash=? AND dpi=? AND lang=? AND engine=? AND page_idx IN ({marks})",
+                    [now, doc_hash, dpi, lang, engine, *chunk])
+        tracer.cache("ocr_cache", len(found), len(page_indices) - len(found))
+        return found
+
+    def put(self, doc_hash, page_idx, dpi, lang, engine, text, ocr_seconds, words=None):
+        size = len(text.encode("utf-8")) + len(words or b"")
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO ocr_pages (doc_hash, page_idx, dpi, lang, engine, text, ocr_seconds, "
+                               "size, created_at, accessed_at, words) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                               (doc_hash, page_idx, dpi, lang, engine, text, ocr_seconds, size, now, now, words))
+            self._written_since_evict += size
+        if self._written_since_evict > self.max_bytes // 20:
+            self.evict()
+
+    def latest_pages(self, doc_hash):
+        """{page_idx: text} for every OCR'd page of a document, newest result per page (any dpi/lang/engine)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_idx, text FROM ocr_pages WHERE doc_hash=? ORDER BY created_at", (doc_hash,)).fetchall()
+        return dict(rows)
+
+    def last_write(self, doc_hash):
+        """Time of the newest OCR result for a document (0 if none)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(MAX(created_at), 0) FROM ocr_pages WHERE doc_hash=?", (doc_hash,)).fetchone()[0]
+
+    def evict(self):
+        with self._lock, self._conn:
+            self._written_since_evict = 0
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - int(self.max_bytes * 0.9)  # evict a little extra to avoid thrashing
+            rows = self._conn.execute("SELECT rowid, size FROM ocr_pages ORDER BY accessed_at").fetchall()
+            doomed = []
+            for rowid, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append((rowid,))
+                excess -= size
+            self._conn.executemany("DELETE FROM ocr_pages WHERE rowid=?", doomed)
+
+_ocr_cache = None
+
+def get_ocr_cache():
+    global _ocr_cache
+    with _singleton_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OcrCache(OCR_CACHE_PATH)
+    return _ocr_cache
+
+_TESSERACT_VERSIONS = {}
+
+def tesseract_version(cmd=None):
+    """Tesseract part of the engine id (ocr_engine()); changes when the binary (path or version) changes.
+    cmd: the tesseract binary (default: get_ocr_settings())."""
+    cmd = cmd or _ocr_settings.tesseract
+    if cmd not in _TESSERACT_VERSIONS:
+        try:
+            proc = subprocess.run([cmd, "--version"], capture_output=True, **_NO_WINDOW)
+            # "tesseract 5.3.0", "tesseract v5.3.0.20221214" (older builds print it on stderr)
+            m = re.search(r"(\d+(?:\.\d+)+)", (proc.stdout + proc.stderr).decode("utf-8", "replace"))
+            if proc.returncode or not m:
+                return "tesseract-unknown"
+            _TESSERACT_VERSIONS[cmd] = f"tesseract-{m.group(1)}"
+        except Exception:
+            return "tesseract-unknown"  # not cached: the path may be fixed on the next rerun
+    return _TESSERACT_VERSIONS[cmd]
+
+def ocr_engine(settings=None):
+    """Engine id for the OCR cache and the manifest: tesseract version plus the preprocessing setup,
+    since both change the text that comes out. settings: OcrSettings (default: get_ocr_settings())."""
+    settings = settings or _ocr_settings
+    sig = stages_signature(settings.stages, settings.target_dpi)
+    version = tesseract_version(settings.tesseract)
+    return f"{version}+{sig}" if sig else version
+
+def _cached_texts(cache, doc_hash, page_indices, page_dpi, lang, engine, with_words=False, column="text"):
+    # cache.get_many() per resolution; page_dpi: {page_idx: dpi}
+    found = {}
+    for d in sorted(set(page_dpi[i] for i in page_indices)):
+        found.update(cache.get_many(doc_hash, [i for i in page_indices if page_dpi[i] == d], d, lang, engine,
+                                    with_words=with_words, column=column))
+    return found
+
+def ocr_selected_pages(pdf_src, doc_hash: str, page_indices, dpi=OCR_DPI, lang="ell+eng",
+                       workers=0, threads_per_worker=1, on_page_done=None, plan=None, with_words=False, settings=None):
+    """OCR page_indices through the persistent cache: only cache misses are rasterized and OCR'd.
+    plan: {page_idx: (kind, dpi)} from plan_ocr_pages(); pages planned as blank or separator come back
+    with empty text without being rendered, the others are OCR'd at their planned DPI.
+    with_words=True also re-OCRs cached pages that have no word boxes (for write_searchable_pdf).
+    settings: OcrSettings (default: get_ocr_settings()).
+    Returns [(page_idx, text, error)] in page_indices order."""
+    cache = get_ocr_cache()
+    settings = settings or _ocr_settings
+    engine = ocr_engine(settings)
+    page_indices = list(page_indices)
+    page_dpi = {i: plan[i][1] if plan and i in plan else dpi for i in page_indices}  # None: skipped
+    skipped = {i for i in page_indices if page_dpi[i] is None}
+    cached = _cached_texts(cache, doc_hash, [i for i in page_indices if i not in skipped], page_dpi, lang, engine,
+                           with_words=with_words)
+    cached.update((i, "") for i in skipped)
+    done = 0
+    for page_idx in page_indices:
+        if page_idx in cached:
+            done += 1
+            if on_page_done:
+                on_page_done(done, page_idx, None)
+    missing = [i for i in page_indices if i not in cached]
+    fresh = {}
+    if missing:
+        def page_done(n, page_idx, error):
+            if on_page_done:
+                on_page_done(done + n, page_idx, error)
+
+        def store(page_idx, text, seconds, words):
+            cache.put(doc_hash, page_idx, page_dpi[page_idx], lang, engine, text, seconds, words)
+
+        images = iter_page_images(pdf_src, missing, dpi=page_dpi if plan else dpi, settings=settings)
+        for page_idx, text, error in ocr_pages_parallel(images, lang=lang, workers=workers,
+                                                        threads_per_worker=threads_per_worker,
+                                                        on_page_done=page_done, on_result=store, settings=settings):
+            fresh[page_idx] = (text, error)
+    results = []
+    for page_idx in page_indices:
+        if page_idx in cached:
+            results.append((page_idx, cached[page_idx], None))
+        elif page_idx in fresh:
+            results.append((page_idx, *fresh[page_idx]))
+    return results
+
+def set_tesseract_cmd(path):
+    """Default tesseract binary (get_ocr_settings()); blank keeps the current one."""
+    global _ocr_settings
+    if path:
+        _ocr_settings = _ocr_settings.replace(tesseract=path)
+
+def doc_key(pdf_src):
+    """Identity of a document for the in-memory caches: content hash for bytes; for paths the
+    (path, size, mtime) stat key, so a collapsed folder file never has to be read to be cached."""
+    if is_pdf_bytes(pdf_src):
+        return pdf_content_hash(pdf_src)
+    st_ = os.stat(pdf_src)
+    return f"{os.path.abspath(pdf_src)}|{st_.st_size}|{st_.st_mtime_ns}"
+
+def _close_reader(entry):
+    # close an evicted reader's file handle once whoever is reading it is done (it holds the entry lock)
+    with entry[1]:
+        if entry[0] is not None:
+            try:
+                entry[0].stream.close()
+            except Exception:
+                pass
+            entry[0] = None
+
+class DocumentCache:
+    """Parsed PdfReaders (LRU, READER_CACHE_SIZE) and extracted page text (LRU by characters),
+    shared by the page grid, the export handlers and the batch/CLI paths.
+    PdfReader is not thread-safe, so each document has its own lock; use reader() as a context manager."""
+
+    def __init__(self, max_readers=READER_CACHE_SIZE, max_text_chars=PAGE_TEXT_CACHE_CHARS):
+        self.max_readers = max_readers
+        self.max_text_chars = max_text_chars
+        self._lock = threading.Lock()
+        self._readers = OrderedDict()  # key -> [reader or None, per-document lock]
+        self._texts = OrderedDict()    # key -> {page_idx: text}
+        self._text_chars = 0
+        self._counts = {}              # key -> page count; outlives the reader, so reruns need no re-parse
+
+    @contextmanager
+    def reader(self, pdf_src, key=None):
+        key = key or doc_key(pdf_src)
+        evicted = []
+        with self._lock:
+            entry = self._readers.get(key)
+            if entry is None:
+                entry = self._readers[key] = [None, threading.Lock()]
+                while len(self._readers) > self.max_readers:
+                    evicted.append(self._readers.popitem(last=False)[1])
+            else:
+                self._readers.move_to_end(key)
+        for old in evicted:
+            _close_reader(old)
+        with entry[1]:
+            if entry[0] is None:
+                tracer.cache("readers", 0, 1)
+                with tracer.span("open_reader"):
+                    entry[0] = open_pdf_reader(pdf_src)
+            else:
+                tracer.cache("readers", 1, 0)
+            yield entry[0]
+
+    def stats(self):
+        """{"readers": parsed readers held, "documents": documents with cached text, "chars": cached characters}"""
+        with self._lock:
+            return {"readers": sum(1 for r, _ in self._readers.values() if r is not None),
+                    "documents": len(self._texts), "chars": self._text_chars}
+
+    def page_count(self, pdf_src, key=None):
+        key = key or doc_key(pdf_src)
+        with self._lock:
+            n = self._counts.get(key)
+        if n is None:
+            with self.reader(pdf_src, key) as reader:
+                n = len(reader.pages)
+            with self._lock:
+                self._counts[key] = n
+        return n
+
+    def page_texts(self, pdf_src, page_indices, key=None):
+        """[(page_idx, text)] from the text layer; pages are extracted once and then served from memory."""
+        key = key or doc_key(pdf_src)
+        page_indices = list(page_indices)
+        with self._lock:
+            known = self._texts.get(key, {})
+            texts = {i: known[i] for i in page_indices if i in known}
+        missing = [i for i in page_indices if i not in texts]
+        tracer.cache("page_text", len(texts), len(missing))
+        if missing:
+            with self.reader(pdf_src, key) as reader, tracer.span("extract_text", pages=len(missing)):
+                for i in missing:
+                    try:
+                        texts[i] = reader.pages[i].extract_text() or ""
+                    except Exception:
+                        texts[i] = ""
+            with self._lock:
+                known = self._texts.setdefault(key, {})
+                self._texts.move_to_end(key)
+                for i in missing:
+                    if i not in known:
+                        known[i] = texts[i]
+                        self._text_chars += len(texts[i])
+                while self._text_chars > self.max_text_chars and len(self._texts) > 1:
+                    _, old = self._texts.popitem(last=False)
+                    self._text_chars -= sum(len(t) for t in old.values())
+        return [(i, texts[i]) for i in page_indices]
+
+_document_cache = None
+
+def get_document_cache():
+    global _document_cache
+    with _singleton_lock:
+        if _document_cache is None:
+            _document_cache = DocumentCache()
+    return _document_cache
+
+def extract_embedded_pages(pdf_src, page_indices):
+    """[(page_idx, text)] from the PDF's own text layer; unreadable pages give "".
+    Served from the document cache, so pages already shown as snippets are not extracted again."""
+    return get_document_cache().page_texts(pdf_src, page_indices)
+
+def extract_embedded_text(pdf_src):
+    text = ""
+    try:
+        docs = get_document_cache()
+        for _, t in docs.page_texts(pdf_src, range(docs.page_count(pdf_src))):
+            text += "\n--- PAGE ---\n" + t + "\n"
+    except Exception:
+        return ""
+    return text
+
+def write_selected_pages_pdf(pdf_src, selected_indices, out_path):
+    """Write the given pages (in the given order) to out_path, overwriting it. Raises on failure.
+    Streamed to disk by the assembly engine: objects are copied losslessly, shared ones once."""
+    with tracer.span("assemble_pdf"):
+        assemble_pdf(((pdf_src, i) for i in selected_indices), out_path)
+    return True
+
+def write_merged_pdf(jobs, out_path, on_progress=None):
+    """One PDF from the selected pages of several files: jobs [(name, pdf_src, page_order)], pages
+    in job order then page order. Fonts/images shared between the inputs are stored once.
+    Returns (n_pages, n_objects, n_deduplicated). Raises on failure."""
+    with tracer.span("assemble_pdf", files=len(jobs)):
+        return assemble_pdf(((pdf_src, i) for _, pdf_src, order in jobs for i in order), out_path, on_progress=on_progress)
+
+class LruMemo:
+    """Thread-safe mapping of at most `size` entries; the least recently used is dropped first.
+    Backs the module-level memos, which would otherwise grow for the life of the app process."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def setdefault(self, key, value):
+        """The value held for key (now most recently used), else store and return value."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+            return value
+
+_path_hashes = LruMemo(MEMO_DOCUMENTS)  # (path, size, mtime) -> content hash
+
+def pdf_content_hash(pdf_src):
+    """SHA-256 of the PDF. For paths it is streamed in 1 MB chunks and memoized per (path, size, mtime)."""
+    if is_pdf_bytes(pdf_src):
+        with tracer.span("hash"):
+            return hashlib.sha256(pdf_src).hexdigest()
+    st_ = os.stat(pdf_src)
+    key = (os.path.abspath(pdf_src), st_.st_size, st_.st_mtime_ns)
+    digest = _path_hashes.get(key)
+    tracer.cache("path_hash", digest is not None, digest is None)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(pdf_src, "rb") as f, tracer.span("hash"):
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = _path_hashes.setdefault(key, sha.hexdigest())
+    return digest
+
+class ThumbnailCache:
+    """PNG thumbnails keyed by (content hash, page, dpi).
+    Two tiers: in-memory LRU bounded by a byte budget, and PNG files under THUMB_CACHE_DIR, whose
+    least recently used files (by mtime, refreshed when a file is read) are deleted past max_disk_bytes."""
+
+    def __init__(self, cache_dir, mem_budget=THUMB_MEM_BUDGET, max_disk_bytes=THUMB_DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.mem_budget = mem_budget
+        self.max_disk_bytes = max_disk_bytes
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._written_since_evict = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.evict()
+
+    def _path(self, doc_hash, page_idx, dpi):
+        return os.path.join(self.cache_dir, doc_hash[:2], f"{doc_hash}_{page_idx}_{dpi}.png")
+
+    def _remember(self, key, png):
+        with self._lock:
+            if key in self._mem:
+                self._mem_bytes -= len(self._mem.pop(key))
+            self._mem[key] = png
+            self._mem_bytes += len(png)
+            while self._mem_bytes > self.mem_budget and len(self._mem) > 1:
+                _, old = self._mem.popitem(last=False)
+                self._mem_bytes -= len(old)
+
+    def get(self, doc_hash, page_idx, dpi):
+        key = (doc_hash, page_idx, dpi)
+        with self._lock:
+            png = self._mem.get(key)
+            if png is not None:
+                self._mem.move_to_end(key)
+                return png
+        path = self._path(doc_hash, page_idx, dpi)
+        try:
+            with open(path, "rb") as f:
+                png = f.read()
+            os.utime(path)  # recently used: evicted last
+        except OSError:
+            return None
+        self._remember(key, png)
+        return png
+
+    def stats(self):
+        """{"entries", "bytes"} of the in-memory tier."""
+        with self._lock:
+            return {"entries": len(self._mem), "bytes": self._mem_bytes}
+
+    def put(self, doc_hash, page_idx, dpi, png):
+        self._remember((doc_hash, page_idx, dpi), png)
+        path = self._path(doc_hash, page_idx, dpi)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError:
+            return  # disk tier is best-effort; the memory tier still has it
+        with self._lock:
+            self._written_since_evict += len(png)
+            due = self._written_since_evict > self.max_disk_bytes // 20
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used PNG files while the disk tier is over max_disk_bytes."""
+        if not self._evict_lock.acquire(blocking=False):
+            return  # another thread is already at it
+        try:
+            with self._lock:
+                self._written_since_evict = 0
+            files = []
+            total = 0
+            try:
+                subdirs = [e.path for e in os.scandir(self.cache_dir) if e.is_dir()]
+            except OSError:
+                return
+            for sub in subdirs:
+                try:
+                    for e in os.scandir(sub):
+                        if e.name.endswith(".png"):
+                            st_ = e.stat()
+                            files.append((st_.st_mtime, st_.st_size, e.path))
+                            total += st_.st_size
+                except OSError:
+                    continue
+            if total <= self.max_disk_bytes:
+                return
+            excess = total - int(self.max_disk_bytes * 0.9)  # evict a little extra to avoid thrashing
+            for _, size, path in sorted(files):
+                if excess <= 0:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                excess -= size
+        finally:
+            self._evict_lock.release()
+
+_thumbnail_cache = None
+
+def get_thumbnail_cache():
+    # module state outlives Streamlit reruns (imported modules are not re-executed)
+    global _thumbnail_cache
+    with _singleton_lock:
+        if _thumbnail_cache is None:
+            _thumbnail_cache = ThumbnailCache(THUMB_CACHE_DIR)
+    return _thumbnail_cache
+
+def get_page_thumbnails(pdf_src, doc_hash: str, page_indices, dpi=THUMB_DPI):
+    """Return {page_idx: png_bytes}; only pages missing from both cache tiers are rasterized.
+    A page whose fingerprint is already known (page_fingerprints) reuses the thumbnail of an
+    identical page of another file."""
+    cache = get_thumbnail_cache()
+    prints = _page_prints.get(doc_hash, {})
+    thumbs = {}
+    missing = []
+    for i in page_indices:
+        png = cache.get(doc_hash, i, dpi)
+        twin = _print_thumbs.get((prints[i], dpi)) if png is None and prints.get(i) else None
+        if twin:
+            png = cache.get(*twin, dpi)
+            if png is not None:
+                tracer.count("thumbnails.shared")
+                cache.put(doc_hash, i, dpi, png)
+        if png is None:
+            missing.append(i)
+        else:
+            thumbs[i] = png
+            if prints.get(i):
+                _print_thumbs.setdefault((prints[i], dpi), (doc_hash, i))
+    tracer.cache("thumbnails", len(thumbs), len(missing))
+    for first, last in page_runs(sorted(missing)):
+        try:
+            with tracer.span("render_thumbnails", pages=last - first + 1):
+                imgs = convert_pdf_to_images(pdf_src, dpi=dpi, first_page=first+1, last_page=last+1)
+        except Exception:
+            continue  # leave these pages without a thumbnail
+        for offset, img in enumerate(imgs):
+            buf = io.BytesIO()
+            try:
+                with tracer.span("encode_png"):
+                    img.save(buf, format="PNG")
+            except Exception:
+                continue
+            png = buf.getvalue()
+            cache.put(doc_hash, first+offset, dpi, png)
+            thumbs[first+offset] = png
+            if prints.get(first+offset):
+                _print_thumbs.setdefault((prints[first+offset], dpi), (doc_hash, first+offset))
+    return thumbs
+
+# ---------------------------
+# Duplicate pages and files (dedup.py)
+# ---------------------------
+_page_prints = LruMemo(MEMO_DOCUMENTS)      # content hash -> {page_idx: fingerprint or None}
+_print_thumbs = LruMemo(MEMO_THUMB_PRINTS)  # (fingerprint, dpi) -> (content hash, page_idx) of a cached thumbnail of that page
+
+def page_fingerprints(pdf_src, page_indices, doc_hash=None):
+    """{page_idx: fingerprint or None} (dedup.page_fingerprint: what the page draws). Memoized per
+    content hash, so a file and its byte-identical copies are parsed once."""
+    doc_hash = doc_hash or pdf_content_hash(pdf_src)
+    page_indices = list(page_indices)
+    known = _page_prints.setdefault(doc_hash, {})
+    missing = [i for i in dict.fromkeys(page_indices) if i not in known]
+    tracer.cache("page_prints", len(page_indices) - len(missing), len(missing))
+    if missing:
+        memo = {}  # shared fonts and images are hashed once per call
+        with get_document_cache().reader(pdf_src) as reader, tracer.span("fingerprint", pages=len(missing)):
+            for i in missing:
+                known[i] = page_fingerprint(reader.pages[i], memo)
+    return {i: known[i] for i in page_indices}
+
+def find_duplicates(jobs, similar=False, on_progress=None):
+    """Duplicate pages across a batch. jobs: [(name, pdf_src, page_order)] with distinct names
+    (unique_names). The first occurrence, in file order and then each file's page order, is the
+    original; every later copy is reported against it.
+    similar=True also compares page thumbnails (dedup.dhash; missing ones are rendered) and reports
+    pages that look the same without being identical, e.g. one sheet scanned twice.
+    on_progress(files_done, files_total, name).
+    Returns {"files": [(name, original name)] for byte-identical files,
+    "pages": [(name, page_idx, original name, original page_idx, "same"|"similar")], "errors": [(name, error)]}."""
+    found = {"files": [], "pages": [], "errors": []}
+    by_hash = {}
+    by_print = {}
+    looks = SimilarIndex()
+    for n, (name, pdf_src, order) in enumerate(jobs):
+        try:
+            doc_hash = pdf_content_hash(pdf_src)
+            prints = page_fingerprints(pdf_src, order, doc_hash)
+            thumbs = get_page_thumbnails(pdf_src, doc_hash, order) if similar else {}
+        except Exception as e:
+            found["errors"].append((name, str(e) or e.__class__.__name__))
+            continue
+        if doc_hash in by_hash:
+            found["files"].append((name, by_hash[doc_hash]))
+        by_hash.setdefault(doc_hash, name)
+        for page_idx in order:
+            page = (name, page_idx)
+            original = by_print.setdefault(prints[page_idx], page) if prints[page_idx] else page
+            if original != page:
+                found["pages"].append((*page, *original, "same"))
+                continue
+            try:
+                h = dhash(thumbs[page_idx]) if page_idx in thumbs else None
+            except Exception:
+                h = None
+            if h is None:
+                continue  # no thumbnail, or a blank page: nothing to compare
+            original = looks.find(h)
+            if original and original != page:
+                found["pages"].append((*page, *original, "similar"))
+            else:
+                looks.add(h, page)
+        if on_progress:
+            on_progress(n + 1, len(jobs), name)
+    return found
+
+def drop_duplicate_pages(jobs, duplicates):
+    """jobs ([(name, pdf_src, page_order)]) without the pages find_duplicates() reported."""
+    drop = {(name, page_idx) for name, page_idx, *_ in duplicates["pages"]}
+    return [(name, pdf_src, [i for i in order if (name, i) not in drop]) for name, pdf_src, order in jobs]
+
+def plan_ocr_pages(pdf_src, doc_hash: str, page_indices, dpi=OCR_DPI):
+    """Adaptive OCR: decide per page from its cached low-resolution thumbnail (preprocess.plan_page).
+    Returns {page_idx: (kind, dpi)}: ("ocr", dpi chosen for the page's text size), ("blank", None) or
+    ("separator", None). Pages without a thumbnail are OCR'd at `dpi`."""
+    page_indices = list(page_indices)
+    thumbs = {}
+    for start in range(0, len(page_indices), PLAN_THUMB_CHUNK):
+        # thumbnails missing from the cache are rendered a run at a time: keep the runs short
+        thumbs.update(get_page_thumbnails(pdf_src, doc_hash, page_indices[start:start + PLAN_THUMB_CHUNK]))
+    plan = {}
+    for page_idx in page_indices:
+        plan[page_idx] = ("ocr", dpi)
+        png = thumbs.get(page_idx)
+        if png is None:
+            continue
+        try:
+            with Image.open(io.BytesIO(png)) as img:
+                plan[page_idx] = plan_page(img, THUMB_DPI, dpi)
+        except Exception:
+            pass
+    return plan
+
+def plan_summary(plan):
+    """One line for the UI/CLI, e.g. "9 page(s) OCR'd (200 DPI ×3, 300 DPI ×6); skipped 2 blank, 1 separator"."""
+    dpis = {}
+    skipped = {}
+    for kind, page_dpi in plan.values():
+        if kind == "ocr":
+            dpis[page_dpi] = dpis.get(page_dpi, 0) + 1
+        else:
+            skipped[kind] = skipped.get(kind, 0) + 1
+    line = f"{sum(dpis.values())} page(s) OCR'd"
+    if dpis:
+        line += " (" + ", ".join(f"{d} DPI ×{n}" for d, n in sorted(dpis.items())) + ")"
+    if skipped:
+        line += "; skipped " + ", ".join(f"{n} {kind}" for kind, n in sorted(skipped.items()))
+    return line
+
+ENGINE_LABELS = {"text": "text layer", "ocr": "OCR", "blank": "blank page, not OCR'd",
+                 "separator": "separator sheet, not OCR'd"}
+
+def ocr_pages_to_text(ocr_results, engines=None):
+    """Page texts joined with --- PAGE N --- dividers; with engines ({page_idx: "text"|"ocr"})
+    the divider also records which engine produced the page."""
+    if engines is None:
+        return "".join(f"\n--- PAGE {page_idx+1} ---\n{txt}\n" for page_idx, txt in ocr_results)
+    return "".join(f"\n--- PAGE {page_idx+1} ({ENGINE_LABELS.get(engines.get(page_idx), '?')}) ---\n{txt}\n"
+                   for page_idx, txt in ocr_results)
+
+def ocr_pages_preview(ocr_results, limit=1000, engines=None):
+    """The first `limit` characters of ocr_pages_to_text(), without joining the whole document."""
+    parts = []
+    n = 0
+    for page_idx, txt in ocr_results:
+        if n > limit:
+            return "".join(parts)[:limit] + "..."
+        part = ocr_pages_to_text([(page_idx, txt)], engines=engines)
+        parts.append(part)
+        n += len(part)
+    text = "".join(parts)
+    return text[:limit] + ("..." if n > limit else "")
+
+_CID_RE = re.compile(r"\(cid:\d+\)")
+_TEXT_PUNCT = set(".,;:!?'\"()[]{}-–—_/\\%&@#*+=<>«»·€$§°")
+
+def text_layer_quality(text: str):
+    """Share of non-space characters that look like real text (letters, digits, common punctuation)."""
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    return sum(1 for c in chars if c.isalnum() or c in _TEXT_PUNCT) / len(chars)
+
+def page_has_full_page_image(page):
+    """True when the page's resources contain an image with the page's aspect ratio at >= ~50 DPI,
+    i.e. what a scanner produces. Only the resource dictionary is inspected, not the content stream."""
+    try:
+        resources = (page.get("/Resources") or {}).get_object()
+        xobjects = resources.get("/XObject")
+        if not xobjects:
+            return False
+        xobjects = xobjects.get_object()
+        page_w, page_h = float(page.mediabox.width), float(page.mediabox.height)
+        page_ratio = page_w / page_h
+        for name in xobjects:
+            xobj = xobjects[name].get_object()
+            if xobj.get("/Subtype") != "/Image":
+                continue
+            w, h = float(xobj.get("/Width", 0)), float(xobj.get("/Height", 0))
+            if not w or not h:
+                continue
+            for a, b, span in ((w, h, page_w), (h, w, page_h)):  # either orientation
+                if abs(a / b - page_ratio) < 0.1 * page_ratio and a >= span * 0.7:
+                    return True
+    except Exception:
+        return False
+    return False
+
+def classify_page_text(page, text: str):
+    """"text" when the page's own text layer is usable as-is, "ocr" when it has to be OCR'd."""
+    body = _CID_RE.sub("\ufffd", text)
+    n_chars = sum(1 for c in body if not c.isspace())
+    if n_chars < TEXT_LAYER_MIN_CHARS or text_layer_quality(body) < TEXT_LAYER_MIN_QUALITY:
+        return "ocr"
+    if n_chars < SCAN_PAGE_TEXT_CHARS and page_has_full_page_image(page):
+        return "ocr"  # a scan with a stamp or header as its only text
+    return "text"
+
+def classify_pages(pdf_src, page_indices):
+    """[(page_idx, "text"|"ocr", text_layer)] using the cached text layer."""
+    docs = get_document_cache()
+    texts = docs.page_texts(pdf_src, page_indices)
+    with docs.reader(pdf_src) as reader:
+        return [(i, classify_page_text(reader.pages[i], t), t) for i, t in texts]
+
+def prepare_pdf(pdf_src, view=None):
+    """Load-time preparation of one file: page count and, for the pages view(page_count) returns (the
+    grid page about to be shown), thumbnails, text layer and text-layer classification. Everything
+    lands in the shared caches, so the page grid's own lookups are hits.
+    Returns {"pages": n, "engines": {page_idx: "text"|"ocr"}}."""
+    n = get_document_cache().page_count(pdf_src)
+    pages = [i for i in (view(n) if view else ()) if 0 <= i < n]
+    engines = {}
+    if pages:
+        doc_hash = pdf_content_hash(pdf_src)
+        try:
+            page_fingerprints(pdf_src, pages, doc_hash)  # identical pages of other files share their thumbnails
+        except Exception:
+            pass
+        get_page_thumbnails(pdf_src, doc_hash, pages)
+        engines = {i: engine for i, engine, _ in classify_pages(pdf_src, pages)}
+    return {"pages": n, "engines": engines}
+
+_prepare_pool = None
+
+def submit_prepare(pdf_src, view=None, name=None):
+    """prepare_pdf() in the shared load-time pool (PREPARE_WORKERS threads); returns its Future."""
+    global _prepare_pool
+    with _singleton_lock:
+        if _prepare_pool is None:
+            _prepare_pool = ThreadPoolExecutor(max_workers=PREPARE_WORKERS, thread_name_prefix="prepare")
+
+    def run():
+        with tracer.span("prepare", file=name):
+            return prepare_pdf(pdf_src, view)
+    return _prepare_pool.submit(bind(run))
+
+def hybrid_selected_pages(pdf_src, doc_hash: str, page_indices, dpi=OCR_DPI, lang="ell+eng",
+                          workers=0, threads_per_worker=1, on_page_done=None, adaptive=False, settings=None):
+    """Text layer where it is usable, OCR (through the cache, with `settings`) only for the other pages.
+    adaptive=True plans the OCR pages with plan_ocr_pages(); the plan is returned for the labels.
+    Returns ([(page_idx, text, error, engine)] in page_indices order, plan or None);
+    engine is "text", "ocr", "blank" or "separator"."""
+    kinds = classify_pages(pdf_src, page_indices)
+    done = 0
+    for page_idx, kind, _ in kinds:
+        if kind == "text":
+            done += 1
+            if on_page_done:
+                on_page_done(done, page_idx, None)
+    ocr_pages = [i for i, kind, _ in kinds if kind == "ocr"]
+    plan = plan_ocr_pages(pdf_src, doc_hash, ocr_pages, dpi) if adaptive and ocr_pages else None
+    ocr_results = {}
+    if ocr_pages:
+        def page_done(n, page_idx, error):
+            if on_page_done:
+                on_page_done(done + n, page_idx, error)
+        for page_idx, text, error in ocr_selected_pages(pdf_src, doc_hash, ocr_pages, dpi=dpi, lang=lang, workers=workers,
+                                                        threads_per_worker=threads_per_worker, on_page_done=page_done,
+                                                        plan=plan, settings=settings):
+            ocr_results[page_idx] = (text, error)
+    results = []
+    for page_idx, kind, text in kinds:
+        if kind == "text":
+            results.append((page_idx, text, None, "text"))
+        elif page_idx in ocr_results:
+            results.append((page_idx, *ocr_results[page_idx], plan[page_idx][0] if plan else "ocr"))
+    return results, plan
+
+def run_ocr_batch(jobs, out_folder, dpi=OCR_DPI, lang="ell+eng", workers=0, threads_per_worker=1,
+                  on_progress=None, cancel_event=None, hybrid=False, adaptive=False, on_plan=None, searchable=False,
+                  settings=None):
+    """Rasterize -> OCR -> DOCX pipeline over many files.
+    jobs: [(name, pdf_src, page_order)]. A rasterizer thread hashes each file and feeds a bounded page queue,
+    OCR worker threads drain it, and the calling thread caches results and streams each page into its
+    file's DOCX as soon as the pages before it are in, so memory stays flat however many files and
+    pages are queued.
+    on_progress(done_pages, total_pages, name, file_done, file_total, finished) runs in the calling
+    thread; finished is (out_path, errors) once that file's DOCX is written, else None.
+    hybrid=True takes pages with a usable text layer as-is and only rasterizes/OCRs the rest;
+    each DOCX page is then labelled with its engine.
+    adaptive=True plans the pages to OCR from their thumbnails (plan_ocr_pages): each is rendered at
+    the DPI its text size needs, blank pages and separator sheets are not rendered at all, and every
+    DOCX page is labelled with the decision. on_plan(name, plan) reports each file's plan (rasterizer thread).
+    searchable=True also writes each file's pages with an invisible text layer (write_searchable_pdf,
+    to searchable_output_path) from the same OCR pass; a failure there is one of the file's errors.
+    A page identical to one already queued in the batch (page_fingerprints: a cover sheet repeated
+    across files, a file included twice) is neither rendered nor OCR'd again: it gets that page's result.
+    settings: OcrSettings for the whole run (default: get_ocr_settings() as it is at the start).
+    Returns [(name, out_path or None, [(page_idx or None, error)])]."""
+    cache = get_ocr_cache()
+    settings = settings or _ocr_settings
+    engine = ocr_engine(settings)
+    workers = resolve_ocr_workers(workers, threads_per_worker)
+    cancel_event = cancel_event or threading.Event()
+    page_q = queue.Queue(maxsize=workers * BATCH_PAGES_PER_WORKER)
+    result_q = queue.Queue()  # text and packed word boxes; small
+
+    def put_page(item):
+        # blocking put that still notices cancellation
+        while not cancel_event.is_set():
+            try:
+                page_q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def rasterize():
+        try:
+            for job_i, (name, pdf_src, order) in enumerate(jobs):
+                if cancel_event.is_set():
+                    break
+                try:
+                    doc_hashes[job_i] = pdf_content_hash(pdf_src)
+                except Exception as e:
+                    result_q.put((job_i, None, "", f"cannot read file: {e}", None, None, None))
+                    continue
+                wanted = sorted(set(order))
+                if hybrid:
+                    try:
+                        kinds = classify_pages(pdf_src, wanted)
+                    except Exception as e:
+                        result_q.put((job_i, None, "", f"cannot read text layer: {e}", None, None, None))
+                        continue
+                    for page_idx, kind, text in kinds:
+                        if kind == "text":
+                            result_q.put((job_i, page_idx, text, None, None, "text", None))
+                    wanted = [page_idx for page_idx, kind, _ in kinds if kind == "ocr"]
+                if adaptive and wanted:
+                    plan = plan_ocr_pages(pdf_src, doc_hashes[job_i], wanted, dpi)
+                    if on_plan:
+                        on_plan(name, plan)
+                    for page_idx, (kind, page_dpi) in plan.items():
+                        page_dpis[job_i][page_idx] = page_dpi
+                        if kind != "ocr":
+                            result_q.put((job_i, page_idx, "", None, None, kind, None))
+                    wanted = [page_idx for page_idx in wanted if plan[page_idx][0] == "ocr"]
+                else:
+                    page_dpis[job_i] = dict.fromkeys(wanted, dpi)
+                cached = _cached_texts(cache, doc_hashes[job_i], wanted, page_dpis[job_i], lang, engine, with_words=searchable)
+                for page_idx in wanted:
+                    if page_idx in cached:
+                        result_q.put((job_i, page_idx, cached[page_idx], None, None, "ocr", None))
+                render = share_pages(job_i, pdf_src, wanted, cached)
+                pages = iter_page_images(pdf_src, render, dpi=page_dpis[job_i], settings=settings)
+                queued = set()
+                failed = False
+                try:
+                    for page_idx, img in pages:
+                        if not put_page((job_i, page_idx, img)):
+                            break
+                        queued.add(page_idx)
+                except Exception as e:
+                    failed = True
+                    result_q.put((job_i, None, "", f"rasterization failed: {e}", None, None, None))
+                finally:
+                    pages.close()
+                if not cancel_event.is_set():
+                    # pages that never reached the OCR queue (failure, or pdftoppm rendered fewer than asked)
+                    # stop being originals before the next file is shared against them: its copies are rendered
+                    # themselves, and copies already waiting get the error
+                    for page_idx in render:
+                        if page_idx not in queued:
+                            release_copies(job_i, page_idx, "", "page was not rendered", None)
+                            if not failed:
+                                result_q.put((job_i, page_idx, "", "page was not rendered", None, "ocr", None))
+        finally:
+            for _ in range(workers):
+                page_q.put(None)
+
+    def share_pages(job_i, pdf_src, wanted, cached):
+        # pages identical to one already queued are not rendered: they get its result when it comes in,
+        # or from the cache when it already has; cached pages serve as originals for later files.
+        # Returns the pages that need rendering.
+        todo = [i for i in wanted if i not in cached]
+        try:
+            prints = page_fingerprints(pdf_src, wanted, doc_hashes[job_i])
+        except Exception:
+            return todo
+        with share_lock:
+            for page_idx in cached:
+                if prints[page_idx]:
+                    leaders.setdefault((prints[page_idx], page_dpis[job_i][page_idx]), (job_i, page_idx))
+        render = []
+        for page_idx in todo:
+            key = (prints[page_idx], page_dpis[job_i][page_idx])
+            with share_lock:
+                original = leaders.get(key) if key[0] else None
+                if original is None:
+                    if key[0]:
+                        leaders[key] = (job_i, page_idx)
+                        pending_leaders[(job_i, page_idx)] = key
+                    render.append(page_idx)
+                    continue
+                if original in pending_leaders:
+                    copies.setdefault(key, []).append((job_i, page_idx))
+                    continue
+            orig_job, orig_page = original
+            hit = cache.get_many(doc_hashes[orig_job], [orig_page], key[1], lang, engine, with_words=searchable)
+            if orig_page not in hit:
+                render.append(page_idx)  # evicted meanwhile
+                continue
+            words = cache.get_many(doc_hashes[orig_job], [orig_page], key[1], lang, engine, column="words") if searchable else {}
+            tracer.count("ocr.shared_pages")
+            result_q.put((job_i, page_idx, hit[orig_page], None, 0.0, "ocr", words.get(orig_page)))
+        return render
+
+    def release_copies(job_i, page_idx, text, error, words):
+        # hand a page's result to the identical pages waiting on it
+        with share_lock:
+            key = pending_leaders.pop((job_i, page_idx), None)
+            waiting = copies.pop(key, []) if key else []
+            if key and error:
+                leaders.pop(key, None)  # copies queued from now on are rendered themselves
+        for copy_job, copy_page in waiting:
+            tracer.count("ocr.shared_pages")
+            result_q.put((copy_job, copy_page, text, error, None if error else 0.0, "ocr", words))
+
+    def ocr_worker():
+        while True:
+            item = page_q.get()
+            if item is None:
+                return
+            job_i, page_idx, img = item
+            if cancel_event.is_set():
+                continue  # drain without working
+            try:
+                text, seconds, words = _timed_ocr_page(img, lang, settings, threads_per_worker)
+                result_q.put((job_i, page_idx, text, None, seconds, "ocr", words))
+            except Exception as e:
+                result_q.put((job_i, page_idx, "", str(e) or e.__class__.__name__, None, "ocr", None))
+
+    threads = [threading.Thread(target=bind(rasterize), name="batch-raster", daemon=True)]
+    threads += [threading.Thread(target=bind(ocr_worker), name=f"batch-ocr-{n}", daemon=True) for n in range(workers)]
+    wanted_per_job = [set(order) for _, _, order in jobs]
+    doc_hashes = [None] * len(jobs)  # filled by the rasterizer before any page of that job is queued
+    page_dpis = [{} for _ in jobs]  # likewise: {page_idx: render DPI, None when the plan skips the page}
+    # pages shared by fingerprint: (fingerprint, dpi) -> the (job_i, page_idx) rendered for it; the
+    # rasterizer adds, the calling thread releases the copies once that page's result is in
+    share_lock = threading.Lock()
+    leaders = {}
+    pending_leaders = {}  # (job_i, page_idx) -> key, until its result arrives
+    copies = {}           # key -> [(job_i, page_idx)] waiting for that result
+    # pages arrive out of order; each is held only until everything before it in the file's order
+    # is there, then streamed into that file's DOCX and dropped
+    texts = [{} for _ in jobs]
+    engines = [{} for _ in jobs]
+    received = [0] * len(jobs)
+    writers = [None] * len(jobs)  # DocxStreamWriter once the first page arrived; False after a write error
+    next_pos = [0] * len(jobs)
+    last_pos = [{p: i for i, p in enumerate(order)} for _, _, order in jobs]
+    errors = [[] for _ in jobs]
+    results = [None] * len(jobs)
+    total = sum(len(w) for w in wanted_per_job)
+    done = 0
+
+    def flush(job_i, final=False):
+        # write the pages that are next in order; final=True also writes missing ones as empty pages
+        if writers[job_i] is False or not received[job_i]:
+            return
+        name, _, order = jobs[job_i]
+        pending = texts[job_i]
+        try:
+            while next_pos[job_i] < len(order):
+                page_idx = order[next_pos[job_i]]
+                if page_idx not in pending and not final:
+                    break
+                if writers[job_i] is None:
+                    writers[job_i] = DocxStreamWriter(docx_output_path(out_folder, name), title=name)
+                label = None
+                if hybrid or adaptive:
+                    label = engine_label(page_idx, engines[job_i].get(page_idx),
+                                         page_dpis[job_i].get(page_idx) if adaptive else None)
+                writers[job_i].add_page(pending.get(page_idx, ""), label=label)
+                if last_pos[job_i][page_idx] == next_pos[job_i]:
+                    pending.pop(page_idx, None)
+                    engines[job_i].pop(page_idx, None)
+                next_pos[job_i] += 1
+        except Exception as e:
+            errors[job_i].append((None, f"DOCX export failed: {e}"))
+            if writers[job_i]:
+                writers[job_i].abort()
+            writers[job_i] = False
+            texts[job_i] = {}
+
+    def finish(job_i):
+        name = jobs[job_i][0]
+        flush(job_i, final=True)
+        out_path = None
+        if writers[job_i]:
+            try:
+                out_path = writers[job_i].close()
+            except Exception as e:
+                errors[job_i].append((None, f"DOCX export failed: {e}"))
+        writers[job_i] = None
+        if searchable and received[job_i] and doc_hashes[job_i]:
+            try:
+                write_searchable_pdf(jobs[job_i][1], doc_hashes[job_i], jobs[job_i][2],
+                                     searchable_output_path(out_folder, name), page_dpis[job_i], lang, engine)
+            except Exception as e:
+                errors[job_i].append((None, f"searchable PDF export failed: {e}"))
+        results[job_i] = (name, out_path, errors[job_i])
+        texts[job_i] = {}
+        engines[job_i] = {}
+        return out_path
+
+    for job_i, wanted in enumerate(wanted_per_job):
+        if not wanted:
+            finish(job_i)
+    for t in threads:
+        t.start()
+    try:
+        while any(r is None for r in results):
+            try:
+                job_i, page_idx, text, error, seconds, page_engine, words = result_q.get(timeout=0.2)
+            except queue.Empty:
+                if cancel_event.is_set() or not any(t.is_alive() for t in threads):
+                    break
+                continue
+            if page_idx is not None:
+                if not error and seconds is not None:
+                    cache.put(doc_hashes[job_i], page_idx, page_dpis[job_i][page_idx], lang, engine, text, seconds, words)
+                release_copies(job_i, page_idx, text, error, words)
+            if results[job_i] is not None:
+                continue  # file already closed after a rasterization failure
+            name = jobs[job_i][0]
+            if page_idx is None:
+                # the rest of this file will never arrive
+                errors[job_i].append((None, error))
+                remaining = len(wanted_per_job[job_i]) - received[job_i]
+                done += remaining
+                finished = (finish(job_i), errors[job_i])
+                if on_progress:
+                    on_progress(done, total, name, len(wanted_per_job[job_i]), len(wanted_per_job[job_i]), finished)
+                continue
+            if error:
+                errors[job_i].append((page_idx, error))
+            texts[job_i][page_idx] = text
+            engines[job_i][page_idx] = page_engine
+            received[job_i] += 1
+            done += 1
+            finished = None
+            file_done = received[job_i]
+            if file_done == len(wanted_per_job[job_i]):
+                finished = (finish(job_i), errors[job_i])
+            else:
+                flush(job_i)
+            if on_progress:
+                on_progress(done, total, name, file_done, len(wanted_per_job[job_i]), finished)
+        if not cancel_event.is_set():
+            # stages ended without delivering some pages (e.g. pdftoppm rendered fewer than asked)
+            for job_i, r in enumerate(results):
+                if r is None:
+                    errors[job_i].append((None, "some pages could not be rendered"))
+                    finish(job_i)
+    finally:
+        cancel_event.set()  # stops the stages if we exit early (cancel, rerun, error)
+        for writer in writers:
+            if writer:
+                writer.abort()  # unfinished files leave no partial DOCX behind
+        for t in threads:
+            t.join(timeout=5)
+    return [r for r in results if r is not None]
+
+def docx_output_path(out_folder, name):
+    # no timestamp, overwrite allowed
+    return os.path.join(out_folder, f"{os.path.splitext(name)[0]}.docx")
+
+def searchable_output_path(out_folder, name):
+    # next to the DOCX; the plain "<name>.pdf" is what Save PDF writes
+    return os.path.join(out_folder, f"{os.path.splitext(name)[0]}_ocr.pdf")
+
+def write_searchable_pdf(pdf_src, doc_hash, page_order, out_path, page_dpi, lang, engine=None, on_progress=None):
+    """The pages in page_order, copied losslessly, each OCR'd one with an invisible text layer built
+    from the word boxes in the OCR cache (no OCR happens here: run it with with_words=True first).
+    page_dpi: {page_idx: dpi the page was OCR'd at}; pages missing from it (text layer, blank,
+    separator) or without cached words are copied as they are.
+    Returns (n_pages, n_pages_with_text_layer). Raises on failure."""
+    engine = engine or ocr_engine()
+    wanted = [i for i in dict.fromkeys(page_order) if page_dpi.get(i)]
+    blobs = _cached_texts(get_ocr_cache(), doc_hash, wanted, page_dpi, lang, engine, column="words")
+    docs = get_document_cache()
+    sizes = {}
+    with docs.reader(pdf_src) as reader:
+        for i in blobs:
+            page = reader.pages[i]
+            w, h = float(page.mediabox.width), float(page.mediabox.height)
+            sizes[i] = (h, w) if int(page.get("/Rotate", 0) or 0) % 180 else (w, h)
+    overlay_pages = {i: n for n, i in enumerate(blobs)}
+    layer = io.BytesIO()
+    with tracer.span("build_text_layer", pages=len(blobs)):
+        build_text_layer(layer, ((*sizes[i], unpack_words(blobs[i])) for i in overlay_pages))
+    layer = layer.getvalue()
+    with tracer.span("assemble_pdf", searchable=True):
+        n_pages, _, _ = assemble_pdf(((pdf_src, i, (layer, overlay_pages[i]) if i in overlay_pages else None)
+                                      for i in page_order), out_path, on_progress=on_progress)
+    return n_pages, len(overlay_pages)
+
+def engine_label(page_idx, engine, dpi=None):
+    label = f"Page {page_idx+1} · {ENGINE_LABELS.get(engine, '?')}"
+    return f"{label} @ {dpi} DPI" if dpi and engine == "ocr" else label
+
+def save_docx(pages, out_path, title=None, engines=None, plan=None):
+    """Stream [(page_idx, text)] straight into out_path: one paragraph per text block, a real page
+    break between pages; with engines ({page_idx: "text"|"ocr"|...}) each page is labelled with its
+    engine, and with an adaptive plan (plan_ocr_pages) OCR'd pages also with their DPI.
+    Returns out_path."""
+    labels = None
+    if engines or plan:
+        labels = {}
+        for i in set(engines or ()) | set(plan or ()):
+            kind, page_dpi = (plan or {}).get(i, ("ocr", None))
+            engine = (engines or {}).get(i, kind)
+            labels[i] = engine_label(i, engine, page_dpi)
+    with tracer.span("write_docx"):
+        return write_docx(pages, out_path, title=title, labels=labels)
@@ -0,0 +1,221 @@
+# perf.py
+# Hot-path instrumentation shared by app.py, cli.py and pdf_core: named timing spans (nested per
+# thread), cache hit/miss counters and process memory, collected per run (a Streamlit rerun or a CLI
+# invocation). A run can be summarised for the UI panel / CLI report, or dumped in Chrome trace-event
+# format (open in chrome://tracing or ui.perfetto.dev) for offline analysis.
+# `tracer` records into the Tracer made current by use_tracer() (each app session and each background
+# job has its own), else into one process-wide Tracer (CLI, bench). Threads started for a run are
+# wrapped with bind() so their spans land in the run that started them.
+# Spans cost two perf_counter() calls and a list append; past TRACE_MAX_SPANS per run only the
+# totals are kept, so leaving the hooks in is free in practice.
+
+import contextvars, json, os, sys, threading, time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+TRACE_MAX_SPANS = 50_000  # individual spans kept per run for dumps; totals are always complete
+TRACE_KEEP_FILES = 200    # newest trace dumps kept per folder (one per rerun adds up)
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class _Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = _Counters()
+        counters.cb = ctypes.sizeof(counters)
+        proc = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(proc, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+class Tracer:
+    """Spans and counters of the current run. Thread-safe: OCR workers and the batch rasterizer
+    record into the same run; nesting is tracked per thread, so a span's path is the chain of
+    spans open in its own thread ("export.ocr_docx > rasterize")."""
+
+    def __init__(self, max_spans=TRACE_MAX_SPANS):
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.begin()
+
+    def begin(self, label="run"):
+        """Start a new run: previous spans and counters are dropped."""
+        with self._lock:
+            self.label = label
+            self.started = time.time()
+            self._t0 = time.perf_counter()
+            self._spans = []     # (path, name, start, seconds, thread name, attrs)
+            self._totals = {}    # path -> [calls, seconds]
+            self._counters = {}
+            self._dropped = 0
+            self.rss_start = current_rss()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = " > ".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                total = self._totals.setdefault(path, [0, 0.0])
+                total[0] += 1
+                total[1] += seconds
+                if len(self._spans) < self.max_spans:
+                    self._spans.append((path, name, start - self._t0, seconds, threading.current_thread().name, attrs))
+                else:
+                    self._dropped += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def cache(self, name, hits, misses):
+        """Record cache lookups as "<name>.hit" / "<name>.miss" counters."""
+        if hits:
+            self.count(f"{name}.hit", hits)
+        if misses:
+            self.count(f"{name}.miss", misses)
+
+    def summary(self):
+        """{"label", "seconds", "spans": {path: (calls, seconds)}, "caches": {name: (hits, misses)},
+        "counters": {other counters}, "rss_start", "rss_now", "dropped"} for the run so far."""
+        with self._lock:
+            counters = dict(self._counters)
+            spans = {path: tuple(v) for path, v in self._totals.items()}
+            seconds = time.perf_counter() - self._t0
+            dropped = self._dropped
+        caches = {}
+        for key in list(counters):
+            base, _, kind = key.rpartition(".")
+            if kind in ("hit", "miss"):
+                hits, misses = caches.get(base, (0, 0))
+                n = counters.pop(key)
+                caches[base] = (hits + n, misses) if kind == "hit" else (hits, misses + n)
+        return {"label": self.label, "seconds": seconds, "spans": spans, "caches": caches, "counters": counters,
+                "rss_start": self.rss_start, "rss_now": current_rss(), "dropped": dropped}
+
+    def dump(self, folder, keep=TRACE_KEEP_FILES):
+        """Write the run as a Chrome trace-event JSON file in folder, dropping all but the newest
+        `keep` trace files there; returns its path."""
+        with self._lock:
+            spans = list(self._spans)
+            counters = dict(self._counters)
+            label, started = self.label, self.started
+        pid = os.getpid()
+        tids = {}
+        events = []
+        for path, name, start, seconds, thread, attrs in spans:
+            tid = tids.setdefault(thread, len(tids) + 1)
+            args = {"path": path, **{k: v if isinstance(v, (int, float, bool)) or v is None else str(v) for k, v in attrs.items()}}
+            events.append({"name": name, "ph": "X", "ts": round(start * 1e6, 1), "dur": round(seconds * 1e6, 1),
+                           "pid": pid, "tid": tid, "args": args})
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+                   for thread, tid in tids.items()]
+        os.makedirs(folder, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)[:40]
+        path = os.path.join(folder, f"trace-{stamp}-{int(started * 1000) % 1000:03d}-{safe_label}.json")
+        tmp = f"{path}.{pid}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"label": label, "started": started, "counters": counters}}, f)
+        os.replace(tmp, path)
+        traces = sorted(f for f in os.listdir(folder) if f.startswith("trace-") and f.endswith(".json"))
+        for old in traces[:-keep] if keep else ():
+            try:
+                os.remove(os.path.join(folder, old))
+            except OSError:
+                pass
+        return path
+
+_process_tracer = Tracer()
+_current = contextvars.ContextVar("perf_tracer", default=None)
+
+def current_tracer():
+    """The Tracer `tracer` records into here: the one set by use_tracer(), else the process-wide one."""
+    return _current.get() or _process_tracer
+
+def use_tracer(run):
+    """Make `run` (a Tracer) the current one for this thread / context, until use_tracer() is called
+    again or, used as a context manager, until the block ends."""
+    return _Use(_current.set(run))
+
+class _Use:
+    def __init__(self, token):
+        self._token = token
+
+    def __enter__(self):
+        return _current.get()
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+def bind(fn):
+    """fn wrapped to record into the caller's current Tracer from whatever thread runs it (threads
+    and pool workers do not inherit the caller's context)."""
+    run = _current.get()
+    if run is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        with use_tracer(run):
+            return fn(*args, **kwargs)
+    return bound
+
+class _CurrentTracer:
+    """Module-level `tracer`: forwards to current_tracer(), so call sites need not know whose run it is."""
+
+    def __getattr__(self, name):
+        return getattr(current_tracer(), name)
+
+tracer = _CurrentTracer()
+
+def format_summary(summary, limit=None):
+    """Text lines for a summary(): spans with their share of the run (children indented under
+    their parent), cache hit rates and memory."""
+    lines = [f"{summary['label']}: {summary['seconds']:.2f}s"]
+    spans = sorted(summary["spans"].items())  # parents sort right before their children
+    if limit:
+        spans = spans[:limit]
+    for path, (calls, seconds) in spans:
+        depth = path.count(" > ")
+        name = path.rsplit(" > ", 1)[-1]
+        share = seconds / summary["seconds"] * 100 if summary["seconds"] else 0
+        lines.append(f"{'  ' * (depth + 1)}{name}: {seconds * 1000:.0f} ms in {calls} call(s) ({share:.0f}%)")
+    for name, (hits, misses) in sorted(summary["caches"].items()):
+        lines.append(f"  cache {name}: {hits}/{hits + misses} hits ({hits / (hits + misses):.0%})")
+    for name, n in sorted(summary["counters"].items()):
+        lines.append(f"  {name}: {n}")
+    if summary["rss_now"] is not None:
+        start = summary["rss_start"] or summary["rss_now"]
+        lines.append(f"  memory: {summary['rss_now'] / 2**20:.0f} MB RSS ({(summary['rss_now'] - start) / 2**20:+.0f} MB this run)")
+    if summary["dropped"]:
+        lines.append(f"  ({summary['dropped']} span(s) past the per-run limit kept in totals only)")
+    return lines
@@ -0,0 +1,363 @@
+# preprocess.py
+# Image preprocessing between rasterization and Tesseract. Stages, in pipeline order:
+#   grayscale  RGB -> 8-bit gray (also implied by every later stage)
+#   normalize  downscale renders above the target DPI (Tesseract gains nothing past ~300 DPI)
+#   crop       strip dark scanner borders and white margins around the content
+#   deskew     estimate the text-line angle (projection profiles) and rotate it level
+#   binarize   adaptive threshold (local mean, integral images) -> 1-bit
+# The result is handed to Tesseract as an uncompressed PBM/PGM file: a fraction of the bytes of
+# the RGB render and no PNG encode per page. NumPy is optional; without it deskew is skipped and
+# binarize falls back to a global Otsu threshold. Every call returns the geometric transform, so
+# word boxes found on the processed image can be mapped back to the page (to_source()).
+
+import math, os, tempfile, threading, time
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+NUMPY_AVAILABLE = np is not None
+
+PREPROCESS_STAGES = ("grayscale", "normalize", "crop", "deskew", "binarize")
+DEFAULT_PREPROCESS = "grayscale,normalize,crop,deskew,binarize"
+TARGET_DPI = 300
+DESKEW_MAX_ANGLE = 5.0      # degrees; scans are rarely worse, and a wider search finds false maxima
+DESKEW_MIN_ANGLE = 0.1      # below this the rotation costs more than it helps
+DESKEW_SAMPLE_WIDTH = 1000  # the angle is estimated on a reduced copy about this wide
+DESKEW_MAX_POINTS = 200_000
+CROP_MARGIN_INCH = 0.1      # white margin kept around the content (Tesseract wants some)
+BINARIZE_WINDOW_INCH = 0.125
+BINARIZE_T = 0.15           # a pixel is ink when it is this much darker than its neighbourhood
+BINARIZE_BAND_ROWS = 512    # rows per band: bounds the integral-image memory per worker
+BINARIZE_REVISION = 2       # part of stages_signature(): OCR text cached by an older binarize is not reused
+
+# page analysis on low-resolution renders (adaptive OCR)
+ANALYSIS_MARGIN = 0.05      # share of each edge ignored: scanner edges, punch holes, staples
+ANALYSIS_INK_LEVEL = 128    # darker than this counts as ink; bleed-through on blank backs is lighter
+BLANK_MAX_INK = 0.0003      # below this share of ink a page is blank (about ten characters of text)
+SEPARATOR_MIN_INK = 0.5     # mostly dark sheet
+SEPARATOR_MAX_BANDS = 2     # ... or no more than this many bands of ink,
+SEPARATOR_BAND_INCH = (0.6, 2.5)  # each this tall (big print, barcodes, patch codes; taller is a block of text)
+LINE_PITCH_MIN_CORR = 0.3   # autocorrelation peak that counts as regularly spaced lines
+TARGET_PITCH_PX = 50        # OCR DPI is chosen for about this line pitch: 10pt body text -> 300 DPI
+ADAPTIVE_DPI_MIN, ADAPTIVE_DPI_MAX, ADAPTIVE_DPI_STEP = 150, 400, 50
+
+def parse_stages(spec):
+    """"grayscale,deskew" / ["deskew"] / "none" / "" -> tuple of known stages in pipeline order.
+    Raises ValueError on unknown names."""
+    if isinstance(spec, str):
+        spec = [s.strip().lower() for s in spec.split(",") if s.strip()]
+    names = set(spec or ()) - {"none"}
+    unknown = names - set(PREPROCESS_STAGES)
+    if unknown:
+        raise ValueError(f"unknown preprocessing stage(s): {', '.join(sorted(unknown))} "
+                         f"(choose from {', '.join(PREPROCESS_STAGES)} or none)")
+    return tuple(s for s in PREPROCESS_STAGES if s in names)
+
+def stages_signature(stages, target_dpi=TARGET_DPI):
+    """Short id of a preprocessing setup, for OCR cache keys; "" when nothing is done."""
+    if not stages:
+        return ""
+    sig = "+".join(f"bina{BINARIZE_REVISION}" if s == "binarize" else s[:4] for s in stages)
+    return f"{sig}@{target_dpi}" if "normalize" in stages else sig
+
+class StageTimings:
+    """Thread-safe totals of seconds and calls per stage, summed over all OCR workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            n, total = self._totals.get(stage, (0, 0.0))
+            self._totals[stage] = (n + 1, total + seconds)
+
+    def snapshot(self):
+        """{stage: (calls, seconds)}"""
+        with self._lock:
+            return dict(self._totals)
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+stage_timings = StageTimings()
+
+def format_timings(snapshot):
+    """"deskew 2.1s (40 pages), binarize 1.3s (40 pages), ..." slowest first."""
+    parts = sorted(snapshot.items(), key=lambda kv: -kv[1][1])
+    return ", ".join(f"{stage} {secs:.1f}s ({n} pages)" for stage, (n, secs) in parts)
+
+def _image_dpi(img, default):
+    dpi = img.info.get("dpi")
+    if dpi:
+        try:
+            return int(round(float(dpi[0])))
+        except (TypeError, ValueError, IndexError):
+            pass
+    return default
+
+# -- stages ----------------------------------------------------------------------------------------
+
+def _otsu(gray):
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_b = w_b = 0
+    best, best_t = -1.0, 127
+    for t in range(256):
+        w_b += hist[t]
+        if w_b == 0:
+            continue
+        w_f = total - w_b
+        if w_f == 0:
+            break
+        sum_b += t * hist[t]
+        m_b = sum_b / w_b
+        m_f = (sum_all - sum_b) / w_f
+        between = w_b * w_f * (m_b - m_f) ** 2
+        if between > best:
+            best, best_t = between, t
+    return best_t
+
+def _content_box(gray, dpi):
+    """(left, top, right, bottom) of the content with dark scanner borders stripped, or None."""
+    factor = max(1, gray.width // DESKEW_SAMPLE_WIDTH)
+    small = gray.reduce(factor) if factor > 1 else gray
+    w, h = small.size
+    if np is None:
+        box = small.point(lambda v: 255 if v < 160 else 0).getbbox()
+    else:
+        a = np.asarray(small)
+        dark = a < 100
+        # dark borders: edge rows/columns that are mostly black, at most 10% of the page per side
+        top, bottom, left, right = 0, h, 0, w
+        rows, cols = dark.mean(axis=1), dark.mean(axis=0)
+        while top < h // 10 and rows[top] > 0.5:
+            top += 1
+        while bottom > h - h // 10 and rows[bottom - 1] > 0.5:
+            bottom -= 1
+        while left < w // 10 and cols[left] > 0.5:
+            left += 1
+        while right > w - w // 10 and cols[right - 1] > 0.5:
+            right -= 1
+        ink = a[top:bottom, left:right] < 160
+        # a few specks do not count as content
+        ys = np.nonzero(ink.sum(axis=1) > max(1, ink.shape[1] // 500))[0]
+        xs = np.nonzero(ink.sum(axis=0) > max(1, ink.shape[0] // 500))[0]
+        box = None if not len(ys) or not len(xs) else (left + xs[0], top + ys[0], left + xs[-1] + 1, top + ys[-1] + 1)
+    if box is None:
+        return None
+    margin = int(CROP_MARGIN_INCH * dpi)
+    l, t, r, b = (int(v) * factor for v in box)
+    return (max(0, l - margin), max(0, t - margin), min(gray.width, r + factor + margin), min(gray.height, b + factor + margin))
+
+def _skew_angle(gray):
+    """Angle (degrees) of the text lines; 0.0 when it cannot be told (blank page, no NumPy)."""
+    if np is None:
+        return 0.0
+    factor = max(1, gray.width // DESKEW_SAMPLE_WIDTH)
+    small = gray.reduce(factor) if factor > 1 else gray
+    a = np.asarray(small)
+    ys, xs = np.nonzero(a < _otsu(small))
+    if len(ys) < 500:
+        return 0.0
+    if len(ys) > DESKEW_MAX_POINTS:
+        pick = np.random.default_rng(0).choice(len(ys), DESKEW_MAX_POINTS, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32)
+
+    def score(deg):
+        # text lines are y - x*tan(angle) = const: the sharper the row histogram, the better
+        t = math.radians(deg)
+        r = ys * math.cos(t) - xs * math.sin(t)
+        counts = np.bincount((r - r.min()).astype(np.int32))
+        return float(np.dot(counts, counts))
+
+    coarse = np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1e-6, 0.5)
+    best = max(coarse, key=score)
+    fine = np.arange(best - 0.5, best + 0.5 + 1e-6, 0.05)
+    return float(max(fine, key=score))
+
+def _rotation_matrix(w, h, angle):
+    """The affine (output -> input) matrix PIL's rotate(angle, expand=True) uses, same arithmetic."""
+    a = -math.radians(angle)
+    m = [round(math.cos(a), 15), round(math.sin(a), 15), 0.0, round(-math.sin(a), 15), round(math.cos(a), 15), 0.0]
+
+    def apply(x, y):
+        return m[0] * x + m[1] * y + m[2], m[3] * x + m[4] * y + m[5]
+
+    m[2], m[5] = apply(-w / 2.0, -h / 2.0)
+    m[2] += w / 2.0
+    m[5] += h / 2.0
+    corners = [apply(x, y) for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    nw = math.ceil(max(x for x, _ in corners)) - math.floor(min(x for x, _ in corners))
+    nh = math.ceil(max(y for _, y in corners)) - math.floor(min(y for _, y in corners))
+    m[2], m[5] = apply(-(nw - w) / 2.0, -(nh - h) / 2.0)
+    return tuple(m), (nw, nh)
+
+def _binarize(gray, dpi):
+    if np is None:
+        t = _otsu(gray)
+        return gray.point(lambda v: 255 if v > t else 0, "1")
+    a = np.asarray(gray)
+    h, w = a.shape
+    win = max(3, int(BINARIZE_WINDOW_INCH * dpi) | 1)
+    r = win // 2
+    padded = np.pad(a, r, mode="edge")
+    area = float(win * win)
+    out = np.empty((h, w), dtype=bool)
+    for y in range(0, h, BINARIZE_BAND_ROWS):
+        rows = min(BINARIZE_BAND_ROWS, h - y)
+        band = padded[y:y + rows + 2 * r]
+        # integral image of the band: window sums are differences of cumulative sums (exact in int32)
+        cx = np.zeros((band.shape[0], band.shape[1] + 1), dtype=np.int32)
+        np.cumsum(band, axis=1, dtype=np.int32, out=cx[:, 1:])
+        hs = cx[:, win:] - cx[:, :-win]
+        del cx
+        cy = np.zeros((hs.shape[0] + 1, w), dtype=np.int32)
+        np.cumsum(hs, axis=0, out=cy[1:])
+        sums = cy[win:] - cy[:-win]
+        # white where pixel * area > local sum * (1 - t), i.e. not clearly darker than its surroundings
+        out[y:y + rows] = a[y:y + rows] * area > sums * (1.0 - BINARIZE_T)
+    return Image.fromarray(out)
+
+# -- page analysis ---------------------------------------------------------------------------------
+
+def _line_pitch(rows, max_lag):
+    """Baseline-to-baseline distance of the dominant text in a row-ink profile, from its
+    autocorrelation (the first peak after the first dip), or None when the rows are not periodic."""
+    mean = sum(rows) / len(rows)
+    p = [v - mean for v in rows]
+    n = len(p)
+    r0 = sum(v * v for v in p)
+    if not r0:
+        return None
+    best, best_lag, dipped = 0.0, None, False
+    for lag in range(2, min(max_lag, n // 2)):
+        r = sum(p[i] * p[i + lag] for i in range(n - lag)) / r0
+        if not dipped:
+            dipped = r < 0
+        elif r > best:
+            best, best_lag = r, lag
+        elif r < 0 and best_lag:
+            break  # end of the first lobe
+    return best_lag if best >= LINE_PITCH_MIN_CORR else None
+
+def analyze_page(img, dpi):
+    """Ink measurements of a low-resolution render (PIL only; tens of ms at 100 DPI).
+    Returns (ink share, [heights in px of the horizontal bands of ink], line pitch in px or None)."""
+    gray = img.convert("L")
+    mx, my = int(gray.width * ANALYSIS_MARGIN), int(gray.height * ANALYSIS_MARGIN)
+    gray = gray.crop((mx, my, gray.width - mx, gray.height - my))
+    ink = gray.point(lambda v: 255 if v < ANALYSIS_INK_LEVEL else 0)
+    share = ink.histogram()[255] / max(1, ink.width * ink.height)
+    # BOX-resizing to one column gives each row's mean ink
+    rows = list(ink.resize((1, ink.height), Image.Resampling.BOX).getdata())
+    bands = []
+    run = 0
+    for v in rows + [0]:
+        if v > 0:
+            run += 1
+        elif run:
+            if run >= 2:
+                bands.append(run)
+            run = 0
+    inked = [i for i, v in enumerate(rows) if v > 0]
+    pitch = _line_pitch(rows[inked[0]:inked[-1] + 1], dpi) if inked else None
+    return share, bands, pitch
+
+def plan_page(img, dpi, fallback_dpi):
+    """OCR decision for one page from its low-resolution render:
+    ("blank", None), ("separator", None) or ("ocr", chosen_dpi)."""
+    ink, bands, pitch = analyze_page(img, dpi)
+    if ink < BLANK_MAX_INK or not bands:
+        return "blank", None
+    if ink > SEPARATOR_MIN_INK:
+        return "separator", None
+    low, high = SEPARATOR_BAND_INCH
+    if (len(bands) <= SEPARATOR_MAX_BANDS and all(low * dpi <= h <= high * dpi for h in bands)
+            and not (pitch and pitch < low * dpi / 2)):  # a tall band of tight small lines is text
+        return "separator", None
+    if not pitch:
+        # a line or two, or no regular spacing: the bands are single lines, about 0.85 of a pitch
+        pitch = sorted(bands)[len(bands) // 4] / 0.85
+    target = TARGET_PITCH_PX * dpi / pitch
+    chosen = int(round(target / ADAPTIVE_DPI_STEP)) * ADAPTIVE_DPI_STEP
+    return "ocr", max(ADAPTIVE_DPI_MIN, min(ADAPTIVE_DPI_MAX, chosen or fallback_dpi))
+
+# -- pipeline --------------------------------------------------------------------------------------
+
+def preprocess_image(img, stages, dpi=None, target_dpi=TARGET_DPI, timings=stage_timings):
+    """Run the given stages on a rendered page. dpi defaults to img.info["dpi"] (then TARGET_DPI).
+    Returns (image, transform); transform describes the geometry for to_source():
+    {"scale", "crop": (x, y), "affine": 6-tuple or None, "dpi": effective dpi, "angle"}."""
+    dpi = dpi or _image_dpi(img, target_dpi)
+    transform = {"scale": 1.0, "crop": (0, 0), "affine": None, "dpi": dpi, "angle": 0.0}
+    if not stages:
+        return img, transform
+
+    def timed(stage, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        if timings is not None:
+            timings.add(stage, time.perf_counter() - t0)
+        return result
+
+    if img.mode not in ("L", "1"):
+        img = timed("grayscale", img.convert, "L")
+    elif img.mode == "1":
+        img = img.convert("L")
+    if "normalize" in stages and dpi > target_dpi:
+        scale = target_dpi / dpi
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        width = img.width
+        img = timed("normalize", img.resize, size, Image.Resampling.BOX)
+        transform["scale"] = img.width / width
+        transform["dpi"] = dpi = target_dpi
+    if "crop" in stages:
+        box = timed("crop", _content_box, img, dpi)
+        if box and box != (0, 0, img.width, img.height):
+            img = img.crop(box)
+            transform["crop"] = box[:2]
+    if "deskew" in stages:
+        t0 = time.perf_counter()
+        angle = _skew_angle(img)
+        if abs(angle) >= DESKEW_MIN_ANGLE:
+            transform["affine"], _ = _rotation_matrix(img.width, img.height, angle)
+            transform["angle"] = angle
+            img = img.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+        if timings is not None:
+            timings.add("deskew", time.perf_counter() - t0)
+    if "binarize" in stages:
+        img = timed("binarize", _binarize, img, dpi)
+    img.info["dpi"] = (dpi, dpi)
+    return img, transform
+
+def to_source(transform, x, y):
+    """Map a point on the preprocessed image back to the page image it was made from."""
+    if transform["affine"]:
+        a, b, c, d, e, f = transform["affine"]
+        x, y = a * x + b * y + c, d * x + e * y + f
+    x += transform["crop"][0]
+    y += transform["crop"][1]
+    return x / transform["scale"], y / transform["scale"]
+
+def save_for_tesseract(img, folder=None):
+    """Write img in the cheapest format Tesseract reads (PBM for 1-bit, PGM for gray, PPM otherwise;
+    uncompressed, so no encode cost) and return the temp file path. The caller deletes it."""
+    if img.mode == "1":
+        ext = ".pbm"
+    elif img.mode == "L":
+        ext = ".pgm"
+    else:
+        ext = ".ppm"
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    fd, path = tempfile.mkstemp(prefix="ocr_", suffix=ext, dir=folder)
+    with os.fdopen(fd, "wb") as f:
+        img.save(f, format="PPM")
+    return path
@@ -0,0 +1,194 @@
+# search_index.py
+# Persistent full-text index behind "Search across all": SQLite FTS5 under APPDATA_DIR, fed from
+# the embedded text layer and the OCR cache. Updated incrementally: a file is re-read only when its
+# size/mtime change, and re-indexed only when its content hash changes or new OCR text was cached.
+# Greek-aware: text and queries are folded (accents stripped, lower case, final sigma -> sigma)
+# before they reach FTS5, because the unicode61 tokenizer only removes Latin diacritics.
+
+import os, sqlite3, threading, time, unicodedata
+
+from pdf_core import (
+    APPDATA_DIR, is_pdf_bytes, source_key, pdf_content_hash, classify_pages, get_document_cache, get_ocr_cache,
+)
+
+SEARCH_INDEX_PATH = os.path.join(APPDATA_DIR, "search.sqlite")
+SEARCH_CONTEXT_CHARS = 40
+SEARCH_CONTEXTS_PER_PAGE = 3
+SEARCH_UPLOAD_MAX_AGE = 7 * 24 * 3600  # seconds an upload stays searchable after it was last indexed
+
+def fold_text(text: str):
+    """Accent- and case-folded form used for indexing and matching (ά -> α, Ό -> ο, ς -> σ, é -> e)."""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.lower().replace("ς", "σ")
+
+def _fold_with_map(text: str):
+    """fold_text() plus, for every folded character, the index of the original character it came from."""
+    folded = []
+    origin = []
+    for i, c in enumerate(text):
+        f = fold_text(c)
+        folded.append(f)
+        origin.extend([i] * len(f))
+    return "".join(folded), origin
+
+def _fts_query(terms):
+    """One FTS5 phrase per term, OR'ed; a trailing * makes the phrase a prefix query."""
+    parts = []
+    for term in terms:
+        folded = fold_text(term).strip()
+        prefix = folded.endswith("*")
+        folded = folded.rstrip("*").strip()
+        if folded:
+            parts.append('"' + folded.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " OR ".join(parts)
+
+class SearchIndex:
+    """files: one row per input (path or upload) -> content hash; docs/pages: indexed text per content
+    hash (identical files share one copy); pages_fts: folded text, rowid = pages.rowid."""
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                key TEXT PRIMARY KEY, name TEXT, size INTEGER, mtime_ns INTEGER, doc_hash TEXT, seen_at REAL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_doc ON files(doc_hash)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS docs (doc_hash TEXT PRIMARY KEY, n_pages INTEGER, indexed_at REAL)")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS pages (
+                doc_hash TEXT, page_idx INTEGER, source TEXT, text TEXT, UNIQUE (doc_hash, page_idx))""")
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(body, tokenize='unicode61 remove_diacritics 2')")
+
+    def update(self, sources, on_progress=None):
+        """Bring the index up to date for [(name, pdf_src)]. Returns (n_indexed, n_unchanged, errors).
+        on_progress(done, total, name) is called after each file."""
+        ocr_cache = get_ocr_cache()
+        indexed, unchanged, errors = 0, 0, []
+        for n, (name, pdf_src) in enumerate(sources):
+            key = source_key(name, pdf_src)
+            try:
+                if is_pdf_bytes(pdf_src):
+                    size, mtime_ns = len(pdf_src), 0
+                else:
+                    st_ = os.stat(pdf_src)
+                    size, mtime_ns = st_.st_size, st_.st_mtime_ns
+                with self._lock:
+                    row = self._conn.execute("SELECT size, mtime_ns, doc_hash FROM files WHERE key=?", (key,)).fetchone()
+                if row and not is_pdf_bytes(pdf_src) and (row[0], row[1]) == (size, mtime_ns):
+                    doc_hash = row[2]  # unchanged on disk: no need to read it again
+                else:
+                    doc_hash = pdf_content_hash(pdf_src)
+                with self._lock, self._conn:
+                    self._conn.execute("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?)",
+                                       (key, name, size, mtime_ns, doc_hash, time.time()))
+                    doc = self._conn.execute("SELECT indexed_at FROM docs WHERE doc_hash=?", (doc_hash,)).fetchone()
+                if doc is None or ocr_cache.last_write(doc_hash) > doc[0]:
+                    self._index_doc(doc_hash, pdf_src, ocr_cache)
+                    indexed += 1
+                else:
+                    unchanged += 1
+            except Exception as e:
+                errors.append((name, str(e)))
+            if on_progress:
+                on_progress(n + 1, len(sources), name)
+        self.prune()
+        return indexed, unchanged, errors
+
+    def _index_doc(self, doc_hash, pdf_src, ocr_cache):
+        # text layer where it is usable, otherwise the newest cached OCR text, otherwise whatever the layer has
+        n_pages = get_document_cache().page_count(pdf_src)
+        ocr_texts = ocr_cache.latest_pages(doc_hash)
+        rows = []
+        for page_idx, kind, layer_text in classify_pages(pdf_src, range(n_pages)):
+            if kind == "ocr" and page_idx in ocr_texts:
+                rows.append((page_idx, "ocr", ocr_texts[page_idx]))
+            else:
+                rows.append((page_idx, "text", layer_text))
+        indexed_at = time.time()
+        with self._lock, self._conn:
+            self._delete_doc(doc_hash)
+            for page_idx, source, text in rows:
+                if not text.strip():
+                    continue
+                cur = self._conn.execute("INSERT INTO pages (doc_hash, page_idx, source, text) VALUES (?,?,?,?)",
+                                         (doc_hash, page_idx, source, text))
+                self._conn.execute("INSERT INTO pages_fts (rowid, body) VALUES (?, ?)", (cur.lastrowid, fold_text(text)))
+            self._conn.execute("INSERT OR REPLACE INTO docs VALUES (?,?,?)", (doc_hash, n_pages, indexed_at))
+
+    def _delete_doc(self, doc_hash):
+        # caller holds the lock and the transaction
+        self._conn.execute("DELETE FROM pages_fts WHERE rowid IN (SELECT rowid FROM pages WHERE doc_hash=?)", (doc_hash,))
+        self._conn.execute("DELETE FROM pages WHERE doc_hash=?", (doc_hash,))
+        self._conn.execute("DELETE FROM docs WHERE doc_hash=?", (doc_hash,))
+
+    def prune(self):
+        """Forget files that no longer exist on disk, uploads not seen for SEARCH_UPLOAD_MAX_AGE (they
+        have no file to check), and documents no file points to any more."""
+        with self._lock, self._conn:
+            keys = [k for (k,) in self._conn.execute("SELECT key FROM files WHERE key NOT LIKE 'upload:%'")]
+            gone = [(k,) for k in keys if not os.path.exists(k)]
+            self._conn.executemany("DELETE FROM files WHERE key=?", gone)
+            self._conn.execute("DELETE FROM files WHERE key LIKE 'upload:%' AND seen_at < ?",
+                               (time.time() - SEARCH_UPLOAD_MAX_AGE,))
+            orphans = [h for (h,) in self._conn.execute(
+                "SELECT doc_hash FROM docs WHERE doc_hash NOT IN (SELECT doc_hash FROM files)")]
+            for doc_hash in orphans:
+                self._delete_doc(doc_hash)
+
+    def search(self, terms, limit=200):
+        """[(name, key, page_idx, source, hits, contexts)] best matches first; contexts are snippets
+        of the original (unfolded) text around each match."""
+        query = _fts_query(terms)
+        if not query:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT p.doc_hash, p.page_idx, p.source, p.text FROM pages_fts
+                   JOIN pages p ON p.rowid = pages_fts.rowid
+                   WHERE pages_fts MATCH ? ORDER BY rank LIMIT ?""", (query, limit)).fetchall()
+            files = {}
+            for doc_hash in {r[0] for r in rows}:
+                files[doc_hash] = self._conn.execute(
+                    "SELECT name, key FROM files WHERE doc_hash=? ORDER BY name", (doc_hash,)).fetchall()
+        needles = [fold_text(t).strip().rstrip("*").strip() for t in terms]
+        needles = [t for t in needles if t]
+        results = []
+        for doc_hash, page_idx, source, text in rows:
+            hits, contexts = _page_contexts(text, needles)
+            for name, key in files.get(doc_hash, []):
+                results.append((name, key, page_idx, source, hits, contexts))
+        return results
+
+    def stats(self):
+        with self._lock:
+            n_files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            n_pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return n_files, n_pages
+
+def _page_contexts(text, needles):
+    folded, origin = _fold_with_map(text)
+    hits = 0
+    contexts = []
+    for needle in needles:
+        start = folded.find(needle)
+        while start != -1:
+            hits += 1
+            if len(contexts) < SEARCH_CONTEXTS_PER_PAGE:
+                a = origin[start]
+                b = origin[start + len(needle) - 1] + 1
+                s = max(0, a - SEARCH_CONTEXT_CHARS)
+                e = min(len(text), b + SEARCH_CONTEXT_CHARS)
+                contexts.append(text[s:e].replace("\n", " "))
+            start = folded.find(needle, start + len(needle))
+    return hits, contexts
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+def get_search_index():
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None:
+            _search_index = SearchIndex()
+    return _search_index
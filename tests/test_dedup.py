@@ -0,0 +1,86 @@
+import io
+import random
+
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader
+from reportlab.pdfgen import canvas
+
+from dedup import SIMILAR_MAX_BITS, SimilarIndex, dhash, page_fingerprint
+
+
+def make_pdf(labels):
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    for label in labels:
+        c.setFont("Helvetica", 14)
+        c.drawString(72, 700, label)
+        c.showPage()
+    c.save()
+    return PdfReader(io.BytesIO(buf.getvalue()))
+
+
+def fingerprints(reader):
+    memo = {}
+    return [page_fingerprint(page, memo) for page in reader.pages]
+
+
+def test_fingerprint_same_drawing_same_print():
+    a = fingerprints(make_pdf(["cover", "body", "cover"]))
+    b = fingerprints(make_pdf(["other", "cover"]))
+    assert a[0] == a[2] == b[1]
+    assert len({a[0], a[1], b[0]}) == 3
+    assert all(len(p) == 32 for p in a)
+
+
+def test_fingerprint_ignores_page_tree_links():
+    # the same page copied into a differently built file still fingerprints the same
+    reader = make_pdf(["x", "cover"])
+    assert page_fingerprint(reader.pages[1], {}) == fingerprints(make_pdf(["cover"]))[0]
+
+
+def png(draw_fn, rescan=False):
+    img = Image.new("L", (120, 160), 255)
+    draw_fn(ImageDraw.Draw(img))
+    if rescan:  # the same sheet scanned again: other resolution, a little darker
+        img = img.resize((101, 133), Image.BILINEAR).point(lambda v: max(0, v - 12))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def form(d):
+    d.rectangle((10, 10, 110, 40), fill=0)
+    d.rectangle((10, 70, 60, 150), fill=90)
+
+
+def other(d):
+    d.rectangle((60, 90, 115, 155), fill=0)
+    d.ellipse((5, 5, 50, 50), fill=160)
+
+
+def test_dhash_look_alikes_are_close():
+    a, b, c = dhash(png(form)), dhash(png(form, rescan=True)), dhash(png(other))
+    assert bin(a ^ b).count("1") <= SIMILAR_MAX_BITS
+    assert bin(a ^ c).count("1") > SIMILAR_MAX_BITS
+
+
+def test_dhash_blank_page_is_none():
+    assert dhash(png(lambda d: None)) is None
+    assert dhash(png(lambda d: d.point((3, 3), fill=250))) is None
+
+
+def test_similar_index_matches_brute_force():
+    rng = random.Random(3)
+    seen = []
+    index = SimilarIndex()
+    for n in range(2000):
+        if seen and rng.random() < 0.3:
+            value = rng.choice(seen)[0]
+            for _ in range(rng.randrange(8)):
+                value ^= 1 << rng.randrange(64)
+        else:
+            value = rng.getrandbits(64)
+        expected = next((item for v, item in seen if bin(v ^ value).count("1") <= SIMILAR_MAX_BITS), None)
+        assert index.find(value) == expected
+        index.add(value, n)
+        seen.append((value, n))
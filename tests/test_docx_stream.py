@@ -0,0 +1,51 @@
+import os
+
+import pytest
+from docx import Document
+
+from docx_stream import DocxStreamWriter, text_blocks, write_docx
+
+
+def paragraphs(path):
+    return [p.text for p in Document(str(path)).paragraphs]
+
+
+def test_opens_in_python_docx(tmp_path):
+    out = tmp_path / "out.docx"
+    pages = [(0, "first block\nsecond line\n\nnext block"), (1, ""), (2, "Ελληνικό κείμενο")]
+    assert write_docx(iter(pages), str(out), title="Τίτλος", labels={2: "page 3"}) == str(out)
+    doc = Document(str(out))
+    assert doc.core_properties.title == "Τίτλος"
+    texts = [p.text for p in doc.paragraphs if p.text]
+    assert texts == ["Τίτλος", "first block\nsecond line", "next block", "page 3", "Ελληνικό κείμενο"]
+    breaks = [br for p in doc.paragraphs for r in p.runs for br in r._r.br_lst if br.type == "page"]
+    assert len(breaks) == 2  # between three pages
+
+
+def test_xml_special_characters(tmp_path):
+    out = tmp_path / "out.docx"
+    text = 'a < b && c > d "quoted" \'single\' ]]> <w:p/> &amp;'
+    write_docx([(0, text)], str(out), title="<T&C>", labels={0: "<label & co>"})
+    assert [p for p in paragraphs(out) if p] == ["<T&C>", "<label & co>", text]
+
+
+def test_control_characters_are_dropped(tmp_path):
+    out = tmp_path / "out.docx"
+    write_docx([(0, "bell\x07 null\x00 esc\x1b tab\tok\x0c"), (1, "crlf\r\nline\rend￾\ud800")], str(out))
+    assert [p for p in paragraphs(out) if p] == ["bell null esc tab\tok", "crlf\nline\nend"]
+
+
+def test_text_blocks():
+    assert text_blocks("\n\na\nb\n \t\nc\n\n\n\x0c") == ["a\nb", "c"]
+    assert text_blocks("  \n\x0c\n") == []
+
+
+def test_abort_keeps_existing_output(tmp_path):
+    out = tmp_path / "out.docx"
+    out.write_bytes(b"previous")
+    with pytest.raises(RuntimeError):
+        with DocxStreamWriter(str(out)) as writer:
+            writer.add_page("half done")
+            raise RuntimeError("stop")
+    assert out.read_bytes() == b"previous"
+    assert os.listdir(tmp_path) == ["out.docx"]
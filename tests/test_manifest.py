@@ -0,0 +1,36 @@
+from manifest import StabilityTracker
+from pdf_core import FolderPdf
+
+
+def listing(*files):
+    return [FolderPdf(f"/in/{name}.pdf", size, mtime) for name, size, mtime in files]
+
+
+def paths(ready):
+    return [f.path for f in ready]
+
+
+def test_files_handed_out_once_stable():
+    tracker = StabilityTracker()
+    assert tracker.ready(listing(("a", 10, 1))) == []  # first sighting
+    assert tracker.ready(listing(("a", 20, 2))) == []  # still being written
+    assert paths(tracker.ready(listing(("a", 20, 2)))) == ["/in/a.pdf"]
+    assert tracker.ready(listing(("a", 20, 2))) == []  # already handed out
+    tracker.ready(listing(("a", 30, 3)))
+    assert paths(tracker.ready(listing(("a", 30, 3)))) == ["/in/a.pdf"]  # changed: handed out again
+
+
+def test_failed_files_are_retried_a_few_times():
+    tracker = StabilityTracker(max_retries=2)
+    tracker.ready(listing(("a", 10, 1), ("b", 10, 1)))
+    assert paths(tracker.ready(listing(("a", 10, 1), ("b", 10, 1)))) == ["/in/a.pdf", "/in/b.pdf"]
+    handed = []
+    for _ in range(4):
+        tracker.retry(["/in/a.pdf", "/in/unknown.pdf"])
+        handed.append(paths(tracker.ready(listing(("a", 10, 1), ("b", 10, 1)))))
+    assert handed == [["/in/a.pdf"], ["/in/a.pdf"], [], []]
+    # a new version of the file gets its own retries
+    tracker.ready(listing(("a", 11, 2), ("b", 10, 1)))
+    assert paths(tracker.ready(listing(("a", 11, 2), ("b", 10, 1)))) == ["/in/a.pdf"]
+    tracker.retry(["/in/a.pdf"])
+    assert paths(tracker.ready(listing(("a", 11, 2), ("b", 10, 1)))) == ["/in/a.pdf"]
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from pagesel import PageSet, apply_page_ranges, expand_runs, page_runs, parse_page_ranges, runs_spec
+
+
+def test_page_runs_keep_order():
+    runs = page_runs([4, 5, 6, 0, 1, 9])
+    assert runs == [(4, 6), (0, 1), (9, 9)]
+    assert expand_runs(runs) == [4, 5, 6, 0, 1, 9]
+    assert runs_spec(runs) == "5-7,1-2,10"
+
+
+def test_pageset_merges_runs():
+    s = PageSet([(5, 7), (0, 2), (3, 3), (9, 8), (6, 10)])
+    assert s.runs == ((0, 3), (5, 10))
+    assert len(s) == 10
+    assert PageSet.of([3, 1, 2, 2, 7]).runs == ((1, 3), (7, 7))
+    assert not PageSet()
+
+
+def test_pageset_ops_match_python_sets():
+    rng = random.Random(7)
+    for _ in range(200):
+        a = {rng.randrange(60) for _ in range(rng.randrange(40))}
+        b = {rng.randrange(60) for _ in range(rng.randrange(40))}
+        pa, pb = PageSet.of(a), PageSet.of(b)
+        assert list(pa | pb) == sorted(a | b)
+        assert list(pa & pb) == sorted(a & b)
+        assert list(pa - pb) == sorted(a - b)
+        assert all((i in pa) == (i in a) for i in range(-1, 61))
+
+
+def test_spec_round_trip():
+    s = PageSet([(0, 2), (6, 6), (8, 11)])
+    assert s.spec() == "1-3,7,9-12"
+    assert apply_page_ranges(PageSet(), parse_page_ranges(s.spec()), 12) == s
+    assert PageSet().spec() == ""
+
+
+def test_parse_page_ranges():
+    assert parse_page_ranges(" 2, 5 ,3-6,, -4, -7-8 ") == [
+        (2, 2, False), (5, 5, False), (3, 6, False), (4, 4, True), (7, 8, True)]
+    with pytest.raises(ValueError):
+        parse_page_ranges("1-x")
+
+
+def test_apply_page_ranges_in_order_within_bounds():
+    sel = apply_page_ranges(PageSet(), parse_page_ranges("1-10,-3-4,4,8-20,0"), 12)
+    assert list(sel) == [0, 1, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+    assert apply_page_ranges(sel, parse_page_ranges("6-3"), 12) == sel
+    assert apply_page_ranges(sel, parse_page_ranges("-1-12"), 12) == PageSet()
+
+
+def test_apply_page_ranges_does_not_expand():
+    sel = apply_page_ranges(PageSet(), parse_page_ranges("1-5000000,-100"), 5_000_000)
+    assert sel.runs == ((0, 98), (100, 4_999_999))
+    assert 99 not in sel and 4_999_999 in sel
@@ -0,0 +1,81 @@
+import io
+
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from pdf_assemble import assemble_pdf
+
+
+def make_pdf(labels, logo=None):
+    """PDF bytes with one page per label, the label drawn as text; logo (a PIL image) is drawn on every page."""
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    for label in labels:
+        c.setFont("Helvetica", 14)
+        c.drawString(72, 700, label)
+        if logo is not None:
+            c.drawImage(ImageReader(logo), 72, 500, 100, 100)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def page_labels(path):
+    return [page.extract_text().strip() for page in PdfReader(str(path)).pages]
+
+
+def test_page_order_across_sources(tmp_path):
+    a = tmp_path / "a.pdf"
+    a.write_bytes(make_pdf(["a1", "a2", "a3"]))
+    b = make_pdf(["b1", "b2"])  # bytes and paths mix freely
+    out = tmp_path / "out.pdf"
+    n_pages, n_objects, _ = assemble_pdf([(str(a), 2), (b, 0), (str(a), 0), (b, 1), (str(a), 2)], str(out))
+    assert n_pages == 5
+    assert n_objects > 0
+    assert page_labels(out) == ["a3", "b1", "a1", "b2", "a3"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_out_of_range_pages_are_skipped(tmp_path):
+    a = tmp_path / "a.pdf"
+    a.write_bytes(make_pdf(["a1", "a2"]))
+    out = tmp_path / "out.pdf"
+    progress = []
+    n_pages, _, _ = assemble_pdf([(str(a), 5), (str(a), 1), (str(a), -1), (str(a), 0)], str(out),
+                                 on_progress=lambda done, total: progress.append((done, total)))
+    assert n_pages == 2
+    assert page_labels(out) == ["a2", "a1"]
+    assert progress == [(1, 2), (2, 2)]
+
+
+def test_shared_resources_are_written_once(tmp_path):
+    logo = Image.effect_noise((200, 200), 60).convert("RGB")  # noise: does not compress away
+    a, b = make_pdf(["a1", "a2"], logo), make_pdf(["b1"], logo)
+    single = tmp_path / "single.pdf"
+    assemble_pdf([(a, 0)], str(single))
+    out = tmp_path / "out.pdf"
+    n_pages, _, deduped = assemble_pdf([(a, 0), (a, 1), (b, 0)], str(out))
+    assert n_pages == 3
+    assert deduped > 0
+    # the image of three pages is stored once: the output is far smaller than three copies
+    assert out.stat().st_size < 1.5 * single.stat().st_size
+    assert page_labels(out) == ["a1", "a2", "b1"]
+
+
+def test_overlay_is_drawn_on_top(tmp_path):
+    base = make_pdf(["original"])
+    layer = make_pdf(["overlay"])
+    out = tmp_path / "out.pdf"
+    assemble_pdf([(base, 0, (layer, 0)), (base, 0, (layer, 3))], str(out))
+    first, second = page_labels(out)
+    assert "original" in first and "overlay" in first
+    assert second == "original"
+
+
+def test_output_replaces_an_input(tmp_path):
+    a = tmp_path / "a.pdf"
+    a.write_bytes(make_pdf(["a1", "a2"]))
+    assemble_pdf([(str(a), 1), (str(a), 0)], str(a))
+    assert page_labels(a) == ["a2", "a1"]
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+import preprocess as pp
+from preprocess import DEFAULT_PREPROCESS, parse_stages, preprocess_image, save_for_tesseract, to_source
+
+np = pytest.importorskip("numpy")
+
+
+def font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def text_page(width=1700, height=2200, dpi=200, square=None):
+    """A rendered text page: lines of text on white, optionally a solid square at `square` (x, y, side)."""
+    img = Image.new("L", (width, height), 255)
+    d = ImageDraw.Draw(img)
+    f = font(dpi // 6)
+    line = "The quick brown fox jumps over the lazy dog 0123456789"
+    for y in range(dpi, height - dpi, dpi // 3):
+        d.text((dpi, y), line, fill=0, font=f)
+    if square:
+        x, y, side = square
+        d.rectangle((x, y, x + side - 1, y + side - 1), fill=0)
+    img.info["dpi"] = (dpi, dpi)
+    return img
+
+
+def white_share(img):
+    a = np.asarray(img.convert("L"))
+    return float((a > 127).mean())
+
+
+def test_binarize_keeps_white_page_white():
+    page = text_page()
+    out = pp._binarize(page, 200)
+    assert out.mode == "1" and out.size == page.size
+    assert white_share(out) == pytest.approx(white_share(page), abs=0.02)
+    assert white_share(out) < 0.999  # the text is still there
+
+
+def test_default_pipeline_keeps_text_readable():
+    page = text_page()
+    out, transform = preprocess_image(page, parse_stages(DEFAULT_PREPROCESS), timings=None)
+    assert out.mode == "1"
+    assert transform["crop"] != (0, 0)  # white margins removed, so a little less white than the page
+    assert 0.8 < white_share(out) < 0.999
+    assert white_share(out) <= white_share(page)
+
+
+@pytest.mark.parametrize("angle", [-3.0, 1.5, 2.5])
+def test_deskew_recovers_rotation(angle):
+    page = text_page().rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+    assert pp._skew_angle(page) == pytest.approx(-angle, abs=0.15)
+    out, transform = preprocess_image(page, ("grayscale", "deskew"), dpi=200, timings=None)
+    assert transform["angle"] == pytest.approx(-angle, abs=0.15)
+    assert abs(pp._skew_angle(out)) < 0.15
+
+
+def square_centre(img, side):
+    """Centre of the windows side/2 across that are all dark: inside the square, never on text strokes."""
+    k = side // 2
+    dark = (np.asarray(img.convert("L")) < 128).astype(np.int32)
+    sums = np.zeros((dark.shape[0] + 1, dark.shape[1] + 1), dtype=np.int32)
+    sums[1:, 1:] = dark.cumsum(axis=0).cumsum(axis=1)
+    full = sums[k:, k:] - sums[:-k, k:] - sums[k:, :-k] + sums[:-k, :-k] == k * k
+    ys, xs = np.nonzero(full)
+    xs, ys = xs + (k - 1) / 2, ys + (k - 1) / 2
+    assert len(xs)
+    return float(xs.mean()), float(ys.mean())
+
+
+@pytest.mark.parametrize("stages, dpi", [
+    (("grayscale", "crop"), 200),
+    (("grayscale", "normalize", "crop"), 400),
+    (("grayscale", "normalize", "crop", "deskew"), 400),
+])
+def test_to_source_maps_back_to_page(stages, dpi):
+    side = dpi // 2
+    page = text_page(width=int(8.5 * dpi), height=11 * dpi, dpi=dpi, square=(6 * dpi, 9 * dpi, side))
+    page = page.rotate(2.0, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+    page.info["dpi"] = (dpi, dpi)
+    expected = square_centre(page, side)
+    out, transform = preprocess_image(page, stages, target_dpi=200, timings=None)
+    if "normalize" in stages:
+        assert transform["scale"] == pytest.approx(0.5, abs=0.01)
+    assert ("deskew" in stages) == (transform["affine"] is not None)
+    x, y = to_source(transform, *square_centre(out, int(side * transform["scale"])))
+    assert x == pytest.approx(expected[0], abs=3) and y == pytest.approx(expected[1], abs=3)
+
+
+def test_to_source_identity_without_stages():
+    page = text_page()
+    out, transform = preprocess_image(page, (), timings=None)
+    assert out is page
+    assert to_source(transform, 12.5, 40) == (12.5, 40)
+
+
+@pytest.mark.parametrize("mode, ext", [("1", ".pbm"), ("L", ".pgm"), ("RGB", ".ppm"), ("RGBA", ".ppm")])
+def test_save_for_tesseract_formats(tmp_path, mode, ext):
+    img = text_page(400, 300, 100).convert(mode)
+    path = save_for_tesseract(img, folder=str(tmp_path))
+    try:
+        assert path.endswith(ext) and os.path.dirname(path) == str(tmp_path)
+        with Image.open(path) as back:
+            assert back.size == img.size
+            expected = img.convert("RGB") if mode == "RGBA" else img
+            assert back.mode == expected.mode
+            assert back.tobytes() == expected.tobytes()
+    finally:
+        os.remove(path)
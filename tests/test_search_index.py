@@ -0,0 +1,37 @@
+from search_index import _fold_with_map, _fts_query, _page_contexts, fold_text
+
+
+def test_fold_strips_greek_accents_and_case():
+    assert fold_text("Ά Έ Ή Ί Ό Ύ Ώ") == "α ε η ι ο υ ω"
+    assert fold_text("ΐ ΰ Ϊ Ϋ ϊ ϋ") == "ι υ ι υ ι υ"
+    assert fold_text("ΑΘΗΝΑ Αθήνα αθηνα") == "αθηνα αθηνα αθηνα"
+
+
+def test_fold_final_sigma():
+    assert fold_text("Νόμος ΝΟΜΟΣ νομοσ") == "νομοσ νομοσ νομοσ"
+    assert fold_text("ς") == "σ"
+
+
+def test_fold_latin():
+    assert fold_text("Café NAÏVE") == "cafe naive"
+
+
+def test_fold_with_map_points_at_originals():
+    text = "Ο Νόμος"
+    folded, origin = _fold_with_map(text)
+    assert folded == fold_text(text)
+    assert len(origin) == len(folded)
+    assert [text[i] for i in origin] == list(text)
+    assert _fold_with_map("İνάς") == ("iνασ", [0, 1, 2, 3])
+
+
+def test_fts_query_folds_terms():
+    assert _fts_query(["Νόμος", " ΑΘΗΝΑ* ", "", "*", 'say "hi"']) == '"νομοσ" OR "αθηνα"* OR "say ""hi"""'
+
+
+def test_page_contexts_match_accented_text():
+    text = "Ο ΝΟΜΟΣ ορίζει.\nΟ νόμος ισχύει"
+    hits, contexts = _page_contexts(text, [fold_text("νομος")])
+    assert hits == 2
+    assert all("ΝΟΜΟΣ" in c or "νόμος" in c for c in contexts)
+    assert "\n" not in "".join(contexts)
@@ -0,0 +1,32 @@
+import os
+import time
+
+from pdf_core import ThumbnailCache
+
+
+def disk_files(folder):
+    return sorted(name for _, _, names in os.walk(folder) for name in names if name.endswith(".png"))
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), mem_budget=0, max_disk_bytes=10_000)
+    png = b"x" * 1000
+    for page in range(8):
+        cache.put("ab" * 32, page, 100, png)
+    old = time.time() - 3600
+    for page in range(8):  # written an hour ago, in page order
+        os.utime(cache._path("ab" * 32, page, 100), (old + page, old + page))
+    assert cache.get("ab" * 32, 0, 100) == png  # read from disk: now the most recently used
+    for page in range(8, 12):
+        cache.put("cd" * 32, page, 100, png)  # past the 10 KB cap: cut back to 90% of it
+    left = disk_files(tmp_path)
+    assert len(left) == 10
+    assert f"{'ab' * 32}_0_100.png" in left
+    assert [f"{'ab' * 32}_{page}_100.png" in left for page in (1, 2, 3)] == [False, False, True]
+    assert all(f"{'cd' * 32}_{page}_100.png" in left for page in range(8, 12))
+
+
+def test_disk_tier_is_pruned_on_start(tmp_path):
+    ThumbnailCache(str(tmp_path), max_disk_bytes=10**9).put("ef" * 32, 0, 100, b"y" * 5000)
+    ThumbnailCache(str(tmp_path), max_disk_bytes=1000)
+    assert disk_files(tmp_path) == []
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from tiles import plan_tiles, stitch_words
+
+
+def area(box):
+    x0, y0, x1, y1 = box
+    return (x1 - x0) * (y1 - y0)
+
+
+@pytest.mark.parametrize("width, height, max_pixels, overlap", [
+    (2550, 3300, 40_000_000, 150),     # letter page at 300 DPI, fits
+    (9933, 14043, 40_000_000, 150),    # A0 at 300 DPI
+    (2400, 120_000, 10_000_000, 150),  # long receipt
+    (60_000, 1500, 5_000_000, 150),    # wide banner
+    (7000, 7000, 1_000_000, 100),
+])
+def test_plan_tiles_cover_page_within_budget(width, height, max_pixels, overlap):
+    tiles = plan_tiles(width, height, max_pixels, overlap)
+    assert sum(area(core) for _, core in tiles) == width * height
+    for box, core in tiles:
+        assert area(box) <= max_pixels
+        assert box[0] <= core[0] < core[2] <= box[2] and box[1] <= core[1] < core[3] <= box[3]
+        assert 0 <= box[0] and 0 <= box[1] and box[2] <= width and box[3] <= height
+        # inner sides are grown by the overlap, so a word centred in the core is seen whole
+        assert core[1] == 0 or core[1] - box[1] == overlap
+        assert core[3] == height or box[3] - core[3] == overlap
+    # cores are disjoint: with the areas summing to the page, they partition it
+    rng = random.Random(width)
+    for _ in range(500):
+        x, y = rng.randrange(width), rng.randrange(height)
+        assert sum(c[0] <= x < c[2] and c[1] <= y < c[3] for _, c in tiles) == 1
+
+
+def test_plan_tiles_whole_page_when_it_fits():
+    assert plan_tiles(2550, 3300, 40_000_000, 150) == [((0, 0, 2550, 3300), (0, 0, 2550, 3300))]
+
+
+def page_words(width, height, word_w=180, word_h=40, gap=30):
+    """A page of words laid out in lines: [x0, y0, x1, y1, conf, line, text]."""
+    words = []
+    for line, y in enumerate(range(gap, height - word_h, word_h + gap)):
+        for col, x in enumerate(range(gap, width - word_w, word_w + gap)):
+            words.append([x, y, x + word_w, y + word_h, 95, line, f"w{line}.{col}"])
+    return words
+
+
+def read_tiles(words, tiles):
+    """What OCR of each tile gives: the words lying wholly in its box (a cut word is not read)."""
+    out = []
+    for box, core in tiles:
+        seen = [w for w in words if box[0] <= w[0] and box[1] <= w[1] and w[2] <= box[2] and w[3] <= box[3]]
+        lines = {}
+        for w in seen:
+            lines.setdefault(w[5], len(lines))
+        out.append((core, [[*w[:5], lines[w[5]], w[6]] for w in seen]))  # tile-local line numbers
+    return out
+
+
+@pytest.mark.parametrize("width, height, max_pixels", [
+    (3000, 12_000, 6_000_000),   # strips only
+    (12_000, 3000, 2_000_000),   # strips and columns
+])
+def test_stitch_words_keeps_each_word_once(width, height, max_pixels):
+    words = page_words(width, height)
+    tiles = plan_tiles(width, height, max_pixels, 100)
+    assert len(tiles) > 2
+    text, out = stitch_words((width, height), read_tiles(words, tiles))
+    assert out["size"] == [width, height]
+    assert sorted(w[6] for w in out["words"]) == sorted(w[6] for w in words)
+    lines = [line.split() for line in text.splitlines()]
+    expected = {}
+    for w in words:
+        expected.setdefault(w[5], []).append(w[6])
+    assert lines == list(expected.values())
+    # words are renumbered by stitched line
+    assert [w[5] for w in out["words"]] == sorted(w[5] for w in out["words"])
+
+
+def test_stitch_words_empty_page():
+    text, out = stitch_words((100, 100), [((0, 0, 100, 100), [])])
+    assert text == ""
+    assert out["words"] == []
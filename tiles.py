@@ -0,0 +1,82 @@
+# tiles.py
+# Tiled OCR for pages too large to render whole: an A0 drawing or a long receipt at 300 DPI is
+# hundreds of MB as one bitmap, copied again by every preprocessing stage. plan_tiles() cuts the page
+# render into overlapping tiles within a pixel budget; pdf_core renders and OCRs them one at a time
+# (pdftoppm -x/-y/-W/-H), so an OCR worker never holds more than one tile, whatever the page size.
+# Every tile owns a core region, and the cores partition the page: a word is kept from the tile whose
+# core holds its centre, so words in an overlap are kept once, and a word cut at one tile's edge is
+# read whole from the neighbour that owns it. stitch_words() puts the kept words back into lines in
+# reading order, as (text, words) in the same form ocr_words.parse_tsv() gives for a whole page.
+# Nothing here renders or OCRs.
+
+from ocr_words import WORDS_VERSION
+
+TILE_MIN_CORE = 2     # cores at least this many overlaps tall: thinner tiles would be mostly overlap
+TILE_COL_OVERLAP = 3  # columns overlap this many times more: words are much wider than tall
+
+def _cuts(length, parts):
+    return [length * n // parts for n in range(parts + 1)]
+
+def plan_tiles(width, height, max_pixels, overlap):
+    """Tiles for a width x height page render: [(box, core)], both (x0, y0, x1, y1) in page pixels;
+    core is the tile's share of the page, box the part to render (core grown by `overlap` on its inner
+    sides), at most max_pixels. Full-width strips top to bottom; a page too wide for a strip
+    TILE_MIN_CORE overlaps tall is also cut into columns (row by row, left to right), which overlap
+    TILE_COL_OVERLAP times as much (at most a quarter of the tile width)."""
+    min_box_h = min(height, (TILE_MIN_CORE + 2) * overlap)
+    max_box_w = max_pixels // max(1, min_box_h)
+    x_overlap = min(TILE_COL_OVERLAP * overlap, max_box_w // 4)
+    cols = 1 if max_box_w >= width else -(-width // max(1, max_box_w - 2 * x_overlap))
+    xs = _cuts(width, cols)
+    if cols == 1:
+        x_overlap = 0
+    box_w = max(b - a for a, b in zip(xs, xs[1:])) + 2 * x_overlap
+    rows = 1 if box_w * height <= max_pixels else -(-height // max(1, max_pixels // box_w - 2 * overlap))
+    ys = _cuts(height, rows)
+    tiles = []
+    for y0, y1 in zip(ys, ys[1:]):
+        for x0, x1 in zip(xs, xs[1:]):
+            box = (max(0, x0 - x_overlap), max(0, y0 - overlap), min(width, x1 + x_overlap), min(height, y1 + overlap))
+            tiles.append((box, (x0, y0, x1, y1)))
+    return tiles
+
+def stitch_words(size, tiles):
+    """(text, words) for a page of `size` (w, h) pixels from its tiles: [(core, tile_words)] in
+    plan_tiles() order, tile_words as parse_tsv()'s "words" list, already shifted to page pixels.
+    Lines of one strip keep tesseract's order; in a row of several tiles the pieces of a line are
+    joined by height and read left to right. A blank line separates lines that are further apart
+    than a line height, or where reading jumps back up (the next column or block)."""
+    rows = {}  # core (y0, y1) -> [[line words], ...], in tesseract order per tile
+    for (cx0, cy0, cx1, cy1), tile_words in tiles:
+        pieces = {}
+        for word in tile_words:
+            x0, y0, x1, y1 = word[:4]
+            if cx0 <= (x0 + x1) / 2 < cx1 and cy0 <= (y0 + y1) / 2 < cy1:
+                pieces.setdefault(word[5], []).append(word)
+        rows.setdefault((cy0, cy1), []).append(list(pieces.values()))
+    lines = []
+    for row_tiles in rows.values():
+        if len(row_tiles) == 1:
+            lines.extend(row_tiles[0])
+            continue
+        joined = []  # [top, bottom, words]; pieces are joined when the centre of one lies within the other
+        for piece in sorted((p for t in row_tiles for p in t), key=lambda p: sum(w[1] + w[3] for w in p) / len(p)):
+            top, bottom = min(w[1] for w in piece), max(w[3] for w in piece)
+            if joined and joined[-1][0] <= (top + bottom) / 2 <= joined[-1][1]:
+                joined[-1][0], joined[-1][1] = min(joined[-1][0], top), max(joined[-1][1], bottom)
+                joined[-1][2].extend(piece)
+            else:
+                joined.append([top, bottom, list(piece)])
+        lines.extend(sorted(words, key=lambda w: w[0]) for _, _, words in joined)
+    out = []
+    words = []
+    prev = None
+    for n, line in enumerate(lines):
+        top, bottom = min(w[1] for w in line), max(w[3] for w in line)
+        if prev and (top - prev[1] > prev[1] - prev[0] or top < prev[0]):
+            out.append("")
+        out.append(" ".join(w[6] for w in line))
+        words.extend([*w[:5], n, w[6]] for w in line)
+        prev = (top, bottom)
+    text = "\n".join(out) + "\n" if out else ""
+    return text, {"v": WORDS_VERSION, "size": list(size), "words": words}